@@ -0,0 +1,136 @@
+import os
+import numpy as np
+
+# local
+import config
+
+
+# =============================================================================
+# Adaptive search over a glitch parameter grid
+#
+# Each grid point is an arm of a Bernoulli bandit whose reward is "this
+# iteration faulted". Arms are picked by Thompson sampling from Beta
+# posteriors. Faults are clustered in parameter space, so each arm also
+# borrows <smoothing> x the evidence of its direct grid neighbours; this lets
+# a few observed faults pull sampling towards the whole region around them.
+
+class AdaptiveSearch(object):
+    """ Thompson sampler over the points of a parameter grid.
+    """
+    def __init__(self, points, prior=config.ADAPTIVE_PRIOR,
+                 smoothing=config.ADAPTIVE_SMOOTHING, seed=None):
+        # Grid axes spanned by <points> (the points may be a shard of the grid)
+        self.values = [sorted(set(v)) for v in zip(*points)]
+        self.index = [dict([(v, i) for i, v in enumerate(vals)]) for vals in self.values]
+        shape = tuple([len(v) for v in self.values])
+
+        self.prior = prior
+        self.smoothing = smoothing
+        self.rng = np.random.RandomState(seed)
+        self.trials = np.zeros(shape)
+        self.faults = np.zeros(shape)
+        self.crashes = np.zeros(shape)
+        self.valid = np.zeros(shape, dtype=bool)
+        for point in points:
+            self.valid[self._idx(point)] = True
+
+
+    def _idx(self, point):
+        return tuple([self.index[ax][v] for ax, v in enumerate(point)])
+
+
+    def _point(self, idx):
+        return tuple([self.values[ax][i] for ax, i in enumerate(idx)])
+
+
+    def _pooled(self, a):
+        """ <a> plus <smoothing> x the sum of its direct neighbours.
+        """
+        out = a.copy()
+        for ax in xrange(a.ndim):
+            if a.shape[ax] < 2:
+                continue
+            lo = [slice(None)] * a.ndim
+            hi = [slice(None)] * a.ndim
+            lo[ax] = slice(0, -1)
+            hi[ax] = slice(1, None)
+            out[tuple(lo)] += self.smoothing * a[tuple(hi)]
+            out[tuple(hi)] += self.smoothing * a[tuple(lo)]
+        return out
+
+
+    def posterior(self):
+        """ @returns: (alpha, beta) arrays of the Beta posterior of every point.
+        """
+        trials = self._pooled(self.trials)
+        faults = self._pooled(self.faults)
+        return self.prior[0] + faults, self.prior[1] + trials - faults
+
+
+    def choose(self):
+        """ Next point to glitch.
+        """
+        alpha, beta = self.posterior()
+        theta = self.rng.beta(alpha, beta)
+        theta[~self.valid] = -1
+        return self._point(np.unravel_index(np.argmax(theta), theta.shape))
+
+
+    def update(self, point, n, n_faults):
+        """ Record a round at <point> with <n_faults> faulted out of <n>
+            iterations.
+        """
+        idx = self._idx(point)
+        self.trials[idx] += n
+        self.faults[idx] += n_faults
+
+
+    def update_crash(self, point):
+        """ A round that took the phone down, or failed in TZ, yields nothing
+            and costs a recovery: count it as <ADAPTIVE_CRASH_COST> fault-free
+            iterations. Rounds that failed before the glitch are not charged.
+        """
+        idx = self._idx(point)
+        self.crashes[idx] += 1
+        self.trials[idx] += config.ADAPTIVE_CRASH_COST
+
+
+    def seed_from_store(self, path, axes):
+        """ Warm-start from the rows already in a ResultStore, e.g. from an
+            interrupted run.
+
+        @returns:
+            Number of rows used.
+        """
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            return 0
+        from resultstore import load_columns
+        cols = load_columns(path)
+        pts = zip(*[cols[a].tolist() for a in axes])
+        is_fault = (cols['pass'] == 0).tolist()
+        n = 0
+        for point, fault in zip(pts, is_fault):
+            try:
+                idx = self._idx(point)
+            except KeyError:
+                continue
+            self.trials[idx] += 1
+            self.faults[idx] += fault
+            n += 1
+        return n
+
+
+    def top(self, k=10):
+        """ @returns: [(point, posterior mean, trials, faults, crashes)] of the
+                      <k> most productive points.
+        """
+        alpha, beta = self.posterior()
+        mean = alpha / (alpha + beta)
+        mean[~self.valid] = -1
+        order = np.argsort(mean, axis=None)[::-1][:k]
+        out = []
+        for flat in order:
+            idx = np.unravel_index(flat, mean.shape)
+            out.append((self._point(idx), mean[idx], int(self.trials[idx]),
+                        int(self.faults[idx]), int(self.crashes[idx])))
+        return out
@@ -0,0 +1,254 @@
+import time
+import Queue
+import threading
+import subprocess
+
+# local
+import config
+import tracing
+
+
+# =============================================================================
+# Persistent adb shell sessions
+
+class AdbShellSession(object):
+    """ A long-lived root shell on the device, driven through one adb process.
+
+    Each command is framed by a begin and an end marker so that its output and
+    exit status can be recovered from the single stdout stream of the session.
+    The session is transparently re-established if the adb process dies.
+    """
+
+    # Marker printed before/after each framed command
+    MARKER = '__CLK_%s_%d__'
+
+    def __init__(self, adb_proc, device_id, su_cmd='su',
+                 timeout_connect=config.ADB_SESSION_TIMEOUT_CONNECT):
+        self.adb_proc = adb_proc
+        self.device_id = device_id
+        self.su_cmd = su_cmd
+        self.timeout_connect = timeout_connect
+        self.proc = None
+        self.lines = None
+        self.seq = 0
+        self.n_reconnects = 0
+        self.lock = threading.Lock()
+
+
+    def _reader(self, proc, lines):
+        """ Pump lines from the adb process into the queue. A <None> entry
+            marks the end of the stream.
+        """
+        for line in iter(proc.stdout.readline, ''):
+            lines.put(line)
+        lines.put(None)
+
+
+    def _write(self, s):
+        try:
+            self.proc.stdin.write(s)
+            self.proc.stdin.flush()
+        except (IOError, OSError, ValueError):
+            return False
+        return True
+
+
+    def _exec(self, cmd_str, timeout):
+        """ Run one framed command in the current session.
+
+        @returns:
+            (status, output, state) where <state> is one of 'ok', 'timeout',
+            'broken' (session lost before the command started) or 'died'
+            (session lost while the command was running). <status> is None
+            unless the end marker was seen.
+        """
+        self.seq += 1
+        begin = self.MARKER % ('B', self.seq)
+        end = self.MARKER % ('E', self.seq)
+        frame = 'echo %s\n{ %s\n} </dev/null 2>&1\necho %s $?\n' % (begin, cmd_str, end)
+        if not self._write(frame):
+            return None, '', 'broken'
+
+        output = []
+        is_started = False
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None, ''.join(output), 'timeout'
+            try:
+                line = self.lines.get(timeout=remaining)
+            except Queue.Empty:
+                return None, ''.join(output), 'timeout'
+
+            # adb process is gone; keep whatever it printed (e.g. adb errors)
+            if line is None:
+                return None, ''.join(output), ('broken' if not is_started else 'died')
+
+            line = line.replace('\r', '')
+            if not is_started:
+                if line.strip() == begin:
+                    is_started = True
+                    output = []
+                else:
+                    output.append(line)
+                continue
+            if line.startswith(end + ' '):
+                status = line[len(end) + 1:].strip()
+                status = int(status) if status.isdigit() else None
+                return status, ''.join(output), 'ok'
+            output.append(line)
+
+
+    def is_alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+
+    def connect(self):
+        """ (Re-)spawn the adb shell and escalate it to root.
+
+        @returns:
+            (True, '') if the session is usable, else (False, adb output).
+        """
+        self.close()
+        cmd_lst = [self.adb_proc, '-s', self.device_id, 'shell']
+        if self.su_cmd:
+            cmd_lst.append(self.su_cmd)
+        with tracing.span('adb_session_connect', 'adb', cmd=' '.join(cmd_lst)) as args:
+            is_connected, output = self._connect(cmd_lst)
+            args['is_connected'] = is_connected
+        return is_connected, output
+
+
+    def _connect(self, cmd_lst):
+        try:
+            self.proc = subprocess.Popen(cmd_lst,
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT,
+                                         close_fds=True)
+        except OSError as e:
+            self.proc = None
+            return False, str(e)
+        self.lines = Queue.Queue()
+        thrd = threading.Thread(target=self._reader, args=(self.proc, self.lines))
+        thrd.daemon = True
+        thrd.start()
+
+        # Avoid having our own input echoed back by a pty-backed shell
+        self._write('stty -echo 2>/dev/null\n')
+        status, output, state = self._exec('true', self.timeout_connect)
+        if state != 'ok' or status != 0:
+            self.close()
+            return False, output
+        return True, ''
+
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            if self.proc.poll() is None:
+                self.proc.kill()
+            self.proc.wait()
+        except OSError:
+            pass
+        self.proc = None
+        self.lines = None
+
+
+    def execute(self, cmd_str, timeout=config.ADB_SESSION_TIMEOUT):
+        """ Execute a command as root on the device.
+
+        If the session broke before the command started, reconnect and try
+        once more. A timed-out command takes the session down with it, so
+        that nothing is left running in the shell we hand out next.
+
+        @returns:
+            (status, output, is_timeout)
+        """
+        with self.lock:
+            output = ''
+            for _ in xrange(2):
+                if not self.is_alive():
+                    is_connected, output = self.connect()
+                    if not is_connected:
+                        continue
+                    self.n_reconnects += 1
+
+                status, output, state = self._exec(cmd_str, timeout)
+                if state == 'ok':
+                    return status, output, False
+
+                self.close()
+                if state == 'timeout':
+                    return None, output, True
+                if state == 'died':
+                    break
+            return None, output, False
+
+
+
+class AdbSessionPool(object):
+    """ Hand out up to <max_sessions> shell sessions per device so that
+        concurrent callers (e.g. several threads) do not serialize on one.
+    """
+    def __init__(self, max_sessions=config.ADB_SESSION_MAX):
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.idle = {}
+        self.cv = threading.Condition()
+
+
+    def _acquire(self, adb_proc, device_id):
+        key = (adb_proc, device_id)
+        with self.cv:
+            while True:
+                idle = self.idle.setdefault(key, [])
+                if idle:
+                    return idle.pop()
+                sessions = self.sessions.setdefault(key, [])
+                if len(sessions) < self.max_sessions:
+                    session = AdbShellSession(adb_proc, device_id)
+                    sessions.append(session)
+                    return session
+                self.cv.wait()
+
+
+    def _release(self, session):
+        key = (session.adb_proc, session.device_id)
+        with self.cv:
+            self.idle.setdefault(key, []).append(session)
+            self.cv.notify()
+
+
+    def execute(self, adb_proc, device_id, cmd_str, timeout=config.ADB_SESSION_TIMEOUT):
+        session = self._acquire(adb_proc, device_id)
+        try:
+            return session.execute(cmd_str, timeout)
+        finally:
+            self._release(session)
+
+
+    def close(self, device_id=None):
+        """ Drop the sessions of one device (or all of them). Sessions are
+            re-established on their next use.
+        """
+        with self.cv:
+            for (_, dev_id), sessions in self.sessions.iteritems():
+                if device_id is None or dev_id == device_id:
+                    for session in sessions:
+                        with session.lock:
+                            session.close()
+
+
+# Global pool shared by all adb helpers
+SESSIONS = AdbSessionPool()
+
+
+def adb_session_exec(adb_proc, device_id, cmd_str, timeout=config.ADB_SESSION_TIMEOUT):
+    return SESSIONS.execute(adb_proc, device_id, cmd_str, timeout)
+
+
+def adb_session_close(device_id=None):
+    SESSIONS.close(device_id)
@@ -0,0 +1,95 @@
+import os
+import signal
+import threading
+import traceback
+import multiprocessing
+
+
+# =============================================================================
+# Off-hot-path analysis of iteration results
+#
+# Primality tests and bit flip analysis of faulty outputs can hold up the
+# glitch loop for a while. Once started, a pool of worker processes runs them
+# instead: dump_tz_iter_results() logs the raw records first and then submits
+# their analysis. Each analysis is appended, as soon as it is done, to the
+# analysis stream next to the text log, under the first line of its record:
+#
+#   <log>.analysis.txt
+#   0xd0,5,8000,FAIL, 0, 37000, 99000,44000,100000,45000,    ...
+#               PRIME,False
+#               ...
+#
+# Records come in completion order. The workers are processes rather than
+# threads, so that they do not hold the GIL away from the adb threads. The
+# pool must be started before any other thread of the harness.
+
+_pool = None
+_lock = threading.Lock()
+_n_pending = 0
+_n_done = 0
+
+
+def _init_worker():
+    # Ctrl-C is for the harness
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _run(func, args):
+    try:
+        return func(*args)
+    except Exception:
+        return '\t\t\tANALYSIS_ERROR,' + traceback.format_exc().replace('\n', ' ')
+
+
+def start(n_workers):
+    """ Start <n_workers> analysis processes. With 0, analysis stays inline.
+    """
+    global _pool
+    if _pool is not None or n_workers <= 0:
+        return
+    _pool = multiprocessing.Pool(n_workers, _init_worker)
+    print '[+] Analysis: %d workers' % n_workers
+
+
+def is_enabled():
+    return _pool is not None
+
+
+def stream_path(logfn):
+    """ Analysis stream kept next to the text log <logfn>.
+    """
+    return os.path.splitext(logfn)[0] + '.analysis.txt'
+
+
+def submit(fn, header, func, args):
+    """ Have a worker run func(*args), and append its output to <fn> under
+        <header>.
+    """
+    global _n_pending
+    with _lock:
+        _n_pending += 1
+    _pool.apply_async(_run, (func, args), callback=lambda text: _write(fn, header, text))
+
+
+def _write(fn, header, text):
+    global _n_pending, _n_done
+    with _lock:
+        _n_pending -= 1
+        _n_done += 1
+        if text:
+            with open(fn, 'a') as fh:
+                fh.write('%s\n%s\n' % (header, text))
+
+
+def close():
+    """ Wait for the pending analyses and stop the workers.
+    """
+    global _pool
+    if _pool is None:
+        return
+    if _n_pending:
+        print '[+] Analysis: waiting for %d pending records' % _n_pending
+    _pool.close()
+    _pool.join()
+    _pool = None
+    print '[+] Analysis: %d records analyzed' % _n_done
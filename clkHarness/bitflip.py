@@ -0,0 +1,110 @@
+import numpy as np
+from binascii import unhexlify
+
+
+# Original modulus N from the 4th certificate in the chain for widevine update
+# blob. This is the expected output of the rsaauth/glitchexpt workloads.
+MOD_ORIG_HEX = """\
+c44dc735f6682a261a0b8545a62dd13df4c646a5ede482cef858925baa1811fa0284766b3d1d2b4
+d6893df4d9c045efe3e84d8c5d03631b25420f1231d8211e2322eb7eb524da6c1e8fb4c3ae4a8f5
+ca13d1e0591f5c64e8e711b3726215cec59ed0ebc6bb042b917d44528887915fdf764df691d183e
+16f31ba1ed94c84b476e74b488463e85551022021763af35a64ddf105c1530ef3fcf7e54233e5d3
+a4747bbb17328a63e6e3384ac25ee80054bd566855e2eb59a2fd168d3643e44851acf0d118fb03c
+73ebc099b4add59c39367d6c91f498d8d607af2e57cc73e3b5718435a81123f080267726a2a9c1c
+c94b9c6bb6817427b85d8c670f9a53a777511b
+""".replace('\n', '')
+
+# Length of the memcpy workload buffer
+MEMCPY_BUFLEN = 0x1000
+
+# Number of set bits of every byte value
+POPCOUNT8 = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+class Bitflips(object):
+    """ Flipped bytes found in a batch, as parallel arrays (one entry per
+        flipped byte, ordered by row then position).
+    """
+    def __init__(self, n_rows, row, pos, orig, new, mask, lengths, ref_len):
+        self.n_rows = n_rows
+        self.lengths = lengths
+        self.ref_len = ref_len
+        self.row = row
+        self.pos = pos
+        self.orig = orig
+        self.new = new
+        self.mask = mask
+        self.popcount = POPCOUNT8[mask]
+
+    def bits_per_row(self):
+        return np.bincount(self.row, weights=self.popcount, minlength=self.n_rows).astype(int)
+
+    def bytes_per_row(self):
+        return np.bincount(self.row, minlength=self.n_rows)
+
+    def is_short(self):
+        """ Rows with fewer bytes than the reference (e.g. a truncated dump),
+            of which only the first <lengths> bytes were compared.
+        """
+        return self.lengths < self.ref_len
+
+
+class BitflipEngine(object):
+    """ Compare batches of (possibly corrupted) outputs against a reference.
+    """
+    def __init__(self, reference):
+        if isinstance(reference, str):
+            reference = np.frombuffer(reference, dtype=np.uint8)
+        self.ref = np.asarray(reference, dtype=np.uint8)
+
+    def to_batch(self, bufs):
+        """ List of byte strings -> (2-D uint8 array as wide as the reference,
+            number of bytes of each row). Short rows are padded, and their
+            padding is left out by analyze().
+        """
+        batch = np.tile(self.ref, (len(bufs), 1))
+        lengths = np.zeros(len(bufs), dtype=int)
+        for i, b in enumerate(bufs):
+            b = np.frombuffer(b[:len(self.ref)], dtype=np.uint8)
+            batch[i, :len(b)] = b
+            lengths[i] = len(b)
+        return batch, lengths
+
+    def analyze(self, batch, lengths=None):
+        """ Find flipped bytes in a 2-D uint8 array of outputs in one pass.
+            Only the first <lengths> bytes of each row are compared (all of
+            them by default).
+
+        @returns:
+            Bitflips
+        """
+        batch = np.atleast_2d(np.asarray(batch, dtype=np.uint8))
+        n = min(batch.shape[1], len(self.ref))
+        if lengths is None:
+            lengths = np.repeat(n, batch.shape[0])
+        lengths = np.minimum(lengths, n)
+        ref = self.ref[:n]
+        xor = batch[:, :n] ^ ref
+        xor[np.arange(n) >= lengths[:, None]] = 0
+        row, pos = np.nonzero(xor)
+        return Bitflips(batch.shape[0], row, pos, ref[pos], batch[row, pos], xor[row, pos],
+                        lengths, len(self.ref))
+
+
+def render_bitflips(flips, row=0):
+    """ Text rendering of the flips of one row, as written to the logs:
+            BF,<pos>,<orig>,<new>,<xor>,<popcount>
+        followed, for a short row, by
+            SHORT,<bytes compared>,<bytes expected>
+    """
+    sel = flips.row == row
+    cols = [a[sel].tolist() for a in (flips.pos, flips.orig, flips.new, flips.mask, flips.popcount)]
+    lines = ['\t\t\tBF,%d,%x,%x,%x,%d' % v for v in zip(*cols)]
+    if flips.is_short()[row]:
+        lines.append('\t\t\tSHORT,%d,%d' % (flips.lengths[row], flips.ref_len))
+    return '\n'.join(lines)
+
+
+# Engines for the workloads we glitch
+MODULUS_ENGINE = BitflipEngine(unhexlify(MOD_ORIG_HEX))
+MEMCPY_ENGINE = BitflipEngine(np.arange(MEMCPY_BUFLEN) % 256)
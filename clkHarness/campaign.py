@@ -0,0 +1,115 @@
+import copy
+import time
+import threading
+
+# local
+import config
+import tracing
+from enginelib import Engine, unserialize, grid_points, shard_points
+from resultstore import ResultStore
+from journal import SweepJournal
+from timing import PhaseTimer
+
+
+# =============================================================================
+# Concurrent multi-device campaigns
+#
+# The sweep grid of a task is split into one interleaved shard per device, and
+# each device runs its shard in its own thread with its own Engine. Devices
+# only share the campaign result store (rows are tagged with the device id) and
+# the progress journal, so that an interrupted campaign can be resumed with any
+# set of devices.
+#
+# Every device needs its own copies of adb (/usr/bin/<id>adb, <id>kproc) so
+# that killing the kmsg reader of one device leaves the others alone.
+
+class DeviceWorker(threading.Thread):
+    """ Run one shard of a campaign on one device.
+    """
+    def __init__(self, cfg, task_cls, points, store, journal, fresh=False):
+        threading.Thread.__init__(self, name=cfg.DEVICE_ID)
+        self.daemon = True
+        self.cfg = cfg
+        self.task_cls = task_cls
+        self.points = points
+        self.store = store
+        self.journal = journal
+        self.fresh = fresh
+        self.error = None
+        self.elapsed = 0
+        self.timer = None
+
+    def run(self):
+        t_start = time.time()
+        try:
+            engine = Engine(self.cfg)
+            self.timer = engine.timer
+            engine.campaign_store = self.store
+            engine.campaign_journal = self.journal
+            engine.journal_fresh = self.fresh
+            while not engine.reboot():
+                print '[-] %s: Reboot failed. Try again!' % self.cfg.DEVICE_ID
+            with tracing.span(config.TASK_TYPES[self.task_cls.TASK], 'task',
+                              device=self.cfg.DEVICE_ID, points=len(self.points)):
+                self.task_cls(engine, points=self.points).run()
+        except (Exception, SystemExit) as e:
+            # Engine exit()s on some device errors, which must not read as done
+            self.error = e
+            print '[-] ***** %s: shard aborted: %r' % (self.cfg.DEVICE_ID, e)
+        finally:
+            self.elapsed = time.time() - t_start
+
+
+class Campaign(object):
+    """ Sweep the parameter grid of <task_cls> over several devices of the same
+        type (<cfg>) at once.
+    """
+    def __init__(self, cfg, task_cls, device_ids, fresh=False):
+        self.cfg = cfg
+        self.task_cls = task_cls
+        self.device_ids = device_ids
+        self.fresh = fresh
+
+        params = unserialize(copy.deepcopy(getattr(cfg, task_cls.PARAMS)))
+        self.points = grid_points(params, task_cls.AXES)
+        self.modname = params['modname']
+        self.store_fn = '%s/campaign_%s_%s.cols' % \
+            (config.DIR_LOG, config.TASK_TYPES[task_cls.TASK], self.modname)
+        self.journal_fn = '%s/journal_campaign_%s_%s.txt' % \
+            (config.DIR_SESSION, config.TASK_TYPES[task_cls.TASK], self.modname)
+
+    def run(self):
+        store = ResultStore(self.store_fn)
+        journal = SweepJournal(self.journal_fn if config.SWEEP_JOURNAL else None,
+                               fresh=self.fresh)
+        n = len(self.device_ids)
+        print '[+] Campaign: %d points over %d devices' % (len(self.points), n)
+        print '[-]   store: %s' % self.store_fn
+
+        workers = []
+        for k, device_id in enumerate(self.device_ids):
+            points = shard_points(self.points, n, k)
+            print '[-]   %s: %d points' % (device_id, len(points))
+            w = DeviceWorker(config.device_config(self.cfg, device_id),
+                             self.task_cls, points, store, journal, fresh=self.fresh)
+            w.start()
+            workers.append(w)
+
+        # join() with a timeout so that Ctrl-C still reaches the main thread
+        try:
+            for w in workers:
+                while w.is_alive():
+                    w.join(1)
+        finally:
+            store.close()
+            journal.close()
+
+        for w in workers:
+            print '[-]   %s: %s in %.0fs' % \
+                (w.name, 'FAILED (%r)' % w.error if w.error is not None else 'done', w.elapsed)
+        print '[+] Campaign: %d results' % len(store)
+        
+        timers = [w.timer for w in workers if w.timer is not None]
+        if timers:
+            PhaseTimer.merge(timers, 'campaign').report()
+        return all([w.error is None for w in workers])
@@ -1,8 +1,11 @@
+import copy
+
 
 # Device types
 dev_types = [
     ('angler',        0),
-    ('shamu',         1) ]
+    ('shamu',         1),
+    ('sim',           2) ]
 DEV_TYPES = dict([(e[1], e[0]) for e in dev_types] + dev_types)
 
 # Task types
@@ -25,6 +28,127 @@ DIR_REMOTE_TMP = '/data/local/tmp'
 # Error message when insmod fails
 ERR_INSMOD_FAIL = 'Function not implemented'
 
+# Run adb commands through persistent root shell sessions instead of spawning
+# a new "adb shell su -c" process for each command
+ADB_USE_SESSION = True
+
+# Max number of concurrent shell sessions per device
+ADB_SESSION_MAX = 2
+
+# Timeouts (secs) for establishing a session and for a single command
+ADB_SESSION_TIMEOUT_CONNECT = 15
+ADB_SESSION_TIMEOUT = 60
+
+# Apply the prologue commands as one pushed shell script (one round trip)
+# instead of one adb call per command
+PROLOGUE_AS_SCRIPT = True
+
+# Record iteration results into a columnar store (<logfn>.cols) next to the
+# text log. The text log can be turned off for long campaigns.
+RESULT_STORE = True
+RESULT_LOG_TEXT = True
+
+# Number of worker processes analyzing faulty results (primality, bit flips)
+# off the glitch loop, into <logfn>.analysis.txt (see analysis.py). With 0,
+# the analysis is written inline into the text log.
+ANALYSIS_WORKERS = 2
+
+# Journal completed sweep iterations (and the bracket of the pdelay search)
+# under DIR_SESSION so that an interrupted task picks up where it stopped (see
+# journal.py)
+SWEEP_JOURNAL = True
+
+# Adaptive search (see adaptive.py): instead of walking the whole grid, spend
+# ADAPTIVE_BUDGET x (grid size x nb_iter) rounds where faults are observed
+SEARCH_ADAPTIVE = False
+ADAPTIVE_BUDGET = 0.2
+
+# Beta prior of the per-point fault rate (mean 0.2), weight of the neighbours'
+# evidence, and number of fault-free iterations a crashing round counts as
+ADAPTIVE_PRIOR = (1.0, 4.0)
+ADAPTIVE_SMOOTHING = 0.5
+ADAPTIVE_CRASH_COST = 5
+
+# pdelay profiling: min rounds before a probe's confidence interval is
+# trusted, z-score of the intervals, and metric differences not worth resolving
+PDELAY_OPT_MIN_ROUNDS = 2
+PDELAY_OPT_Z = 1.96
+PDELAY_OPT_TOL = 1.0
+
+# Hold the temperature with a PID loop driving dofever (see thermal.py)
+# instead of ramping it up/cooling it down before each iteration. Needs a
+# dofever built with duty cycle support: older builds ignore the duty cycle
+# and heat at full load.
+TEMP_PID = False
+FEVER_DUTY_FN = DIR_REMOTE_TMP + '/dofever.duty'
+
+# (kp, ki, kd) in duty % per milli-degree C (/sec), control period (secs),
+# consecutive in-range readings to be settled, and time to settle (secs)
+TEMP_PID_GAINS = (0.02, 0.002, 0.0)
+TEMP_PID_PERIOD = 1.0
+TEMP_PID_SETTLE = 3
+TEMP_PID_TIMEOUT = 600
+
+# Stream the CPU temperature (and SAMPLER_NODES) in the background over one
+# adb shell, every THERMAL_SAMPLE_PERIOD secs into a ring buffer of
+# THERMAL_RING_SIZE samples. get_temperature() uses the latest sample if it is
+# at most THERMAL_MAX_AGE secs old. The stream is paused during glitch rounds.
+THERMAL_SAMPLER = True
+THERMAL_SAMPLE_PERIOD = 0.2
+THERMAL_RING_SIZE = 3000
+THERMAL_MAX_AGE = 1.0
+
+# Reboot readiness (see Engine.wait_for_boot): give up after BOOT_TIMEOUT secs.
+# Boot properties are polled with a delay doubling from BOOT_POLL_MIN up to
+# BOOT_POLL_MAX secs. Boot times are kept per device under DIR_SESSION as a
+# histogram with BOOT_HIST_BIN secs bins.
+BOOT_TIMEOUT = 240
+BOOT_POLL_MIN = 0.25
+BOOT_POLL_MAX = 4.0
+BOOT_HIST_BIN = 5
+
+# Glitch rounds end when the module prints its END marker on kmsg (see
+# ThreadKproc.wait_run_end), at most KMSG_END_TIMEOUT secs after insmod
+# returned. For modules without END marker, a run is taken as done once no
+# record has arrived for KMSG_QUIET_TIME secs.
+KMSG_END_TIMEOUT = 6.0
+KMSG_QUIET_TIME = 2.0
+
+# Load each glitch module once (PARAM_resident=1) and trigger rounds by
+# writing its parameters and PARAM_trigger under /sys/module/<modname>/
+# instead of running insmod twice per round. Needs modules built with the
+# resident control interface (see faultmin_SD805/main.c).
+GLITCH_RESIDENT = False
+
+# Number of sweep grid points glitched per module load (glitchprof, rsaauth,
+# and glitchexpt per temperature). The points of a batch are passed as the
+# PARAM_gvals, PARAM_gdelays and PARAM_delaypres lists, and their results are
+# told apart by the params echoed in the ITER records. Only modules listed in
+# the BATCH_MODULES of the device take these lists; the others are glitched
+# one point at a time. At most BATCH_MAX, the list size of the modules. Each
+# point beyond the first adds up to GLITCH_BATCH_POINT_SECS to the insmod
+# timeout. 1 disables batching.
+GLITCH_BATCH = 1
+BATCH_MAX = 32
+GLITCH_BATCH_POINT_SECS = 8
+
+# Recovery of failed glitch rounds (see recovery.py): the cheapest action
+# expected to fix a failure is tried first, escalating up to a reboot.
+# RECOVERY_COSTS are the secs assumed for each action until it has been timed
+# on the device, and RECOVERY_ROUND_SECS those of a glitch round until one has
+# run. With RECOVERY_LADDER off, every failed round is followed by a reboot.
+RECOVERY_LADDER = True
+RECOVERY_COSTS = {'retry': 2, 'rmmod': 3, 'prologue': 15, 'rejoin': 60, 'reboot': 90}
+RECOVERY_ROUND_SECS = 15
+
+# Keep per-device counts of the samples logged at each (module, gval, gdur,
+# pdelay, temperature band) across sessions (see samplecache.py), and skip the
+# sweep rounds that earlier sessions already ran, unless the sweep restarts
+# with --fresh. Bands are SAMPLE_TEMP_BAND wide, in the unit of the
+# temperature node.
+SAMPLE_CACHE = True
+SAMPLE_TEMP_BAND = 1000
+
 
 # =============================================================================
 class ConfigNexus6P():
@@ -44,12 +168,6 @@ class ConfigNexus6P():
     # adb so that we selectively pkill the one we need.
     ADB_KPROC = DEVICE_ID + 'kproc'
     
-    # To detect if device is fully booted up, we track the number of processes
-    THRES_ACTIVE_PROC = 409
-    
-    # Time to wait for phone before we start to polling for the liveness
-    INIT_TIME_BEFORE_POLLING = 32
-    
     # Sleep time before initializing commands
     TIME_BEFORE_INIT_CMD = 10
     
@@ -63,6 +181,12 @@ class ConfigNexus6P():
     # Temperature sensor log
     CPU_TEMP_LOG = '/sys/devices/virtual/thermal/thermal_zone0/temp'
     
+    # Nodes streamed by the thermal sampler along with CPU_TEMP_LOG (e.g.
+    # cpufreq or regulator voltage nodes)
+    SAMPLER_NODES = [
+        '/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq',
+        '/sys/devices/system/cpu/cpu4/cpufreq/scaling_cur_freq' ]
+    
     # Commands to check that environment is initialized
     # (cmd, is_output_string, expected_output)
     CHECK_INIT_CMDS = [
@@ -112,6 +236,10 @@ class ConfigNexus6P():
                  'echo 0 > /sys/devices/system/cpu/cpu7/online' ]
         }
     
+    # Glitch modules that take the PARAM_gvals, PARAM_gdelays and
+    # PARAM_delaypres lists (see GLITCH_BATCH)
+    BATCH_MODULES = []
+    
     # Base dummy freq gval
     FREQ_BASE = 0x65
     
@@ -174,12 +302,6 @@ class ConfigNexus6():
     # adb so that we selectively pkill the one we need.
     ADB_KPROC = DEVICE_ID + 'kproc'
     
-    # To detect if device is fully booted up, we track the number of processes
-    THRES_ACTIVE_PROC = 250
-    
-    # Time to wait for phone to get initialized
-    INIT_TIME_BEFORE_POLLING = 15
-    
     # Sleep time before initializing commands
     TIME_BEFORE_INIT_CMD = 3
     
@@ -193,6 +315,12 @@ class ConfigNexus6():
     # Temperature sensor log
     CPU_TEMP_LOG = '/sys/devices/virtual/thermal/thermal_zone0/temp'
     
+    # Nodes streamed by the thermal sampler along with CPU_TEMP_LOG (e.g.
+    # cpufreq or regulator voltage nodes)
+    SAMPLER_NODES = [
+        '/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq',
+        '/sys/devices/system/cpu/cpu2/cpufreq/scaling_cur_freq' ]
+    
     # Prep kernel module. We need this module to prepare the voltages and freq
     # for all the cores before glitching.
     # @TODO: Can be removed and directly integrated into the glitching module
@@ -232,6 +360,10 @@ class ConfigNexus6():
     # Commands to help ramp up temperatures
     CMD_PRE_POST_TEMPERATURE_RAMPUP = {}
     
+    # Glitch modules that take the PARAM_gvals, PARAM_gdelays and
+    # PARAM_delaypres lists (see GLITCH_BATCH)
+    BATCH_MODULES = [ 'glitchmin' ]
+    
     # Base dummy freq gval
     FREQ_BASE = 0x88
     
@@ -335,5 +467,193 @@ class ConfigNexus6():
         }
 
 
+# =============================================================================
+class ConfigSimulated():
+    """ DEVICE: Simulated device (see simdevice.py)
+    """
+    
+    # Device type
+    DEVICE_TYPE = DEV_TYPES['sim']
+    
+    # Device ID
+    DEVICE_ID = 'sim0'
+    
+    # Filename of <adb> tool - for general adb uses
+    ADB_PROC = DEVICE_ID + 'adb'
+    
+    # Filename of <adb> tool - for tracking /proc/kmsg
+    ADB_KPROC = DEVICE_ID + 'kproc'
+    
+    # Sleep time before initializing commands
+    TIME_BEFORE_INIT_CMD = 0
+    
+    # Temperature ranges
+    MIN_TEMP = 36000
+    MAX_TEMP = 38000
+    
+    # Filename of tool to ramp up temperatures
+    FEVER_TOOL = '/data/local/tmp/dofever-sim'
+    
+    # Temperature sensor log
+    CPU_TEMP_LOG = '/sys/devices/virtual/thermal/thermal_zone0/temp'
+    
+    # Nodes streamed by the thermal sampler along with CPU_TEMP_LOG
+    SAMPLER_NODES = [
+        '/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq' ]
+    
+    # Commands to check that environment is initialized
+    # (cmd, is_output_string, expected_output)
+    CHECK_INIT_CMDS = [
+        ('cat /sys/devices/system/cpu/cpu2/online', False, 0),
+        ('cat /sys/devices/system/cpu/cpu4/online', False, 1),
+        ('cat /sys/devices/system/cpu/cpu1/cpufreq/scaling_governor', True, 'userspace'),
+        ('cat /sys/devices/system/cpu/cpu0/cpufreq/scaling_setspeed', False, 1555200),
+        ('cat /sys/module/msm_thermal/core_control/enabled', False, 0), ]
+    
+    # Commands to initialize environment
+    SETUP_PROLOGUE_CMDS_STAGE1 = [
+        'stop thermal-engine',
+        'echo 0 > /sys/module/msm_thermal/core_control/enabled',
+        'echo 0 > /sys/devices/system/cpu/cpu2/online',
+        'echo 0 > /sys/devices/system/cpu/cpu3/online',
+        'echo 1 > /sys/devices/system/cpu/cpu4/online',
+        'echo userspace > /sys/devices/system/cpu/cpu0/cpufreq/scaling_governor',
+        'echo userspace > /sys/devices/system/cpu/cpu1/cpufreq/scaling_governor',
+        'echo 1555200 > /sys/devices/system/cpu/cpu0/cpufreq/scaling_setspeed',
+        'echo 0 > /proc/sys/kernel/randomize_va_space' ]
+    
+    # Commands to help ramp up temperatures
+    CMD_PRE_POST_TEMPERATURE_RAMPUP = {}
+    
+    # Glitch modules that take the PARAM_gvals, PARAM_gdelays and
+    # PARAM_delaypres lists (see GLITCH_BATCH)
+    BATCH_MODULES = [ 'simprof', 'simglitch', 'simrsa', 'simexpt' ]
+    
+    # Base dummy freq gval
+    FREQ_BASE = 0x65
+    
+    # The simulated module picks its workload from its name (prof, rsa, expt)
+    P_PDELAY_PROFILE = {
+        'pdelay':{
+                'BASE': '85000',
+                'END':  '88000',
+                'STEP': '1',
+                'LAST': '1'
+                },
+        'resume':False,
+        'nb_iter':'10',
+        'nb_tries':'5',
+        'modname':'simprof',
+        'logfn': DIR_LOG + '/' + 'pdprof_' + DEVICE_ID + '_'
+        }
+    
+    P_GLITCH_PROFILE = {
+        'gval':{
+                'BASE': '0xc0',
+                'END':  '0xf0',
+                'STEP': '8',
+                'LAST': '0xc0'
+                },
+        'gdur':{
+                'BASE': '5',
+                'END':  '10',
+                'STEP': '5',
+                'LAST': '5'
+                },
+        'pdelay':{
+                'BASE': '85000',
+                'END':  '88000',
+                'STEP': '1000',
+                'LAST': '85000'
+                },
+        'resume':False,
+        'nb_iter':'2',
+        'nb_tries':'2',
+        'modname':'simglitch',
+        'logfn': DIR_LOG + '/' + 'glitch_prof_' + DEVICE_ID + '_'
+        }
+    
+    P_GLITCH_RSA = {
+        'gval':{
+                'BASE': '0xc0',
+                'END':  '0xf0',
+                'STEP': '8',
+                'LAST': '0xc0'
+                },
+        'gdur':{
+                'BASE': '5',
+                'END':  '10',
+                'STEP': '5',
+                'LAST': '5'
+                },
+        'pdelay':{
+                'BASE': '85000',
+                'END':  '88000',
+                'STEP': '1000',
+                'LAST': '85000'
+                },
+        'resume':False,
+        'nb_iter':'2',
+        'nb_tries':'2',
+        'modname':'simrsa',
+        'logfn': DIR_LOG + '/' + 'glitch_rsaauth_' + DEVICE_ID + '_'
+        }
+    
+    P_GLITCH_EXPT = {
+        'temp':{
+                'BASE': '36000',
+                'END':  '36000',
+                'STEP': '1000',
+                'LAST': '36000'
+                },
+        'gval':{
+                'BASE': '0xd0',
+                'END':  '0xd8',
+                'STEP': '8',
+                'LAST': '0xd0'
+                },
+        'gdur':{
+                'BASE': '5',
+                'END':  '5',
+                'STEP': '1',
+                'LAST': '5'
+                },
+        'pdelay':{
+                'BASE': '86000',
+                'END':  '87000',
+                'STEP': '1000',
+                'LAST': '86000'
+                },
+        'resume':False,
+        'nb_iter':'1',
+        'nb_tries':'2',
+        'modname':'simexpt',
+        'logfn': DIR_LOG + '/' + 'glitch_expt_' + DEVICE_ID + '_'
+        }
+
+
 # Configs
-CONFIGS = [ConfigNexus6P, ConfigNexus6]
\ No newline at end of file
+CONFIGS = [ConfigNexus6P, ConfigNexus6, ConfigSimulated]
+
+def device_config(cfg, device_id):
+    """ Copy of the device config <cfg> bound to one physical device. Each
+        device gets its own adb copies (<id>adb, <id>kproc) and log files so
+        that several of them can be driven concurrently.
+    """
+    class DeviceConfig(cfg):
+        pass
+    DeviceConfig.__name__ = '%s_%s' % (cfg.__name__, device_id)
+    DeviceConfig.DEVICE_ID = device_id
+    DeviceConfig.ADB_PROC = device_id + 'adb'
+    DeviceConfig.ADB_KPROC = device_id + 'kproc'
+
+    tag = '_%s_' % cfg.DEVICE_ID
+    for k in dir(cfg):
+        v = getattr(cfg, k)
+        if not k.startswith('P_') or not isinstance(v, dict):
+            continue
+        v = copy.deepcopy(v)
+        if 'logfn' in v:
+            v['logfn'] = v['logfn'].replace(tag, '_%s_' % device_id)
+        setattr(DeviceConfig, k, v)
+    return DeviceConfig
@@ -1,15 +1,35 @@
 import os
+import json
 import time
+import signal
+import hashlib
 import commands
+import functools
+import itertools
 import threading
 import subprocess
 import pyprimes
+from array import array
 import numpy as np
 from binascii import hexlify, unhexlify
+from distutils.spawn import find_executable
 
 # local
 import config
 import utils
+import bitflip
+import tracing
+import analysis
+import adbsession
+from kmsgparser import KmsgParser
+from resultstore import ResultStore
+from journal import SweepJournal
+from adaptive import AdaptiveSearch
+from samplecache import SampleCache
+from thermal import FeverController, ThermalSampler
+from timing import PhaseTimer, timed, ROUND
+from recovery import RecoveryScheduler, FAIL_KMSG, FAIL_ENV, FAIL_TEMP, \
+    FAIL_TIMEOUT, FAIL_INSMOD, FAIL_NORESULT
 
 
 USR_BIN_PATH = '/usr/bin/'
@@ -29,9 +49,62 @@ class Engine(object):
         # Task (will be set when we create a task)
         self.task = None
         
+        # {remote script path: md5 of content} of scripts already on device
+        self.pushed_scripts = {}
+        
+        # Glitch modules loaded in resident mode since the last reboot, and
+        # those that could not be (no PARAM_resident), which keep using insmod
+        self.resident_mods = set()
+        self.resident_failed = set()
+        
+        # {log filename: ResultStore}
+        self.stores = {}
+        
+        # Store shared by all devices of a campaign (see campaign.py)
+        self.campaign_store = None
+        
+        # Sweep progress journal, shared by all devices of a campaign. When
+        # <journal_fresh> is set, previous progress is discarded, and the
+        # samples of earlier sessions are not looked up either.
+        self.campaign_journal = None
+        self.journal_fresh = False
+        
+        # (results, faulted results) of the last do_glitch_one round
+        self.last_round = (0, 0)
+        
+        # Failure class (see recovery.py) and module of the last failed round
+        self.last_failure = None
+        self.last_modname = None
+        
+        # Whether the last do_glitch_one round got as far as the glitch
+        self.last_glitched = False
+        
+        # Boot id of the device since the last reboot() or rejoin()
+        self.boot_id = None
+        
+        # Recovery of failed rounds (see recovery.py)
+        self.recovery = RecoveryScheduler(self)
+        
+        # Samples logged on this device by all sessions (see samplecache.py)
+        self.samples = None
+        if config.SAMPLE_CACHE:
+            self.samples = SampleCache('%s/samples_%s.txt' % (config.DIR_SESSION, cfg.DEVICE_ID),
+                                       config.SAMPLE_TEMP_BAND)
+        
+        # Wall-clock of reboots, prologues and glitch rounds (see timing.py)
+        self.timer = PhaseTimer(cfg.DEVICE_ID)
+        
+        # Temperature controller (see thermal.py), started on first use
+        self.fever = FeverController(self) if config.TEMP_PID else None
+        
+        # Background temperature telemetry (see thermal.py)
+        self.sampler = ThermalSampler(cfg) if config.THERMAL_SAMPLER else None
+        
         # Check if build environment is ready
         if not self._is_ready():
             exit()
+        if self.sampler is not None:
+            self.sampler.start()
     
     
     def _is_ready(self):
@@ -40,17 +113,15 @@ class Engine(object):
         @returns:
             True if all good.
         """
-        if not os.path.exists(USR_BIN_PATH + self.cfg.ADB_PROC):
-            print "[+] ERROR: <%s> tool is not available" % self.cfg.ADB_PROC
-            return False 
-        if not os.path.exists(USR_BIN_PATH + self.cfg.ADB_KPROC):
-            print "[+] ERROR: <%s> tool is not available" % self.cfg.ADB_KPROC
-            return False
+        for tool in (self.cfg.ADB_PROC, self.cfg.ADB_KPROC):
+            if not os.path.exists(USR_BIN_PATH + tool) and not find_executable(tool):
+                print "[+] ERROR: <%s> tool is not available" % tool
+                return False
         return True
     
     
     def _get_adbd_mask(self):
-        os_exec_commands('adb devices')
+        os_exec_commands('%s devices' % self.cfg.ADB_PROC)
         time.sleep(2)
         pid = self.run_adb_and_get_output('pgrep adbd')
         s = self.run_adb_and_get_output('taskset -ap %d' % pid, is_output_string=True)
@@ -60,9 +131,10 @@ class Engine(object):
     
     def _init_adbd_mask(self):
         pid, adbd_mask = self._get_adbd_mask()
-        adb_exec_cmd_one(self.cfg.DEVICE_ID, 'taskset -ap 1 %s' % pid)
+        adb_exec_cmd_one(self.cfg.DEVICE_ID, 'taskset -ap 1 %s' % pid, self.cfg.ADB_PROC)
     
     
+    @timed('reboot')
     def reboot(self):
         """ Reboot phone and prepare glitching environment for phone.
         
@@ -72,9 +144,14 @@ class Engine(object):
             True if reboot process is successful.
         """
         print "[+] Rebooting DEVICE ID: %s" % (self.cfg.DEVICE_ID)
+        adbsession.adb_session_close(self.cfg.DEVICE_ID)
+        self.resident_mods.clear()
+        if self.fever is not None:
+            self.fever.reset()
         is_reboot_success = False
         while not is_reboot_success:
-            time.sleep(2)
+            boot_id = self.get_boot_id()
+            t_reboot = time.time()
             is_timeout = True
             status = 256
             n_fb_reboot = 0
@@ -82,7 +159,6 @@ class Engine(object):
                 n_fb_reboot += 1
                 status, output, is_timeout = \
                     ThreadExecCmd('%s -s %s reboot' % (self.cfg.ADB_PROC, self.cfg.DEVICE_ID)).run()
-                time.sleep(5)
                 
                 if is_timeout or (status == 256):
                     print '[-]   adb reboot failed. n=%d' % n_fb_reboot
@@ -94,17 +170,11 @@ class Engine(object):
                         exit()
             
             print '[+] Polling device to determine if it is live'
-            time.sleep(self.cfg.INIT_TIME_BEFORE_POLLING)
-            n = 0
-            nproc = self.run_adb_and_get_output('ps | wc -l')
-            
-            while nproc < self.cfg.THRES_ACTIVE_PROC and n < 20:
-                time.sleep(2)
-                nproc = self.run_adb_and_get_output('ps | wc -l')
-                n += 1
-            if n == 20:
-                print "[-]   Polling for reboot timeout. nproc=%d, n=%d" % (nproc, n)
+            if not self.wait_for_boot(boot_id):
+                print "[-]   Polling for reboot timeout."
                 return False
+            record_boot_time(self.cfg.DEVICE_ID, time.time() - t_reboot)
+            self.boot_id = self.get_boot_id()
             
             is_reboot_success = True
             
@@ -113,13 +183,125 @@ class Engine(object):
                 if not self.do_shamu_preboot():
                     is_reboot_success = False
         
+        self.setup_prologue_stage(delay=0.5)
+        return True
+    
+    
+    @timed('rejoin')
+    def rejoin(self):
+        """ Wait for a device that restarted on its own (e.g. crashed by a
+            glitch) to come back, and prepare its glitching environment,
+            instead of rebooting it once more.
+        
+        @returns:
+            True if the device is back and ready.
+        """
+        print "[+] Waiting for DEVICE ID: %s to come back" % (self.cfg.DEVICE_ID)
+        adbsession.adb_session_close(self.cfg.DEVICE_ID)
+        self.resident_mods.clear()
+        if self.fever is not None:
+            self.fever.reset()
+        if not self.wait_for_boot(self.boot_id):
+            print "[-]   Polling for restart timeout."
+            return False
+        self.boot_id = self.get_boot_id()
+        
+        # Something extra for Nexus 6 (shamu)
+        if self.cfg.DEVICE_TYPE == config.DEV_TYPES['shamu']:
+            if not self.do_shamu_preboot():
+                return False
         
-        time.sleep(self.cfg.INIT_TIME_BEFORE_POLLING)
         self.setup_prologue_stage(delay=0.5)
-        time.sleep(4)
         return True
     
     
+    def has_restarted(self):
+        """ Whether the device restarted, or cannot be reached, since the last
+            reboot() or rejoin().
+        """
+        if self.boot_id is None:
+            return False
+        return self.get_boot_id() != self.boot_id
+    
+    
+    def recover(self):
+        """ Bring the device back after a failed round (see recovery.py).
+        """
+        return self.recovery.recover(self.last_failure, self.last_modname)
+    
+    
+    def _adb_shell_user(self, cmd_str, timeout=10):
+        """ Run <cmd_str> in a plain (non-root) adb shell, which is available
+            early during boot.
+        
+        @returns:
+            Output, or None if the device could not be reached.
+        """
+        status, output, is_timeout = ThreadExecCmd("%s -s %s shell '%s'" % \
+            (self.cfg.ADB_PROC, self.cfg.DEVICE_ID, cmd_str), timeout).run()
+        if is_timeout or status != 0 or output is None:
+            return None
+        return output.strip()
+    
+    
+    def get_boot_id(self):
+        """ Random id the kernel picks at each boot, or None if unavailable.
+        """
+        return self._adb_shell_user('cat /proc/sys/kernel/random/boot_id')
+    
+    
+    def wait_for_boot(self, boot_id_prev, timeout=config.BOOT_TIMEOUT):
+        """ Wait until the device is back from a reboot: adb is up, the new
+            boot (<boot_id_prev> has changed) is completed, and root commands
+            work. Without <boot_id_prev>, the device must first be seen down
+            (unreachable, or boot not completed). Polls with exponential
+            backoff.
+        
+        @returns:
+            True if the device is ready before <timeout> secs.
+        """
+        deadline = time.time() + timeout
+        delay = config.BOOT_POLL_MIN
+        stage = 'device' if boot_id_prev is not None else 'down'
+        while time.time() < deadline:
+            if stage == 'down':
+                output = self._adb_shell_user('getprop sys.boot_completed')
+                if output != '1':
+                    print '[-]   Device is down'
+                    stage = 'device'
+                    delay = config.BOOT_POLL_MIN
+                    continue
+            
+            elif stage == 'device':
+                _, _, is_timeout = ThreadExecCmd('%s -s %s wait-for-device' % \
+                    (self.cfg.ADB_PROC, self.cfg.DEVICE_ID),
+                    timeout=max(1, deadline - time.time())).run()
+                if not is_timeout:
+                    stage = 'boot'
+                    continue
+            
+            elif stage == 'boot':
+                output = self._adb_shell_user('echo $(getprop sys.boot_completed),'
+                                              '$(getprop init.svc.bootanim),'
+                                              '$(cat /proc/sys/kernel/random/boot_id)')
+                vals = output.split(',') if output else []
+                if len(vals) == 3 and vals[0] == '1' and vals[1] != 'running' and \
+                   vals[2] != boot_id_prev:
+                    print '[-]   Boot completed'
+                    stage = 'root'
+                    delay = config.BOOT_POLL_MIN
+                    continue
+            
+            elif stage == 'root':
+                output = self.run_adb_and_get_output('id', is_output_string=True)
+                if output and 'uid=0' in output:
+                    return True
+            
+            time.sleep(delay)
+            delay = min(delay * 2, config.BOOT_POLL_MAX)
+        return False
+    
+    
     def do_shamu_preboot(self):
         """ Specific to Nexus 6 shamu -- Need to load a prep driver.
         """
@@ -131,7 +313,8 @@ class Engine(object):
             n_tries = 0
             while not self.is_mod_loaded(modname) and n_tries < 5:
                 print '[-]   Trying to load module -- n_tries:%d' % n_tries
-                adb_exec_cmd_one(self.cfg.DEVICE_ID, 'insmod %s/%s.ko' % (config.DIR_REMOTE_TMP, modname))
+                adb_exec_cmd_one(self.cfg.DEVICE_ID, 'insmod %s/%s.ko' % (config.DIR_REMOTE_TMP, modname),
+                                 self.cfg.ADB_PROC)
                 time.sleep(5)
                 n_tries += 1
             print '[-]   Module (%s) loaded: %d' % (modname, self.is_mod_loaded(modname))
@@ -151,8 +334,37 @@ class Engine(object):
         return output
     
     
-    def is_env_initialized_stage(self):
+    def get_env_snapshot(self):
+        """ Read the adbd affinity and every CHECK_INIT_CMDS value in a single
+            on-device script invocation. As in _init_adbd_mask(), adbd is
+            pinned to core 0 before its affinity is read back.
+        
+        @returns:
+            EnvSnapshot compared against the device config.
+        """
+        script = ['pid=$(pgrep adbd)',
+                  'taskset -ap 1 $pid >/dev/null 2>&1',
+                  'echo %sPID; echo $pid' % EnvSnapshot.TAG,
+                  'echo %sMASK; taskset -ap $pid' % EnvSnapshot.TAG]
+        for i, (c, _, _) in enumerate(self.cfg.CHECK_INIT_CMDS):
+            script.append('echo %s%d; %s' % (EnvSnapshot.TAG, i, c))
+        _, output = adb_exec_script(self.cfg.DEVICE_ID, script, self.cfg.ADB_PROC)
+        return EnvSnapshot(output, self.cfg.CHECK_INIT_CMDS)
+    
+    
+    @timed('env_check')
+    def is_env_initialized_stage(self, is_batched=True):
         print '[+] PROLOGUE: Checking if environment is initialized:'
+        if is_batched:
+            snapshot = self.get_env_snapshot()
+            print '[-]   - ENV: adbd_mask: %s' % snapshot.adbd_mask
+            for i, (c, _, _) in enumerate(self.cfg.CHECK_INIT_CMDS):
+                print '[-]   - ENV[%d] (%s): %s' % (i, c, str(snapshot.values[i]))
+            if not snapshot.is_initialized():
+                return False
+            print '[-]   Environment is initialized.'
+            return True
+        
         self._init_adbd_mask()
         pid, adbd_mask = self._get_adbd_mask()
         print '[-]   - ENV: adbd_mask: %s' % adbd_mask
@@ -170,8 +382,47 @@ class Engine(object):
         return True
     
     
-    def setup_prologue_stage(self, delay):
+    def run_cmd_script(self, name, cmd_lst):
+        """ Execute a list of commands as one shell script on the device.
+        
+        The script is only pushed when its content differs from what was last
+        pushed, so that repeated runs cost a single round trip.
+        
+        @returns:
+            List of (cmd, status) for each command. <status> is None if the
+            command was never reached.
+        """
+        script = compile_cmd_script(cmd_lst)
+        digest = hashlib.md5(script).hexdigest()
+        remote_fn = '%s/clk_%s.sh' % (config.DIR_REMOTE_TMP, name)
+        
+        for _ in xrange(2):
+            if self.pushed_scripts.get(remote_fn) != digest:
+                utils.ensure_dir(config.DIR_SESSION)
+                local_fn = os.path.join(config.DIR_SESSION, 'clk_%s_%s.sh' % (name, self.cfg.DEVICE_ID))
+                with open(local_fn, 'w') as fh:
+                    fh.write(script)
+                if not adb_push_file(self.cfg.DEVICE_ID, local_fn, remote_fn, self.cfg.ADB_PROC):
+                    continue
+                self.pushed_scripts[remote_fn] = digest
+            
+            _, output = adb_exec_cmd_one(self.cfg.DEVICE_ID, 'sh %s' % remote_fn, self.cfg.ADB_PROC)
+            statuses = parse_cmd_script_status(output, cmd_lst)
+            
+            # Script vanished from the device (e.g. wiped): push it again
+            if statuses and statuses[0][1] is None:
+                del self.pushed_scripts[remote_fn]
+                continue
+            return statuses
+        return [(c, None) for c in cmd_lst]
+    
+    
+    @timed('prologue')
+    def setup_prologue_stage(self, delay, is_script=config.PROLOGUE_AS_SCRIPT):
         """ NOTE: Ensure that SuperSu binary is run as daemon.
+        
+        In script mode, <delay> is not applied between commands; only the
+        explicit "sleep" lines of the prologue are.
         """
         if self.is_env_initialized_stage():
             return
@@ -180,7 +431,13 @@ class Engine(object):
         tries = 0
         while not self.is_env_initialized_stage():
             print '[-]   Environment NOT initialized. Configuring...'
-            adb_exec_cmd_many(self.cfg.SETUP_PROLOGUE_CMDS_STAGE1, delay, self.cfg.ADB_PROC, self.cfg.DEVICE_ID)
+            if is_script:
+                statuses = self.run_cmd_script('prologue', self.cfg.SETUP_PROLOGUE_CMDS_STAGE1)
+                for i, (c, status) in enumerate(statuses):
+                    if status != 0:
+                        print '[-]   ERROR: prologue[%d] failed (status=%s): %s' % (i, str(status), c)
+            else:
+                adb_exec_cmd_many(self.cfg.SETUP_PROLOGUE_CMDS_STAGE1, delay, self.cfg.ADB_PROC, self.cfg.DEVICE_ID)
             time.sleep(1)
             self._init_adbd_mask()
             time.sleep(1)
@@ -195,31 +452,152 @@ class Engine(object):
         print '[-]   PROLOGUE STAGE completed'
     
     
+    def get_result_store(self, logfn):
+        """ Columnar result store kept alongside the text log <logfn>.
+        """
+        if not config.RESULT_STORE:
+            return None
+        if self.campaign_store is not None:
+            return self.campaign_store
+        if logfn not in self.stores:
+            self.stores[logfn] = ResultStore(os.path.splitext(logfn)[0] + '.cols')
+        return self.stores[logfn]
+    
+    
+    def get_journal(self, task, modname):
+        """ Progress journal of a sweep task on this device.
+        """
+        if self.campaign_journal is not None:
+            return self.campaign_journal
+        if not config.SWEEP_JOURNAL:
+            return SweepJournal()
+        fn = '%s/journal_%s_%s_%s.txt' % \
+            (config.DIR_SESSION, config.TASK_TYPES[task], modname, self.cfg.DEVICE_ID)
+        return SweepJournal(fn, fresh=self.journal_fresh)
+    
+    
     def is_mod_loaded(self, mod_name):
-        _, output = adb_exec_cmd_one(self.cfg.DEVICE_ID, 'lsmod | grep %s' % mod_name)
+        _, output = adb_exec_cmd_one(self.cfg.DEVICE_ID, 'lsmod | grep %s' % mod_name, self.cfg.ADB_PROC)
         return mod_name in output
     
     
+    def unload_module(self, mod_name):
+        """ rmmod <mod_name>, which a timed out or failed round may have left
+            loaded.
+        
+        @returns:
+            True if the module is no longer loaded.
+        """
+        self.resident_mods.discard(mod_name)
+        adb_exec_cmd_one(self.cfg.DEVICE_ID, 'rmmod %s' % mod_name, self.cfg.ADB_PROC)
+        return not self.is_mod_loaded(mod_name)
+    
+    
+    def get_temp_range(self, min_temp=None):
+        """ Temperature range [min, max] of a glitch round.
+        """
+        if min_temp is not None:
+            return min_temp, min_temp + 1000
+        return self.cfg.MIN_TEMP, self.cfg.MAX_TEMP
+    
+    
+    def get_cached_samples(self, modname, point, min_temp=None):
+        """ [rounds, samples, faults] logged at <point> by all sessions on this
+            device, in the temperature range of the round. Nothing when the
+            sweep restarts fresh.
+        """
+        if self.samples is None or self.journal_fresh:
+            return [0, 0, 0]
+        temp_min, temp_max = self.get_temp_range(min_temp)
+        return self.samples.get(modname, point, temp_min, temp_max)
+    
+    
     def create_kproc_sess(self, modname):
         return ThreadKproc(modname, self.cfg.ADB_KPROC, self.cfg.DEVICE_ID, self.task)
     
     
+    def load_resident(self, mod_name):
+        """ Load <mod_name> in resident mode, if not done since last reboot.
+            A module that fails to load once is not tried again.
+        
+        @returns:
+            True if the module is loaded.
+        """
+        if mod_name in self.resident_mods:
+            return True
+        if mod_name in self.resident_failed:
+            return False
+        adb_exec_cmd_one(self.cfg.DEVICE_ID, 'rmmod %s' % mod_name, self.cfg.ADB_PROC)
+        adb_exec_cmd_one(self.cfg.DEVICE_ID, 'insmod %s/%s.ko PARAM_resident=1' % \
+                         (config.DIR_REMOTE_TMP, mod_name), self.cfg.ADB_PROC)
+        if not self.is_mod_loaded(mod_name):
+            print '[-]   ERROR: Cannot load module (%s) in resident mode. Using insmod.' % mod_name
+            self.resident_failed.add(mod_name)
+            return False
+        print '[-]   Module (%s) loaded in resident mode' % mod_name
+        self.resident_mods.add(mod_name)
+        return True
+    
+    
+    def batch_size(self, mod_name):
+        """ Number of points to glitch per load of <mod_name>: GLITCH_BATCH,
+            if the module takes the list params (BATCH_MODULES).
+        """
+        if config.GLITCH_BATCH <= 1:
+            return 1
+        if mod_name not in self.cfg.BATCH_MODULES:
+            print '[-]   WARNING: Module (%s) takes no list params. Not batching.' % mod_name
+            return 1
+        return min(config.GLITCH_BATCH, config.BATCH_MAX)
+    
+    
     def exec_glitch_one_iter(self, gval, gdur, pdelay, mod_name, temperature=0):
         """ Execute our glitching module.
         """
-        cmd_str = "taskset 1 /system/bin/insmod %s/%s.ko PARAM_gval=0x%x PARAM_gdelay=%d PARAM_delaypre=%d PARAM_temp=%d" % \
-            (config.DIR_REMOTE_TMP, mod_name, gval, gdur, pdelay, temperature)
-        return ThreadAdbCmd(self.cfg.ADB_PROC, self.cfg.DEVICE_ID, cmd_str, timeout=25)
+        return self.exec_glitch_batch([(gval, gdur, pdelay)], mod_name, temperature)
+    
+    
+    def exec_glitch_batch(self, points, mod_name, temperature=0):
+        """ Execute our glitching module once for a list of (gval, gdur,
+            pdelay) points, passed as the PARAM_gvals/PARAM_gdelays/
+            PARAM_delaypres lists. In resident mode, the parameters of the
+            loaded module are updated and a run is triggered instead.
+        """
+        timeout = 25 + config.GLITCH_BATCH_POINT_SECS * (len(points) - 1)
+        gvals, gdurs, pdelays = [','.join(l) for l in
+                                 zip(*[('0x%x' % g, str(d), str(p)) for g, d, p in points])]
+        if config.GLITCH_RESIDENT and self.load_resident(mod_name):
+            cmd_str = "cd /sys/module/%s/parameters && echo %s > PARAM_gvals && echo %s > PARAM_gdelays && " \
+                      "echo %s > PARAM_delaypres && echo %d > PARAM_temp && taskset 1 sh -c 'echo 1 > PARAM_trigger'" % \
+                (mod_name, gvals, gdurs, pdelays, temperature)
+            return ThreadAdbCmd(self.cfg.ADB_PROC, self.cfg.DEVICE_ID, cmd_str, timeout=timeout)
+        
+        # Single points keep the scalar params, which all modules take
+        if len(points) == 1:
+            cmd_str = "taskset 1 /system/bin/insmod %s/%s.ko PARAM_gval=%s PARAM_gdelay=%s PARAM_delaypre=%s PARAM_temp=%d" % \
+                (config.DIR_REMOTE_TMP, mod_name, gvals, gdurs, pdelays, temperature)
+        else:
+            cmd_str = "taskset 1 /system/bin/insmod %s/%s.ko PARAM_gvals=%s PARAM_gdelays=%s PARAM_delaypres=%s PARAM_temp=%d" % \
+                (config.DIR_REMOTE_TMP, mod_name, gvals, gdurs, pdelays, temperature)
+        return ThreadAdbCmd(self.cfg.ADB_PROC, self.cfg.DEVICE_ID, cmd_str, timeout=timeout)
     
     
+    @timed('temperature')
     def regulate_temperature(self, min_temp, max_temp, sleep_time=5):
-        """ @TODO: To implement
-            - need to compile ubench for new phone
+        """ Bring the temperature into [min_temp, max_temp], then stop heating
+            so that the glitch round runs undisturbed.
         """
+        if self.fever is not None:
+            if not self.fever.hold(min_temp, max_temp):
+                return False
+            self.fever.pause()
+            print '[-]   Temperature in required range. Continuing.'
+            return True
+        
         curr_temp = self.get_temperature()
         
         # Kill all remnants of the tool first
-        adb_exec_cmd_one(self.cfg.DEVICE_ID, 'pkill -9 -f %s' %  self.cfg.FEVER_TOOL)
+        adb_exec_cmd_one(self.cfg.DEVICE_ID, 'pkill -9 -f %s' %  self.cfg.FEVER_TOOL, self.cfg.ADB_PROC)
         time.sleep(1)
         
         # Temperature too low
@@ -246,13 +624,26 @@ class Engine(object):
                 print '[-]       Cooling down temperature: curr_temp=%d' % curr_temp
         
         # Just in case
-        adb_exec_cmd_one(self.cfg.DEVICE_ID, 'pkill -9 -f %s' %  self.cfg.FEVER_TOOL)
+        adb_exec_cmd_one(self.cfg.DEVICE_ID, 'pkill -9 -f %s' %  self.cfg.FEVER_TOOL, self.cfg.ADB_PROC)
         print '[-]   Temperature in required range. Continuing.'
         
         return True
     
     
+    def report_timing(self):
+        """ Print the per-phase timing breakdown of this device, and keep it
+            under DIR_SESSION.
+        """
+        self.timer.report()
+        utils.ensure_dir(config.DIR_SESSION)
+        self.timer.save('%s/timing_%s.json' % (config.DIR_SESSION, self.cfg.DEVICE_ID))
+    
+    
     def get_temperature(self):
+        if self.sampler is not None:
+            temp = self.sampler.latest()
+            if temp is not None:
+                return temp
         temp = self.run_adb_and_get_output('cat %s' % self.cfg.CPU_TEMP_LOG)
         temp = 0 if temp is None else temp
         return temp
@@ -263,7 +654,49 @@ class Engine(object):
             Returns (1) if glitching round proceeded with any hitch
                     (2) if slave thread TZ invocation failed
         """
+        success, istzfail, counts = self.do_glitch_batch(modname, [(gval, gdur, pdelay)], logfn,
+                                                         is_check_fever, min_temp)
+        return success, istzfail, counts[0]
+    
+    
+    def _dump_batch(self, logfn, thread_kproc, points):
+        """ Dump the results of a round over <points>, each under the params
+            echoed by its ITER record.
+            @returns: ([number of results of each point], is_failtz,
+                       {point: [TzIterationResult]})
+        """
+        if len(points) == 1:
+            groups = {points[0]: thread_kproc.iter_results}
+        else:
+            groups = split_iter_results(thread_kproc.iter_results)
+            n_stray = sum([len(v) for k, v in groups.iteritems() if k not in points])
+            if n_stray:
+                print '[+] do_glitch_batch: WARNING: %d results not from this batch.' % n_stray
+        
+        counts = []
+        istzfail = False
+        store = self.get_result_store(logfn)
+        for point in points:
+            gval, gdur, pdelay = point
+            thread_kproc.iter_results = groups.get(point, [])
+            n, is_failtz, _ = dump_tz_iter_results(logfn, thread_kproc, gval, gdur, pdelay, store)
+            counts.append(n)
+            istzfail = istzfail or is_failtz
+        thread_kproc.iter_results = []
+        return counts, istzfail, groups
+    
+    
+    @timed(ROUND)
+    def do_glitch_batch(self, modname, points, logfn, is_check_fever=True, min_temp=None):
+        """ Perform one round of glitching over a list of (gval, gdur, pdelay)
+            points, with a single module load.
+            Returns (1) if glitching round proceeded with any hitch
+                    (2) if slave thread TZ invocation failed
+                    (3) the number of results of each point
+        """
         success = True
+        failure = None
+        self.last_modname = modname
     
         # Create thread to monitor for crashes
         thread_kproc = ThreadKproc(modname, self.cfg.ADB_KPROC, self.cfg.DEVICE_ID, self.task)
@@ -273,68 +706,166 @@ class Engine(object):
         if thread_kproc.has_terminated:
             print '[+] do_glitch_one: ERROR: cat /proc/kmsg has died.'
             success = False
+            failure = failure or FAIL_KMSG
         if not self.is_env_initialized_stage():
             print '[+] do_glitch_one: ERROR: Phone restarted unexpectedly.'
             success = False
-        temp_min = self.cfg.MIN_TEMP
-        temp_max = self.cfg.MAX_TEMP
-        if min_temp is not None:
-            temp_min = min_temp
-            temp_max = temp_min + 1000
+            failure = failure or FAIL_ENV
+        temp_min, temp_max = self.get_temp_range(min_temp)
         if is_check_fever and not self.regulate_temperature(temp_min, temp_max):
             print '[+] do_glitch_one: ERROR: Cannot read temperature.'
             success = False
+            failure = failure or FAIL_TEMP
         if not success:
             thread_kproc.kill()
-            dump_tz_iter_results(logfn, thread_kproc, gval, gdur, pdelay)
-            return False, False, 0
+            with self.timer.phase('dump'):
+                self._dump_batch(logfn, thread_kproc, points)
+            self.last_round = (0, 0)
+            self.last_failure = failure
+            self.last_glitched = False
+            self.recovery.on_round(False)
+            return False, False, [0] * len(points)
         
         temperature = self.get_temperature()
+        t_start = time.time()
+        _, gdur, pdelay = points[0]
         
         print '\n[+]---[ New Glitching Params ]--------------------------'
-        print '[-]   gval=0x%x  gdur=%d  predelay=%d' % (gval, gdur, pdelay)
+        for point in points:
+            print '[-]   gval=0x%x  gdur=%d  predelay=%d' % point
         print '[-]   CPU Temperature: %d' % temperature
         
-        # Run dummy thread first to exercise the caches and pipeline
+        # No thermal sampling on the device while glitching
+        if self.sampler is not None:
+            self.sampler.pause()
+        
+        # Load the module first in resident mode. Unloading a copy left from
+        # before ends a run on kmsg, which must not be taken for the end of
+        # the dummy run.
+        if config.GLITCH_RESIDENT and modname not in self.resident_mods and \
+           self.load_resident(modname):
+            thread_kproc.wait_run_end(thread_kproc.n_runs + 1, timeout=config.KMSG_QUIET_TIME)
+            thread_kproc.flush_results()
+        
+        # Run dummy thread first to exercise the caches and pipeline. Its
+        # records must all be in before they are dropped.
         print '[-]   +++ Step [1]: Exercise cache with dummy rounds...'
-        thread_fuzz = self.exec_glitch_one_iter(self.cfg.FREQ_BASE, gdur, pdelay, modname, temperature)
-        thread_fuzz.run()
-        time.sleep(4)
-        thread_kproc.flush_results()
+        n_runs = thread_kproc.n_runs
+        with self.timer.phase('dummy'):
+            thread_fuzz = self.exec_glitch_one_iter(self.cfg.FREQ_BASE, gdur, pdelay, modname, temperature)
+            thread_fuzz.run()
+        with self.timer.phase('wait'):
+            thread_kproc.wait_run_end(n_runs + 1)
+            thread_kproc.flush_results()
         print '[-]   +++ Step [2]: Begin real glitching...'
-        time.sleep(2)
         
         # Create thread to run TZ benchmark and glitch
         if not thread_fuzz.is_timeout:
-            thread_fuzz = self.exec_glitch_one_iter(gval, gdur, pdelay, modname, temperature)
-            thread_fuzz.run()
+            n_runs = thread_kproc.n_runs
+            with self.timer.phase('glitch'):
+                thread_fuzz = self.exec_glitch_batch(points, modname, temperature)
+                thread_fuzz.run()
+            with self.timer.phase('wait'):
+                thread_kproc.wait_run_end(n_runs + 1)
+        
+        # Keep holding the temperature while results are collected
+        if is_check_fever and self.fever is not None:
+            self.fever.resume(temp_min, temp_max)
+        if self.sampler is not None:
+            self.sampler.resume()
         
         # Oops... Phone died
         if thread_kproc.has_terminated:
             print '[+] do_glitch_one(b): ERROR: cat /proc/kmsg has died.'
             success = False
+            failure = failure or FAIL_KMSG
         if thread_fuzz.is_timeout:
             print '[+] do_glitch_one: ERROR: Glitching fuzz thread has timed out.'
             success = False
+            failure = failure or FAIL_TIMEOUT
         if config.ERR_INSMOD_FAIL in thread_fuzz.output:
             print '[+] do_glitch_one: ERROR: Cannot load glitch fuzzing module.'
             success = False
+            failure = failure or FAIL_INSMOD
     
         # Dump pending results
         thread_kproc.kill()
-        n, istzfail, _ = dump_tz_iter_results(logfn, thread_kproc, gval, gdur, pdelay)
+        n_faults = len([r for r in thread_kproc.iter_results if r.is_pass is False])
+        if self.sampler is not None:
+            # The samples up to the round (the stream was paused during it)
+            series = self.sampler.encode_window(t_start - config.THERMAL_MAX_AGE)
+            for r in thread_kproc.iter_results:
+                r.thermal = series
+        with self.timer.phase('dump'):
+            counts, istzfail, groups = self._dump_batch(logfn, thread_kproc, points)
+        n = sum(counts)
+        self.timer.add_results(n)
         print '[+] Dumping results: n=%d istzfail=%d' % (n, istzfail)
     
-        # Check if we have any results
-        if success and n == 0:
+        # Check if we have results for every point
+        if success and 0 in counts:
             print '[+] do_glitch_one: ERROR: No valid results.'
             success = False
+            failure = FAIL_NORESULT
+        
+        # Count the samples of the round. The round itself only counts if it
+        # succeeded: the tasks run the others again.
+        if self.samples is not None:
+            for point in points:
+                self.samples.add(modname, point, groups.get(point, []),
+                                 is_round=success and not istzfail)
+        self.last_round = (n, n_faults)
+        self.last_failure = failure
+        self.last_glitched = True
+        self.recovery.on_round(success)
     
-        return success, istzfail, n
+        return success, istzfail, counts
 
 
 
 
+class EnvSnapshot(object):
+    """ Glitching environment state as read by Engine.get_env_snapshot().
+    
+    The on-device script prints a tag line before the output of each check,
+    so that multi-line outputs (e.g. taskset -a) can be split back out.
+    """
+    TAG = '@@ENV,'
+    
+    def __init__(self, output, check_cmds):
+        sections = {}
+        key = None
+        for line in output.splitlines():
+            if line.startswith(self.TAG):
+                key = line[len(self.TAG):].strip()
+                sections[key] = []
+            elif key is not None:
+                sections[key].append(line)
+        sections = dict([(k, '\n'.join(v).strip()) for k, v in sections.iteritems()])
+        
+        pid = sections.get('PID', '')
+        self.adbd_pid = int(pid) if pid.isdigit() else 0
+        self.adbd_mask = sections.get('MASK', '').split(' ')[-1]
+        
+        # Interpret outputs the same way as Engine.run_adb_and_get_output()
+        self.values = []
+        self.mismatches = []
+        for i, (c, s, o) in enumerate(check_cmds):
+            out = sections.get(str(i), '')
+            if not s:
+                out = int(out) if out.isdigit() else 0
+            self.values.append(out)
+            if out != o:
+                self.mismatches.append((i, c, out, o))
+    
+    def is_adbd_pinned(self):
+        return '1' in self.adbd_mask
+    
+    def is_initialized(self):
+        return self.is_adbd_pinned() and not self.mismatches
+
+
+
 class ThreadAdbCmd(object):
     """ Encapsulate an ADB command so that we can trap the timeout.
     """
@@ -347,18 +878,36 @@ class ThreadAdbCmd(object):
         self.output = ''
 
     def run(self, is_quiet=False):
-        def target():
-           _, self.output = adb_exec_cmd_one(self.device_id, self.adbcmd, self.pname)
-        
-        self.thrd = threading.Thread(target=target)
-        self.thrd.start()
-        self.thrd.join(self.timeout)
-        if self.thrd.is_alive():
-            force_kill_os(self.pname)
-            self.is_timeout = True
-            if not is_quiet:
-                print '[+] ERROR: adb cmd has timed out! Force-killing adb'
+        with tracing.span('ThreadAdbCmd', 'adb', cmd=self.adbcmd, timeout=self.timeout) as args:
+            self._run(is_quiet)
+            args['is_timeout'] = self.is_timeout
+    
+    def _run(self, is_quiet):
+        if config.ADB_USE_SESSION:
+            _, self.output, self.is_timeout = \
+                adb_exec_cmd_session(self.device_id, self.adbcmd, self.pname, self.timeout)
+            if self.is_timeout and not is_quiet:
+                print '[+] ERROR: adb cmd has timed out! Dropping shell session'
                 print '[-]      (%s)' % self.adbcmd
+            return
+        
+        # Retry while adb cannot reach the device, as adb_exec_cmd_one()
+        # does. On timeout, only the adb process of this command is killed.
+        full_cmd = '%s -s %s shell su -c \"%s\"' % (self.pname, self.device_id, self.adbcmd)
+        deadline = time.time() + self.timeout
+        for n_tries in xrange(10):
+            _, output, self.is_timeout = \
+                ThreadExecCmd(full_cmd, max(deadline - time.time(), 0.1)).run(is_quiet=True)
+            self.output = output.strip() if output is not None else ''
+            if self.is_timeout or not is_adb_offline(self.output):
+                break
+            if time.time() + 5 >= deadline:
+                self.is_timeout = True
+                break
+            tracing.sleep(5)
+        if self.is_timeout and not is_quiet:
+            print '[+] ERROR: adb cmd has timed out! Force-killing adb'
+            print '[-]      (%s)' % self.adbcmd
 
 
 
@@ -371,168 +920,242 @@ class ThreadExecCmd(object):
         self.is_timeout = False
         self.output = None
         self.status = None
-        self.pname = cmdstr.split(' ')[0]
+        self.proc = None
+        self.lock = threading.Lock()
 
-    def run(self):
+    def run(self, is_quiet=False):
         def target():
-           self.status, self.output = commands.getstatusoutput(self.cmdstr)
-
-        self.thrd = threading.Thread(target=target)
-        self.thrd.start()
-        self.thrd.join(self.timeout)
-        if self.thrd.is_alive():
-            force_kill_os(self.pname)
-            self.is_timeout = True
-            print '[+] ERROR: getstatusoutput cmd has timed out! Force-killing ...'
-            print '[-]      (%s)' % self.cmdstr
+            # Same output and status as commands.getstatusoutput(). The
+            # command gets its own process group, so that it can be killed
+            # along with the processes it started.
+            with self.lock:
+                if self.is_timeout:
+                    return
+                self.proc = subprocess.Popen('{ %s ; } 2>&1' % self.cmdstr, shell=True,
+                                             stdout=subprocess.PIPE, close_fds=True,
+                                             preexec_fn=os.setsid)
+            output = self.proc.communicate()[0]
+            ret = self.proc.returncode
+            self.status = (ret << 8) if ret >= 0 else -ret
+            self.output = output[:-1] if output.endswith('\n') else output
+
+        with tracing.span('ThreadExecCmd', 'exec', cmd=self.cmdstr, timeout=self.timeout) as args:
+            self.thrd = threading.Thread(target=target)
+            self.thrd.start()
+            self.thrd.join(self.timeout)
+            if self.thrd.is_alive():
+                with self.lock:
+                    self.is_timeout = True
+                self.kill()
+                if not is_quiet:
+                    print '[+] ERROR: getstatusoutput cmd has timed out! Force-killing ...'
+                    print '[-]      (%s)' % self.cmdstr
+            args.update(status=self.status, is_timeout=self.is_timeout, killed=self.is_timeout)
         return self.status, self.output, self.is_timeout
 
+    def kill(self):
+        """ Kill the process group of our command only, leaving alone the adb
+            processes of other commands and devices.
+        """
+        with self.lock:
+            if self.proc is None:
+                return
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
 
 class ThreadKproc(object):
-    
-    def __init__(self, modname, pname, dev_id, task):
+    """ Monitor /proc/kmsg of the device (or replay a recorded kmsg file) and
+        collect the iteration results printed by the glitching module.
+    """
+    def __init__(self, modname, pname, dev_id, task, kmsg_fn=None):
         self.dev_id = dev_id
         self.pname = pname
         self.task = task
+        self.kmsg_fn = kmsg_fn
         self.proc = None
         self.thrd = None
         self.has_terminated = False
         self.iter_results = []
         self.cmd_str = 'taskset 1 /system/bin/cat /proc/kmsg | grep %s' % (modname)
-        self.prevRes = None
         self.niter = 0
+        self.parser = KmsgParser(functools.partial(TzIterationResult, task),
+                                 on_result=self._on_result, on_end=self._on_end)
+        
+        # Signalled on every record, END marker and on termination
+        self.cv = threading.Condition()
+        self.t_last_record = 0
+
+        # Results parsed under cv, printed once it is released
+        self.to_print = []
     
     def save_res(self, pr, iter):
         self.iter_results.append(pr)
-        print '[-]   (%02d)' % (iter), pr
+        self.to_print.append((iter, pr))
+
+    def _print_pending(self):
+        """ Print the results parsed so far. Done outside cv, since rendering
+            a result may analyze its payloads; with the analysis workers
+            running, only the record is printed.
+        """
+        with self.cv:
+            printed, self.to_print = self.to_print, []
+        for iter, pr in printed:
+            if analysis.is_enabled():
+                print '[-]   (%02d)' % (iter), pr.get_record_str()
+            else:
+                print '[-]   (%02d)' % (iter), pr
+
+    def _on_result(self, pr):
+        self.niter = self.niter + 1
+        self.save_res(pr, self.niter)
+
+    def _on_end(self):
+        with self.cv:
+            self.cv.notify_all()
+
+    def _feed_lines(self, lines):
+        for line in lines:
+            with self.cv:
+                self.parser.feed(line)
+                self.t_last_record = time.time()
+                self.cv.notify_all()
+            self._print_pending()
+
+    @property
+    def n_runs(self):
+        """ Number of module runs (END markers) seen so far.
+        """
+        return self.parser.n_ends
+
+    def wait_run_end(self, n_runs, timeout=config.KMSG_END_TIMEOUT,
+                     quiet=config.KMSG_QUIET_TIME):
+        """ Wait until <n_runs> module runs have ended on kmsg, i.e. all their
+            records have been received. Gives up after <timeout> secs, or once
+            no record has arrived for <quiet> secs (modules without END
+            marker), or if monitoring died.
+        
+        @returns:
+            True if the END marker was seen.
+        """
+        t_start = time.time()
+        deadline = t_start + timeout
+        with self.cv:
+            while self.parser.n_ends < n_runs and not self.has_terminated:
+                now = time.time()
+                t_quiet = max(self.t_last_record, t_start) + quiet
+                if now >= min(deadline, t_quiet):
+                    return False
+                self.cv.wait(min(deadline, t_quiet) - now)
+            return self.parser.n_ends >= n_runs
 
     def dumpRes(self):
-        if self.prevRes:
-            self.niter = self.niter + 1
-            self.save_res(self.prevRes, self.niter)
-            self.prevRes = None
+        self.parser.finish()
 
     def flush_results(self):
-        self.iter_results = []
-        self.prevRes = None
+        with self.cv:
+            self.iter_results = []
+            self.parser.reset()
   
     def run(self):
         def target():
-            print '[+] KPROC: Monitoring /proc/kmsg for glitches'
-
-            self.cmd_str = [self.pname, '-s', self.dev_id, 'shell', 'su', \
-                            '-c', '\"%s\"' % self.cmd_str]
-            self.proc = subprocess.Popen(self.cmd_str,
-                                         stdout=subprocess.PIPE,
-                                         stderr=subprocess.PIPE,
-                                         shell=False)
-            while True:
-                nextline = self.proc.stdout.readline()
-
-                if nextline == '' and self.proc.poll() != None:
-                    time.sleep(2)
-                    self.dumpRes()
-                    print '[-]   KPROC: Terminating.'
-                    self.has_terminated = True
-                    break
+            if self.kmsg_fn:
+                print '[+] KPROC: Replaying %s' % self.kmsg_fn
+                with open(self.kmsg_fn) as fh:
+                    self._feed_lines(fh)
+            else:
+                print '[+] KPROC: Monitoring /proc/kmsg for glitches'
+                self.cmd_str = [self.pname, '-s', self.dev_id, 'shell', 'su', \
+                                '-c', '\"%s\"' % self.cmd_str]
+                with tracing.span('kmsg', 'adb', cmd=' '.join(self.cmd_str)) as args:
+                    self.proc = subprocess.Popen(self.cmd_str,
+                                                 stdout=subprocess.PIPE,
+                                                 stderr=subprocess.PIPE,
+                                                 shell=False,
+                                                 close_fds=True)
+                    self._feed_lines(iter(self.proc.stdout.readline, ''))
+                    args['status'] = self.proc.wait()
+                    args['results'] = self.niter
+                time.sleep(2)
+            
+            with self.cv:
+                self.dumpRes()
+                self.has_terminated = True
+                self.cv.notify_all()
+            self._print_pending()
+            print '[-]   KPROC: Terminating.'
 
-                nextline = nextline.strip()
+        self.thrd = threading.Thread(target=target)
+        self.thrd.start()
 
-                if 'ITER' in nextline:
-                    self.dumpRes()
-                    vals = nextline.split(',')
-                    self.prevRes = TzIterationResult(self.task, int(vals[3], 16), int(vals[4]), int(vals[5]))
-                    if vals[6].isdigit():
-                        self.prevRes.add_temperature(int(vals[6]))
+    def kill(self):
+        """ Stop monitoring. Only our own adb process is killed, so that the
+            monitors of other devices are left alone.
+        """
+        with self.cv:
+            self.dumpRes()
+        self._print_pending()
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.kill()
 
-                # Skip until we have a valid iteration
-                if self.prevRes is None:
-                    continue
 
-                if ',glitch,' in nextline:
-                    vals = nextline.split(',')
-                    print '  GLITCH', vals[2:]
-                    if not vals or len(vals) < 3:
-                        continue
-                    try:
-                        self.prevRes.add_glitch_stats(int(vals[2]), int(vals[3]))
-                        self.prevRes.add_stats_scratch_g(vals[4])
-                    except IndexError:
-                        print '  GLITCH--', nextline
-
-                if ',slave,' in nextline:
-                    vals = nextline.split(',')
-                    if vals[2] != 'EXPT_TEST':
-                        print '  SLAVE-vals', vals[2:]
-                    if vals[2] == 'FAIL' or vals[2] == 'PASS' or vals[2] == 'DONE':
-                        is_pass = True if vals[2] == 'PASS' else False
-                        self.prevRes.add_slave_stats(int(vals[3]),
-                                                     int(vals[4]),
-                                                     is_pass,
-                                                     int(vals[5],16))
-                        self.prevRes.add_stats_scratch_s(vals[6])
-                    elif vals[2] == 'FAIL_RND':
-                        print '  SLAVE-rnd', vals[3:]
-                        self.prevRes.add_failrnd_stats(vals[3:])
-                    elif vals[2] == 'FAIL_MOD':
-                        print '  SLAVE-mod', vals[3:]
-                        self.prevRes.add_failmod(vals[3:])
-                    elif vals[2] == 'FAIL_CT':
-                        print '  SLAVE-ct', vals[3:]
-                        self.prevRes.add_failct(vals[3:])
-                    elif vals[2] == 'FAIL_RRND':
-                        print '  SLAVE-rrnd', vals[3:]
-                        self.prevRes.add_failrrnd(vals[3:])
-                    elif vals[2] == 'FAIL_MODR':
-                        print '  SLAVE-modr', vals[3:]
-                        self.prevRes.add_failmodr(vals[3:])
-                    elif vals[2] == 'TZFAIL':
-                        print '  SLAVE-tzfail', vals[3:]
-                        self.prevRes.set_failure()
-                    elif vals[2] == 'PROFILE':
-                        print '  SLAVE-profile', vals[3:]
-                        self.prevRes.add_pdelay_profile(vals[3:])
-                    elif vals[2] == 'EXPT_TEST':
-                        self.prevRes.add_expttest(vals[3:])
-                    else:
-                        raise Exception('Unexpected slave string:\n' + nextline)
+# Payloads the modules print as hex chunks, which are kept as raw bytes
+HEX_PAYLOADS = ('failmod', 'failct', 'failmodr', 'expttest')
 
+# Separator of the chunks of text payloads
+PAYLOAD_SEP = {'failrrnd': ','}
 
-        self.thrd = threading.Thread(target=target)
-        self.thrd.start()
 
-    def kill(self):
-        self.dumpRes()
-        force_kill_os(self.pname)
+def _record_field(k):
+    """ Property over entry <k> of the compact numeric record.
+    """
+    return property(lambda self: self._rec[k],
+                    lambda self, v: self._rec.__setitem__(k, v))
 
 
-class TzIterationResult:
+class TzIterationResult(object):
+    """ Result of one glitching iteration.
+    
+    The numeric fields live in one compact array record of longs, and
+    the payload table is only allocated once a payload record comes in. Hex
+    payloads are decoded to raw bytes chunk by chunk, and only joined and
+    turned back into hex when asked for (see get_payload).
+    """
+    __slots__ = ('task', '_rec', 'is_pass', 'ret_val', 'is_fail_tz', 'scratch_s',
+                 'scratch_g', 'failrnd_s', 'pdelay_stats', 'thermal', '_payloads')
+    
+    gvalue = _record_field(0)
+    gdelay = _record_field(1)
+    delaypre = _record_field(2)
+    temperature = _record_field(3)
+    ccnt_g = _record_field(4)
+    insn_g = _record_field(5)
+    ccnt_s = _record_field(6)
+    insn_s = _record_field(7)
+    
     def __init__(self, task, gvalue, gdelay, delaypre):
         self.task = task
-        self.gvalue = gvalue
-        self.gdelay = gdelay
-        self.delaypre = delaypre
-        self.failrnd_s = ''
+        self._rec = array('l', (gvalue, gdelay, delaypre, 0, 0, 0, 0, 0))
         self.is_pass = None
+        self.ret_val = 0
+        self.is_fail_tz = False
         self.scratch_s = ''
         self.scratch_g = ''
-        self.failmod_lst = []
-        self.failct_lst = []
-        self.failrrnd_lst = []
-        self.failmodr_lst = []
-        self.expttest_lst = []
-        self.temperature = 0
-        self.ccnt_g = 0
-        self.insn_g = 0
-        self.ccnt_s = 0
-        self.insn_s = 0
-        self.is_fail_tz = False
+        self.failrnd_s = ''
+        
+        # {payload name: bytearray of a hex payload, or list of text chunks}
+        self._payloads = None
         
         # for pdelay profiling
         self.pdelay_stats = None
+        
+        # Thermal telemetry of the round (see ThermalSampler.encode_window)
+        self.thermal = ''
 
     def is_incorrect(self):
-        if self.failrnd:
+        if self.failrnd_s:
             return True
         return False
 
@@ -560,19 +1183,55 @@ class TzIterationResult:
         self.failrnd_s = ','.join(rnd_s)
     
     def add_failmod(self, mod_s):
-        self.failmod_lst.extend(mod_s[1:])
+        self._add_payload('failmod', mod_s[1:])
     
     def add_failct(self, ct_s):
-        self.failct_lst.extend(ct_s[1:])
+        self._add_payload('failct', ct_s[1:])
     
     def add_failrrnd(self, rrnd_s):
-        self.failrrnd_lst.extend(rrnd_s[1:])
+        self._add_payload('failrrnd', rrnd_s[1:])
     
     def add_failmodr(self, modr_s):
-        self.failmodr_lst.extend(modr_s[1:])
+        self._add_payload('failmodr', modr_s[1:])
     
     def add_expttest(self, expttest_s):
-        self.expttest_lst.extend(expttest_s[1:])
+        self._add_payload('expttest', expttest_s[1:])
+    
+    def _add_payload(self, name, chunks):
+        if self._payloads is None:
+            self._payloads = {}
+        buf = self._payloads.get(name)
+        if name in HEX_PAYLOADS:
+            if buf is None:
+                buf = self._payloads[name] = bytearray()
+            if isinstance(buf, bytearray):
+                try:
+                    buf.extend(unhexlify(''.join(chunks)))
+                    return
+                except TypeError:
+                    # Not hex after all: keep it as text from now on
+                    buf = self._payloads[name] = [hexlify(buf)] if buf else []
+        elif buf is None:
+            buf = self._payloads[name] = []
+        buf.extend(chunks)
+    
+    def get_payload(self, name):
+        """ Payload <name> as printed by the module, or '' if none came in.
+        """
+        buf = self._payloads.get(name) if self._payloads else None
+        if not buf:
+            return ''
+        if isinstance(buf, bytearray):
+            return hexlify(buf)
+        return PAYLOAD_SEP.get(name, '').join(buf)
+    
+    def get_payload_bytes(self, name):
+        """ Hex payload <name> as raw bytes, or None if it is kept as text.
+        """
+        buf = self._payloads.get(name, bytearray()) if self._payloads else bytearray()
+        if isinstance(buf, bytearray):
+            return str(buf)
+        return None
   
     def set_failure(self):
         self.is_fail_tz = True
@@ -594,6 +1253,27 @@ class TzIterationResult:
         return s
 
     def __str__(self):
+        return self._render(is_analyzed=True)
+    
+    def get_record_str(self):
+        """ Log record without the host-side analysis of its payloads (see
+            get_analysis_args).
+        """
+        return self._render(is_analyzed=False)
+    
+    def get_analysis_args(self):
+        """ Arguments of analyze_payloads() for this result, or None if it
+            has nothing to analyze.
+        """
+        if self._payloads is None or self.is_invalid():
+            return None
+        failmod = self.get_payload('failmod')
+        expttest = self.get_payload('expttest')
+        if not failmod and not expttest:
+            return None
+        return (self.task, failmod, expttest)
+    
+    def _render(self, is_analyzed):
         if self.is_invalid():
             return ',,,,,'
         pass_str = 'PASS' if self.is_pass else 'FAIL'
@@ -603,32 +1283,27 @@ class TzIterationResult:
         if self.failrnd_s:
             s += '\n\t\tRND:'
             s += self.failrnd_s
-        if self.failct_lst:
-            failct = ''.join(self.failct_lst)
+        if self._payloads is None:
+            return s
+        failct = self.get_payload('failct')
+        if failct:
             s = s + '\n\t\tCT:' + failct
-        if self.failrrnd_lst:
-            failrrnd = ','.join(self.failrrnd_lst)
+        failrrnd = self.get_payload('failrrnd')
+        if failrrnd:
             s = s + '\n\t\tRRND:' + failrrnd
-        if self.failmodr_lst:
-            failmodr = ''.join(self.failmodr_lst)
+        failmodr = self.get_payload('failmodr')
+        if failmodr:
             s = s + '\n\t\tR2MODN:' + failmodr
-        if self.failmod_lst:
-            failstr = ''.join(self.failmod_lst)
+        failstr = self.get_payload('failmod')
+        if failstr:
             s = s + '\n\t\tNPRIME:' + failstr
-            if self.task == config.TASK_TYPES['rsaauth'] and not '00000000' in failstr:
-                s = s + '\n' + get_bitflip_stats(failstr)
-        if self.expttest_lst:
-            exptfail_str = ''.join(self.expttest_lst)
+            if is_analyzed:
+                s = s + analyze_failmod(self.task, failstr)
+        exptfail_str = self.get_payload('expttest')
+        if exptfail_str:
             s = s + '\n\t\tEXPT_STR:' + exptfail_str
-            
-            if self.task == config.TASK_TYPES['rsaauth'] or \
-                    self.task == config.TASK_TYPES['glitchexpt']:
-                s = s + '\n' + get_bitflip_stats(exptfail_str)
-            if self.task == config.TASK_TYPES['glitchprof']:
-                s = s + '\n' + get_expt_stats_memcpy(exptfail_str)
-            """
-            s = s + '\n' + get_expt_stats_memcpy(exptfail_str)
-            """
+            if is_analyzed:
+                s = s + analyze_expttest(self.task, exptfail_str)
         return s
 
 
@@ -651,9 +1326,16 @@ class TaskPdelayProfiling(object):
         self.modname = self.params['modname']
         self.logfn = self.params['logfn'] + self.modname + '.txt'
         self.engine.task = config.TASK_TYPES['pdelayprof']
+        self.timer = engine.timer
+        
+        # Bracket (lo, hi, rounds so far) after each search iteration
+        self.journal = engine.get_journal(self.TASK, self.modname)
     
+    @timed(ROUND)
     def _do_profile_one(self, modname, logfn, gval, gdur, pdelay):
         success = True
+        failure = None
+        self.engine.last_modname = modname
         
         # Create thread to monitor for crashes
         thread_kproc = self.engine.create_kproc_sess(modname)
@@ -663,38 +1345,56 @@ class TaskPdelayProfiling(object):
         if thread_kproc.has_terminated:
             print '[+] _do_profile_one(a): ERROR: cat /proc/kmsg has died.'
             success = False
+            failure = failure or FAIL_KMSG
         if not self.engine.is_env_initialized_stage():
             print '[+] _do_profile_one: ERROR: Phone restarted unexpectedly.'
             success = False
+            failure = failure or FAIL_ENV
         if not success:
             thread_kproc.kill()
-            _, _, results = dump_tz_iter_results(logfn, thread_kproc, gval, gdur, pdelay)
+            _, _, results = dump_tz_iter_results(logfn, thread_kproc, gval, gdur, pdelay,
+                                                 self.engine.get_result_store(logfn))
+            self.engine.last_failure = failure
+            self.engine.recovery.on_round(False)
             return False, False, results
         
         # Create thread to run TZ benchmark and glitch
-        thread_fuzz = self.engine.exec_glitch_one_iter(gval, gdur, pdelay, modname)
-        thread_fuzz.run()
+        n_runs = thread_kproc.n_runs
+        with self.timer.phase('glitch'):
+            thread_fuzz = self.engine.exec_glitch_one_iter(gval, gdur, pdelay, modname)
+            thread_fuzz.run()
+        if not thread_fuzz.is_timeout:
+            with self.timer.phase('wait'):
+                thread_kproc.wait_run_end(n_runs + 1)
          
         # Oops... Phone died
         if thread_kproc.has_terminated:
             print '[+] _do_profile_one(b): ERROR: cat /proc/kmsg has died.'
             success = False
+            failure = failure or FAIL_KMSG
         if thread_fuzz.is_timeout:
             print '[+] _do_profile_one: ERROR: Glitching fuzz thread has timed out.'
             success = False
+            failure = failure or FAIL_TIMEOUT
         if config.ERR_INSMOD_FAIL in thread_fuzz.output:
             print '[+] _do_profile_one: ERROR: Cannot load glitch fuzzing module.'
             success = False
+            failure = failure or FAIL_INSMOD
         
         # Dump pending results
         thread_kproc.kill()
-        time.sleep(2)
-        n, istzfail, results = dump_tz_iter_results(logfn, thread_kproc, gval, gdur, pdelay)
+        with self.timer.phase('dump'):
+            n, istzfail, results = dump_tz_iter_results(logfn, thread_kproc, gval, gdur, pdelay,
+                                                        self.engine.get_result_store(logfn))
+        self.timer.add_results(n)
         
         # Check if we have any results
         if success and n == 0:
             print '[+] _do_profile_one: ERROR: No valid results.'
             success = False
+            failure = FAIL_NORESULT
+        self.engine.last_failure = failure
+        self.engine.recovery.on_round(success)
         
         return success, istzfail, results
     
@@ -738,82 +1438,203 @@ class TaskPdelayProfiling(object):
         output[pdelay] = ll
     
     
+    def _sample(self, pdelay, output):
+        """ One successful profiling round at <pdelay>; its metrics are added
+            to output[pdelay].
+        """
+        for t in xrange(self.params['nb_tries']):
+            
+            print '\n[+]======[pdelay %d - Round %d - Try %d]========' % \
+                (pdelay, self.rounds.get(pdelay, 0) + 1, t+1)
+            time.sleep(5)
+            
+            success, istzfail, results = \
+                self._do_profile_one(self.modname, self.logfn, 
+                                     self.cfg.FREQ_BASE, 1, pdelay)
+            
+            # Proceed to next iteration if we succeed
+            if success:
+                break
+            
+            # If slave thread failed, try again without rebooting
+            if istzfail:
+                print '[-]   Slave seemed to have failed in TZ'
+                continue
+            
+            # For unsuccessful round, recover the phone (see recovery.py)
+            self.engine.recover()
+        
+        self.rounds[pdelay] = self.rounds.get(pdelay, 0) + 1
+        self._process_res_one(results, pdelay, output)
+    
+    
+    def _estimate(self, pdelay, output):
+        """ (IQR mean, CI half-width) of the metric at <pdelay>.
+        """
+        if not output.get(pdelay):
+            return np.inf, np.inf
+        return utils.iqr_ci(output[pdelay], z=config.PDELAY_OPT_Z)
+    
+    
     def _do_profile(self, pdelay, output):
         """ Given pdelay, returns IQR mean of metric.
         """
         for i in xrange(self.params['nb_iter']):
-            for t in xrange(self.params['nb_tries']):
-                
-                print '\n[+]======[Iter %d - Try %d]========' % (i+1, t+1)
-                time.sleep(5)
-                
-                success, istzfail, results = \
-                    self._do_profile_one(self.modname, self.logfn, 
-                                         self.cfg.FREQ_BASE, 1, pdelay)
-                
-                # Proceed to next iteration if we succeed
-                if success:
-                    break
-                
-                # If slave thread failed, try again without rebooting
-                if istzfail:
-                    print '[-]   Slave seemed to have failed in TZ'
-                    continue
-                
-                # For unsuccessful round, we'll reset the phone
-                while not self.engine.reboot():
-                    print '[-]   Reboot failed. Try again!'
+            self._sample(pdelay, output)
+        return utils.iqr_mean(output[pdelay])
+    
+    
+    def _compare(self, p1, p2, output, tol):
+        """ Sample <p1> and <p2> until their metrics are told apart: their
+            confidence intervals are disjoint, or both are narrower than <tol>.
+            Each probe gets at most <nb_iter> rounds, shared with earlier
+            comparisons.
+        
+        @returns:
+            ((mean, half-width) of p1, (mean, half-width) of p2)
+        """
+        nb_min = min(config.PDELAY_OPT_MIN_ROUNDS, self.params['nb_iter'])
+        while True:
+            est = [self._estimate(p, output) for p in (p1, p2)]
+            rounds = [self.rounds.get(p, 0) for p in (p1, p2)]
             
-            # Compute the new pdelay value to try
-            new_pdelay = self._process_res_one(results, pdelay, output)
+            # Every probe needs a few rounds for its interval to mean anything
+            todo = [p for p, r in zip((p1, p2), rounds) if r < nb_min]
+            if not todo:
+                (m1, h1), (m2, h2) = est
+                if abs(m1 - m2) > h1 + h2 or max(h1, h2) < tol:
+                    return est
+                
+                # Refine the wider interval
+                todo = [p for _, p, r in sorted(zip((-h1, -h2), (p1, p2), rounds))
+                        if r < self.params['nb_iter']]
+                if not todo:
+                    return est
+            self._sample(todo[0], output)
+    
+    
+    def _fit_optimum(self, lo, hi, output):
+        """ Refine the optimum in [lo, hi] with a quadratic fitted (weighted by
+            the confidence intervals) to the probes around the bracket.
         
-        return utils.iqr_mean(output[pdelay])
+        @returns:
+            (pdelay, mean, half-width) where the latter two are those of the
+            closest probe, or (None, None, None) if no probe has results.
+        """
+        est = dict([(p, self._estimate(p, output)) for p in output if output[p]])
+        if not est:
+            return None, None, None
+        best = min([p for p in est if lo <= p <= hi] or est, key=lambda p: est[p][0])
+        
+        width = max(hi - lo, 1)
+        near = sorted(est, key=lambda p: abs(p - (lo + hi) / 2.))[:5]
+        if len(near) >= 3 and max(near) - min(near) <= 4 * width + 4 * self.params['pdelay']['STEP']:
+            x = np.array(near, dtype=float)
+            y = np.array([est[p][0] for p in near])
+            w = np.array([1. / max(est[p][1], 1e-6) for p in near])
+            a, b, _ = np.polyfit(x, y, 2, w=w)
+            if a > 0:
+                p_fit = int(round(min(max(-b / (2 * a), lo), hi)))
+                best_fit = min(est, key=lambda p: abs(p - p_fit))
+                return p_fit, est[best_fit][0], est[best_fit][1]
+        return best, est[best][0], est[best][1]
+    
     
+    def _snap(self, pdelay):
+        base = self.params['pdelay']['BASE']
+        step = max(self.params['pdelay']['STEP'], 1)
+        return base + int(round(float(pdelay - base) / step)) * step
     
-    def run(self, eps=1):
+    
+    def _resume(self):
+        """ Bracket journaled by an interrupted search, if it is one of the
+            current pdelay range.
+        
+        @returns:
+            (lo, hi, iteration, rounds), or None to start from the full range.
+        """
+        entry = self.journal.latest()
+        if entry is None:
+            return None
+        (lo, hi, rounds), n = entry
+        if not self.params['pdelay']['BASE'] <= lo < hi <= self.params['pdelay']['END']:
+            return None
+        print '[+] pdelay search: resuming at iteration %d, [%d, %d] (%d rounds done)' % \
+            (n, lo, hi, rounds)
+        return lo, hi, n, rounds
+    
+    
+    def run(self, eps=1, tol=config.PDELAY_OPT_TOL):
+        """ Golden-section search of the pdelay minimizing the metric, until
+            the bracket around the optimum is narrower than <eps> (or a step).
+            Probes are sampled only as much as needed to rank them (see
+            _compare), and probes are reused across iterations. The bracket
+            is journaled after every iteration, and an interrupted search
+            resumes from it (its probes are sampled anew).
+        
+        @returns:
+            (pdelay, IQR mean, CI half-width) of the optimum, or (None, None,
+            None) if no probe produced results.
+        """
         
         # Store global list {pdelay : list of metrics}
         output = {}
         
-        # Perform a binary scan of the pdelay values until a specific threshold
-        pdelay_lo = self.params['pdelay']['BASE']
-        pdelay_hi = self.params['pdelay']['END']
+        # {pdelay: number of rounds sampled}
+        self.rounds = {}
         
-        metric_lo = self._do_profile(pdelay_lo, output)
-        metric_hi = self._do_profile(pdelay_hi, output)
-        diff = np.abs(metric_hi - metric_lo)
+        invphi = (np.sqrt(5) - 1) / 2
+        lo = self.params['pdelay']['BASE']
+        hi = self.params['pdelay']['END']
+        eps = max(eps, self.params['pdelay']['STEP'])
         n = 0
-        n_stagnate = 0
+        rounds_before = 0
+        resumed = self._resume()
+        if resumed is not None:
+            lo, hi, n, rounds_before = resumed
+        c = self._snap(hi - invphi * (hi - lo))
+        d = self._snap(lo + invphi * (hi - lo))
         
-        while (diff > eps) and (n_stagnate < 3):
-            print '\n*** [%d] [%d, %d]: %f, %f (%f)' % (n, pdelay_lo, pdelay_hi, metric_lo, metric_hi, diff)
+        while (hi - lo > eps) and (c < d):
+            (mc, hc), (md, hd) = self._compare(c, d, output, tol)
+            print '\n*** [%d] [%d, %d]: f(%d)=%f+-%f  f(%d)=%f+-%f' % \
+                (n, lo, hi, c, mc, hc, d, md, hd)
             n += 1
             
-            pdelay_curr = (pdelay_lo + pdelay_hi) / 2
-            metric_curr = self._do_profile(pdelay_curr, output)
-            
-            # Assume that our binary scan will monotonically reduce metric 
-            # between a given range
-            if metric_curr > metric_lo and metric_curr > metric_hi:
-                print 'ERROR: metric_curr (%f) is out of range!' % metric_curr
-                print 'Try again: n_stagnate=%d' % n_stagnate
-                n_stagnate += 1
-                continue
-            
-            if np.mean([metric_lo, metric_curr]) < np.mean([metric_curr, metric_hi]):
-                pdelay_hi = pdelay_curr
-                metric_hi = metric_curr
+            if mc < md:
+                hi = d
+                d = c
+                c = self._snap(hi - invphi * (hi - lo))
             else:
-                pdelay_lo = pdelay_curr
-                metric_lo = metric_curr
+                lo = c
+                c = d
+                d = self._snap(lo + invphi * (hi - lo))
+            self.journal.mark_done((lo, hi, rounds_before + sum(self.rounds.values())), n)
             
-            diff = np.abs(metric_hi - metric_lo)
+            # Bracket no longer holds two distinct probes
+            if c >= d:
+                c, d = min(c, d), max(c, d)
+                if c == d:
+                    break
+        
+        # A search resumed at its last bracket has no probes yet
+        if not output:
+            self._compare(c, d, output, tol)
+        
+        pdelay, mean, h = self._fit_optimum(lo, hi, output)
         
         print '--------------------------------'
         pdelays = sorted(list(output.viewkeys()))
         for p in pdelays:
-            ll = output[p]
-            print 'pdelay=%d => %f' % (p, utils.iqr_mean(ll))
+            m, hw = self._estimate(p, output)
+            print 'pdelay=%d => %f +- %f (%d rounds)' % (p, m, hw, self.rounds[p])
+        if pdelay is None:
+            print 'OPTIMUM: none in [%d, %d], no probe produced results (%d rounds total)' % \
+                (lo, hi, rounds_before + sum(self.rounds.values()))
+            return pdelay, mean, h
+        print 'OPTIMUM: pdelay=%d in [%d, %d] => %f +- %f (%d rounds total)' % \
+            (pdelay, lo, hi, mean, h, rounds_before + sum(self.rounds.values()))
+        return pdelay, mean, h
 
 
 class TaskGlitchProfiling(object):
@@ -821,39 +1642,51 @@ class TaskGlitchProfiling(object):
         workloads.
     """
     TASK = config.TASK_TYPES['glitchprof']
+    PARAMS = 'P_GLITCH_PROFILE'
+    AXES = ('gval', 'gdur', 'pdelay')
     
-    def __init__(self, engine):
+    def __init__(self, engine, points=None):
         self.engine = engine
         self.cfg = engine.cfg
         self.params = unserialize(self.cfg.P_GLITCH_PROFILE)
+        self.points = points if points is not None else grid_points(self.params, self.AXES)
         self.modname = self.params['modname']
         self.logfn = self.params['logfn'] + self.modname + '.txt'
         self.engine.task = config.TASK_TYPES['glitchprof']
+        self.journal = engine.get_journal(self.TASK, self.modname)
     
     def run(self):
-        for gval in xrange_tuple(self.params, 'gval'):
-            for gdur in xrange_tuple(self.params, 'gdur'):
-                for pdelay in xrange_tuple(self.params, 'pdelay'):
-                    for i in xrange(self.params['nb_iter']):
-                        for t in xrange(self.params['nb_tries']):
-                            print '\n[+]======[Iter %d - Try %d]==========' % (i, t)
-                            time.sleep(2)
-                            
-                            success, istzfail, _ = \
-                                self.engine.do_glitch_one(self.modname, gval, gdur, pdelay, self.logfn)
-                            
-                            # If slave thread failed, try again without rebooting
-                            if istzfail:
-                                print '[-]   Slave seemed to have failed in TZ'
-                                continue
-    
-                            # Proceed to next iteration if we succeed
-                            if success:
-                                break
-    
-                            # For unsuccessful round, we'll reset the phone
-                            while not self.engine.reboot():
-                                print '[-]   Reboot failed. Try again!'
+        if config.SEARCH_ADAPTIVE:
+            return run_adaptive_sweep(self)
+        if self.engine.batch_size(self.modname) > 1:
+            return run_batch_sweep(self)
+        for point in self.points:
+            gval, gdur, pdelay = point
+            for i in xrange(self.params['nb_iter']):
+                if self.journal.is_done(point, i):
+                    continue
+                if is_sampled(self, point):
+                    print '[-]   Point already sampled by earlier sessions. Skipping.'
+                    break
+                for t in xrange(self.params['nb_tries']):
+                    print '\n[+]======[Iter %d - Try %d]==========' % (i, t)
+                    time.sleep(2)
+                    
+                    success, istzfail, _ = \
+                        self.engine.do_glitch_one(self.modname, gval, gdur, pdelay, self.logfn)
+                    
+                    # If slave thread failed, try again without rebooting
+                    if istzfail:
+                        print '[-]   Slave seemed to have failed in TZ'
+                        continue
+
+                    # Proceed to next iteration if we succeed
+                    if success:
+                        self.journal.mark_done(point, i)
+                        break
+
+                    # For unsuccessful round, recover the phone (see recovery.py)
+                    self.engine.recover()
 
 
 class TaskGlitchRsa(object):
@@ -861,110 +1694,345 @@ class TaskGlitchRsa(object):
         workloads.
     """
     TASK = config.TASK_TYPES['rsaauth']
+    PARAMS = 'P_GLITCH_RSA'
+    AXES = ('gval', 'gdur', 'pdelay')
     
-    def __init__(self, engine):
+    def __init__(self, engine, points=None):
         self.engine = engine
         self.cfg = engine.cfg
         self.params = unserialize(self.cfg.P_GLITCH_RSA)
+        self.points = points if points is not None else grid_points(self.params, self.AXES)
         self.modname = self.params['modname']
         self.logfn = self.params['logfn'] + self.modname + '.txt'
         self.engine.task = config.TASK_TYPES['rsaauth']
+        self.journal = engine.get_journal(self.TASK, self.modname)
     
     def run(self):
-        for gval in xrange_tuple(self.params, 'gval'):
-            for gdur in xrange_tuple(self.params, 'gdur'):
-                for pdelay in xrange_tuple(self.params, 'pdelay'):
-                    for i in xrange(self.params['nb_iter']):
-                        for t in xrange(self.params['nb_tries']):
-                            print '\n[+]======[Iter %d - Try %d]==========' % (i, t)
-                            time.sleep(2)
-                            
-                            success, istzfail, _ = \
-                                self.engine.do_glitch_one(self.modname, gval, gdur, pdelay, self.logfn)
-                            
-                            # If slave thread failed, try again without rebooting
-                            if istzfail:
-                                print '[-]   Slave seemed to have failed in TZ'
-                                continue
-    
-                            # Proceed to next iteration if we succeed
-                            if success:
-                                break
-    
-                            # For unsuccessful round, we'll reset the phone
-                            while not self.engine.reboot():
-                                print '[-]   Reboot failed. Try again!'
+        if config.SEARCH_ADAPTIVE:
+            return run_adaptive_sweep(self)
+        if self.engine.batch_size(self.modname) > 1:
+            return run_batch_sweep(self)
+        for point in self.points:
+            gval, gdur, pdelay = point
+            for i in xrange(self.params['nb_iter']):
+                if self.journal.is_done(point, i):
+                    continue
+                if is_sampled(self, point):
+                    print '[-]   Point already sampled by earlier sessions. Skipping.'
+                    break
+                for t in xrange(self.params['nb_tries']):
+                    print '\n[+]======[Iter %d - Try %d]==========' % (i, t)
+                    time.sleep(2)
+                    
+                    success, istzfail, _ = \
+                        self.engine.do_glitch_one(self.modname, gval, gdur, pdelay, self.logfn)
+                    
+                    # If slave thread failed, try again without rebooting
+                    if istzfail:
+                        print '[-]   Slave seemed to have failed in TZ'
+                        continue
+
+                    # Proceed to next iteration if we succeed
+                    if success:
+                        self.journal.mark_done(point, i)
+                        break
+
+                    # For unsuccessful round, recover the phone (see recovery.py)
+                    self.engine.recover()
 
 
 class TaskGlitchExpt(object):
     """ Explore various parameter ranges to compare glitching rates.
     """
     TASK = config.TASK_TYPES['glitchexpt']
+    PARAMS = 'P_GLITCH_EXPT'
+    AXES = ('temp', 'gval', 'gdur', 'pdelay')
     NUM_ITER = 50
     
-    def __init__(self, engine):
+    def __init__(self, engine, points=None):
         self.engine = engine
         self.cfg = engine.cfg
         self.params = unserialize(self.cfg.P_GLITCH_EXPT)
+        self.points = points if points is not None else grid_points(self.params, self.AXES)
         self.modname = self.params['modname']
         self.logfn = self.params['logfn'] + self.modname + '.txt'
         self.engine.task = config.TASK_TYPES['glitchexpt']
+        self.journal = engine.get_journal(self.TASK, self.modname)
+    
+    def first_iter(self, point):
+        """ Number of iterations <point> starts from. The journal holds the
+            running number of iterations of a point. Samples taken at its
+            temperature by earlier sessions count too.
+        """
+        return max(self.journal.last(point) or 0,
+                   self.engine.get_cached_samples(self.modname, point[1:], min_temp=point[0])[1])
     
     def run(self):
-        for temp in xrange_tuple(self.params, 'temp'):
-            for gval in xrange_tuple(self.params, 'gval'):
-                for gdur in xrange_tuple(self.params, 'gdur'):
-                    for pdelay in xrange_tuple(self.params, 'pdelay'):
-                        i = 0
-                        while True:
-                            print '\n[+]======[n = %d]==========' % (i)
-                            time.sleep(2)
-                            
-                            success, istzfail, n = \
-                                self.engine.do_glitch_one(self.modname, gval, gdur, pdelay, self.logfn, min_temp=temp)
-                            
-                            # If slave thread failed, try again without rebooting
-                            if istzfail:
-                                print '[-]   Slave seemed to have failed in TZ'
-                                continue
-    
-                            # Proceed to next set of parameters
-                            i += n
-                            if i > self.NUM_ITER:
-                                break
-    
-                            # For unsuccessful round, we'll reset the phone
-                            while not self.engine.reboot():
-                                print '[-]   Reboot failed. Try again!'
+        size = self.engine.batch_size(self.modname)
+        if size > 1:
+            return self.run_batched(size)
+        for point in self.points:
+            temp, gval, gdur, pdelay = point
+            i = self.first_iter(point)
+            while i <= self.NUM_ITER:
+                print '\n[+]======[n = %d]==========' % (i)
+                time.sleep(2)
+                
+                success, istzfail, n = \
+                    self.engine.do_glitch_one(self.modname, gval, gdur, pdelay, self.logfn, min_temp=temp)
+                
+                # If slave thread failed, try again without rebooting
+                if istzfail:
+                    print '[-]   Slave seemed to have failed in TZ'
+                    continue
+
+                # Proceed to next set of parameters
+                i += n
+                self.journal.mark_done(point, i)
+                if i > self.NUM_ITER:
+                    break
+
+                # For unsuccessful round, recover the phone (see recovery.py).
+                # Otherwise the next round starts from a fresh boot.
+                if not success:
+                    self.engine.recover()
+                    continue
+                while not self.engine.reboot():
+                    print '[-]   Reboot failed. Try again!'
+    
+    def run_batched(self, size):
+        """ Glitch the points of each temperature <size> at a time, with a
+            single module load per round.
+        """
+        temps = []
+        groups = {}
+        for point in self.points:
+            if point[0] not in groups:
+                temps.append(point[0])
+            groups.setdefault(point[0], []).append(point)
+        
+        for temp in temps:
+            points = groups[temp]
+            for b in xrange(0, len(points), size):
+                batch = points[b:b + size]
+                iters = dict([(p, self.first_iter(p)) for p in batch])
+                pending = [p for p in batch if iters[p] <= self.NUM_ITER]
+                while pending:
+                    print '\n[+]======[temp = %d - Batch %d - n = %d]==========' % \
+                        (temp, b / size, min([iters[p] for p in pending]))
+                    time.sleep(2)
+                    
+                    success, istzfail, counts = \
+                        self.engine.do_glitch_batch(self.modname, [p[1:] for p in pending],
+                                                    self.logfn, min_temp=temp)
+                    
+                    # If slave thread failed, try again without rebooting
+                    if istzfail:
+                        print '[-]   Slave seemed to have failed in TZ'
+                        continue
+                    
+                    # Proceed to next set of parameters
+                    for point, n in zip(pending, counts):
+                        iters[point] += n
+                        self.journal.mark_done(point, iters[point])
+                    pending = [p for p in pending if iters[p] <= self.NUM_ITER]
+                    if not pending:
+                        break
+                    
+                    # For unsuccessful round, recover the phone (see
+                    # recovery.py). Otherwise the next round starts from a
+                    # fresh boot.
+                    if not success:
+                        self.engine.recover()
+                        continue
+                    while not self.engine.reboot():
+                        print '[-]   Reboot failed. Try again!'
+
+
 
+# =============================================================================
+# Adaptive search
+
+
+def run_adaptive_sweep(task):
+    """ Glitch the grid points of <task> picked by an AdaptiveSearch, for a
+        budget of ADAPTIVE_BUDGET x (grid size x nb_iter) rounds.
+    """
+    engine = task.engine
+    search = AdaptiveSearch(task.points)
+    store = engine.get_result_store(task.logfn)
+    if store is not None:
+        store.flush()
+        print '[+] Adaptive search: seeded with %d results' % \
+            search.seed_from_store(store.path, task.AXES)
+    
+    budget = max(1, int(config.ADAPTIVE_BUDGET * len(task.points) * task.params['nb_iter']))
+    for r in xrange(budget):
+        point = search.choose()
+        gval, gdur, pdelay = point
+        for t in xrange(task.params['nb_tries']):
+            print '\n[+]======[Round %d/%d - Try %d]==========' % (r, budget, t)
+            time.sleep(2)
+            
+            success, istzfail, _ = \
+                engine.do_glitch_one(task.modname, gval, gdur, pdelay, task.logfn)
+            
+            # If slave thread failed, try again without rebooting
+            if istzfail:
+                print '[-]   Slave seemed to have failed in TZ'
+                search.update_crash(point)
+                continue
+            
+            if success:
+                n, n_faults = engine.last_round
+                search.update(point, n, n_faults)
+                break
+            
+            # Only a round the glitch took down counts against the point: a
+            # failure before the glitch says nothing about it
+            if engine.last_glitched and engine.last_failure in (FAIL_KMSG, FAIL_TIMEOUT):
+                search.update_crash(point)
+            
+            # For unsuccessful round, recover the phone (see recovery.py)
+            engine.recover()
+    
+    print '\n[+] Adaptive search: most productive points'
+    for point, mean, trials, faults, crashes in search.top():
+        print '[-]   gval=0x%x gdur=%d pdelay=%d  yield=%.3f (%d/%d, %d crashes)' % \
+            (point + (mean, faults, trials, crashes))
+    return search
+
+
+# =============================================================================
+# Batch rounds
+
+
+def run_batch_sweep(task):
+    """ Glitch the grid points of <task> Engine.batch_size() at a time, with
+        a single module load per batch and iteration.
+    """
+    engine = task.engine
+    size = engine.batch_size(task.modname)
+    n_batches = (len(task.points) + size - 1) / size
+    for b in xrange(n_batches):
+        batch = task.points[b * size:(b + 1) * size]
+        for i in xrange(task.params['nb_iter']):
+            pending = [p for p in batch if not task.journal.is_done(p, i) and not is_sampled(task, p)]
+            for t in xrange(task.params['nb_tries']):
+                if not pending:
+                    break
+                print '\n[+]======[Batch %d/%d - Iter %d - Try %d]==========' % (b, n_batches, i, t)
+                time.sleep(2)
+                
+                success, istzfail, counts = \
+                    engine.do_glitch_batch(task.modname, pending, task.logfn)
+                
+                # If slave thread failed, try again without rebooting
+                if istzfail:
+                    print '[-]   Slave seemed to have failed in TZ'
+                    continue
+                
+                # Points with results are done, even if the device died on
+                # a later point of the batch
+                for point, n in zip(pending, counts):
+                    if n > 0:
+                        task.journal.mark_done(point, i)
+                pending = [p for p, n in zip(pending, counts) if n == 0]
+                if success:
+                    break
+                
+                # For unsuccessful round, recover the phone (see recovery.py)
+                engine.recover()
+
+
+def split_iter_results(results):
+    """ Group the results of a batch round by the (gval, gdur, pdelay) params
+        echoed in their ITER records.
+        @returns: {(gval, gdur, pdelay): [TzIterationResult]}
+    """
+    groups = {}
+    for r in results:
+        groups.setdefault((r.gvalue, r.gdelay, r.delaypre), []).append(r)
+    return groups
 
 
 # =============================================================================
 # Misc utils
 
 
-def dump_tz_iter_results(fn, thread_kproc, gvalue, gdelay, predelay):
+def dump_tz_iter_results(fn, thread_kproc, gvalue, gdelay, predelay, store=None):
+    """ Write out the results collected by <thread_kproc> to the text log <fn>
+        and, if given, to the columnar ResultStore <store>. With analysis
+        workers running, the analysis of the payloads goes to the analysis
+        stream of <fn> once the records are written.
+    """
     n = 0
     is_failtz = False
     results = []
-    with open(fn, 'a') as fh:
-        for iterRes in thread_kproc.iter_results:
-            if iterRes.is_failtz():
-                is_failtz = True
-                break
-            if iterRes.pdelay_stats is not None:
-                fh.write('0x%x,%d,%d,%s\n' % (gvalue, gdelay, predelay, iterRes.get_profile_str()))
-                n += 1
-                results.append(list(iterRes.pdelay_stats))
-                continue
-            if not iterRes.is_invalid():
-                fh.write('0x%x,%d,%d,%s\n' % (gvalue, gdelay, predelay, iterRes))
-                n += 1
-                continue
+    lines = []
+    jobs = []
+    for iterRes in thread_kproc.iter_results:
+        if iterRes.is_failtz():
+            is_failtz = True
+            break
+        if iterRes.pdelay_stats is not None:
+            if config.RESULT_LOG_TEXT:
+                lines.append('0x%x,%d,%d,%s\n' % (gvalue, gdelay, predelay, iterRes.get_profile_str()))
+            results.append(list(iterRes.pdelay_stats))
+        elif not iterRes.is_invalid():
+            if config.RESULT_LOG_TEXT and analysis.is_enabled():
+                line = '0x%x,%d,%d,%s' % (gvalue, gdelay, predelay, iterRes.get_record_str())
+                lines.append(line + '\n')
+                args = iterRes.get_analysis_args()
+                if args is not None:
+                    jobs.append((line.split('\n', 1)[0], args))
+            elif config.RESULT_LOG_TEXT:
+                lines.append('0x%x,%d,%d,%s\n' % (gvalue, gdelay, predelay, iterRes))
+        else:
+            continue
+        if store is not None:
+            store.append(iterRes, gvalue, gdelay, predelay, thread_kproc.dev_id)
+        n += 1
+    
+    if lines:
+        with open(fn, 'a') as fh:
+            fh.writelines(lines)
+    for header, args in jobs:
+        analysis.submit(analysis.stream_path(fn), header, analyze_payloads, args)
+    if store is not None:
+        store.flush()
     thread_kproc.iter_results  = []
     return n, is_failtz, results
 
 
+def record_boot_time(device_id, secs):
+    """ Add a boot time to the per-device boot time histogram kept under
+        DIR_SESSION.
+    """
+    fn = '%s/boot_times_%s.json' % (config.DIR_SESSION, device_id)
+    stats = {'samples': []}
+    if os.path.exists(fn):
+        with open(fn) as fh:
+            stats = json.load(fh)
+    samples = (stats['samples'] + [round(secs, 1)])[-1000:]
+    bins = {}
+    for t in samples:
+        b = int(t // config.BOOT_HIST_BIN) * config.BOOT_HIST_BIN
+        bins[b] = bins.get(b, 0) + 1
+    stats = {'samples': samples,
+             'bin_secs': config.BOOT_HIST_BIN,
+             'histogram': dict([(str(b), n) for b, n in bins.iteritems()]),
+             'median': float(np.median(samples)),
+             'p90': float(np.percentile(samples, 90))}
+    
+    utils.ensure_dir(config.DIR_SESSION)
+    with open(fn + '.tmp', 'w') as fh:
+        json.dump(stats, fh, indent=2, sort_keys=True)
+    os.rename(fn + '.tmp', fn)
+    print '[-]   Boot time: %.1fs (median %.1fs, p90 %.1fs over %d reboots)' % \
+        (secs, stats['median'], stats['p90'], len(samples))
+
+
 def unserialize(p):
     for k, v in p.iteritems():
         if isinstance(v, dict):
@@ -1012,9 +2080,32 @@ def xrange_tuple(p, type):
     return r
 
 
+def is_sampled(task, point):
+    """ Whether the sessions on the device of <task> already ran its nb_iter
+        rounds at <point> (see samplecache.py).
+    """
+    return task.engine.get_cached_samples(task.modname, point)[0] >= task.params['nb_iter']
+
+
+def grid_points(p, axes):
+    """ Sweep grid of a task, as the list of parameter tuples in the order
+        of the nested loops over <axes>.
+    """
+    return list(itertools.product(*[xrange_tuple(p, a) for a in axes]))
+
+
+def shard_points(points, n_shards, k):
+    """ k-th of <n_shards> interleaved slices of the sweep grid, so that each
+        shard covers the whole parameter range.
+    """
+    return points[k::n_shards]
+
+
 def os_exec_subprocess(c_lst):
-    p = subprocess.Popen(c_lst, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return p.wait(), p.stdout.read(), p.stderr.read()
+    with tracing.span('os_exec_subprocess', 'exec', cmd=' '.join(c_lst)) as args:
+        p = subprocess.Popen(c_lst, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        args['status'] = p.wait()
+    return args['status'], p.stdout.read(), p.stderr.read()
 
 
 def os_exec_commands(cmd_str):
@@ -1026,14 +2117,16 @@ def os_exec_commands(cmd_str):
     """
     n_tries = 0
     while n_tries < 10:
-        status, output = commands.getstatusoutput(cmd_str)
+        with tracing.span('os_exec_commands', 'exec', cmd=cmd_str, retry=n_tries) as args:
+            status, output = commands.getstatusoutput(cmd_str)
+            args['status'] = status
         if not status:
             return output
         if not 'error: device not found' in output and \
            not 'error: protocol fault (no status)' in output:
             break
         n_tries += 1
-        time.sleep(5)
+        tracing.sleep(5)
 
         if n_tries == 10:
             print '[-] ****os_exec_commands:', status, output
@@ -1045,36 +2138,70 @@ def os_exec_commands(cmd_str):
     print '[-]       (%s)' % cmd_str
 
 
-def force_kill_os(pname):
-    _, cnt, _ = os_exec_subprocess(['pkill', '-c', '-9', '-f', pname])
-    cnt = cnt.rstrip()
-    if cnt and cnt.isdigit():
-        if int(cnt) == 0:
-            print '[-]   force_kill_os: FAILED: Did not kill process <%s>' % pname
-        elif int(cnt) > 1:
-            print '[-]   force_kill_os: FAILED: Kill more than 1 instance of <%s>: %d' % (pname, int(cnt))
-    else:
-        print '[-]   force_kill_os: ERROR: Unexpected output:', cnt
+def adb_exec_cmd_session(device_id, cmd_str, adb_proc='adb', timeout=config.ADB_SESSION_TIMEOUT):
+    """ Execute a command over a persistent root shell session (see
+        adbsession.py). Unlike the one-shot path, the exit status of the
+        command within the device is returned.
+    
+    @returns:
+        (status, output, is_timeout). <status> is None if the command did not
+        complete.
+    """
+    n_tries = 0
+    while n_tries < 10:
+        with tracing.span('adb_session', 'adb', cmd=cmd_str, retry=n_tries) as args:
+            ret, output, is_timeout = \
+                adbsession.adb_session_exec(adb_proc, device_id, cmd_str, timeout)
+            args.update(status=ret, is_timeout=is_timeout)
+        if is_timeout or ret is not None:
+            break
+        if not 'error: device not found' in output and \
+           not 'daemon not running' in output and \
+           not 'error: protocol fault (no status)' in output:
+            break
+        n_tries += 1
+        tracing.sleep(5)
+        
+        if n_tries == 10:
+            print '[-] ***adb_exec_cmd_session: <%s>' % output
+            print '[-]      (%s)' % cmd_str
+    
+    if n_tries == 10:
+        print '[-]   adb_exec_cmd_session: phone likely offline. Exiting.'
+        exit()
+    return ret, output.strip(), is_timeout
+
+
+def is_adb_offline(output):
+    """ Whether the output of an adb command says the device was not reached.
+    """
+    return 'error: device not found' in output or \
+           'daemon not running' in output or \
+           'error: protocol fault (no status)' in output
 
 
 def adb_exec_cmd_one(device_id, cmd_str, adb_proc='adb'):
+    if config.ADB_USE_SESSION:
+        ret, output, _ = adb_exec_cmd_session(device_id, cmd_str, adb_proc)
+        return ret, output
+    
     if 'echo' in cmd_str:
         full_cmd = '%s -s %s shell su -c \"%s\"' % (adb_proc, device_id, cmd_str)
         return 0, os_exec_commands(full_cmd)
 
     n_tries = 0
     while n_tries < 10:
-        ret, s_out, s_err = \
-            os_exec_subprocess([adb_proc, '-s', device_id, 'shell', 'su', \
-                                '-c', '\"%s\"' % cmd_str])
+        with tracing.span('adb_exec_cmd_one', 'adb', cmd=cmd_str, retry=n_tries) as args:
+            ret, s_out, s_err = \
+                os_exec_subprocess([adb_proc, '-s', device_id, 'shell', 'su', \
+                                    '-c', '\"%s\"' % cmd_str])
+            args['status'] = ret
         
         output = s_err if not s_out else s_out
-        if not 'error: device not found' in output and \
-           not 'daemon not running' in output and \
-           not 'error: protocol fault (no status)' in output:
+        if not is_adb_offline(output):
             break
         n_tries += 1
-        time.sleep(5)
+        tracing.sleep(5)
 
         if n_tries == 10:
             print '[-] ***adb_exec_cmd_one: <%s> <%s> <%s>' % (output, s_out, s_err)
@@ -1087,6 +2214,66 @@ def adb_exec_cmd_one(device_id, cmd_str, adb_proc='adb'):
     return ret, output.strip()
 
 
+def adb_exec_script(device_id, script_lines, adb_proc='adb'):
+    """ Run a multi-line shell script as root within one adb round trip.
+    
+    Without a shell session, the script is escaped so that it survives the
+    double quotes of "su -c" on the device.
+    
+    @returns:
+        (status, output)
+    """
+    script = '\n'.join(script_lines)
+    if config.ADB_USE_SESSION:
+        return adb_exec_cmd_one(device_id, script, adb_proc)
+    
+    for c in '\\"$`':
+        script = script.replace(c, '\\' + c)
+    ret, s_out, s_err = \
+        os_exec_subprocess([adb_proc, '-s', device_id, 'shell', 'su', \
+                            '-c', '\"%s\"' % script])
+    output = s_err if not s_out else s_out
+    return ret, output.strip()
+
+
+def adb_push_file(device_id, local_fn, remote_fn, adb_proc='adb'):
+    ret, s_out, s_err = \
+        os_exec_subprocess([adb_proc, '-s', device_id, 'push', local_fn, remote_fn])
+    if ret:
+        print '[-]   adb_push_file: FAILED: status: %d (%s)' % (ret, (s_err or s_out).strip())
+        print '[-]       (%s -> %s)' % (local_fn, remote_fn)
+        return False
+    return True
+
+
+# Tag of the per-command status lines printed by compiled command scripts
+SCRIPT_STATUS_TAG = '@@STATUS,'
+
+
+def compile_cmd_script(cmd_lst_str):
+    """ Compile a list of commands into one shell script which reports the
+        exit status of each command, e.g. "@@STATUS,3,1".
+    """
+    lines = ['#!/system/bin/sh']
+    for i, c in enumerate(cmd_lst_str):
+        lines.append(c)
+        lines.append('echo %s%d,$?' % (SCRIPT_STATUS_TAG, i))
+    return '\n'.join(lines) + '\n'
+
+
+def parse_cmd_script_status(output, cmd_lst_str):
+    statuses = [None] * len(cmd_lst_str)
+    for line in output.splitlines():
+        if not line.startswith(SCRIPT_STATUS_TAG):
+            continue
+        vals = line[len(SCRIPT_STATUS_TAG):].strip().split(',')
+        if len(vals) == 2 and vals[0].isdigit() and vals[1].isdigit():
+            i = int(vals[0])
+            if i < len(statuses):
+                statuses[i] = int(vals[1])
+    return zip(cmd_lst_str, statuses)
+
+
 def adb_exec_cmd_many(cmd_lst_str, delay, adb_proc, device_id):
     is_error = True
     while is_error:
@@ -1119,41 +2306,49 @@ def hex2bin(s):
 
 
 def get_bitflip_stats(new):
-    mod_orig = """\
-c44dc735f6682a261a0b8545a62dd13df4c646a5ede482cef858925baa1811fa0284766b3d1d2b4
-d6893df4d9c045efe3e84d8c5d03631b25420f1231d8211e2322eb7eb524da6c1e8fb4c3ae4a8f5
-ca13d1e0591f5c64e8e711b3726215cec59ed0ebc6bb042b917d44528887915fdf764df691d183e
-16f31ba1ed94c84b476e74b488463e85551022021763af35a64ddf105c1530ef3fcf7e54233e5d3
-a4747bbb17328a63e6e3384ac25ee80054bd566855e2eb59a2fd168d3643e44851acf0d118fb03c
-73ebc099b4add59c39367d6c91f498d8d607af2e57cc73e3b5718435a81123f080267726a2a9c1c
-c94b9c6bb6817427b85d8c670f9a53a777511b
-"""
-    ori = hex2bin(mod_orig.replace('\n', ''))
+    """ Primality and bit flips of a faulty modulus, rendered for the logs.
+    """
     new = hex2bin(new)
-    s = '\t\t\tPRIME,' + str(pyprimes.isprime(int(hexlify(new), 16))) + '\n'
-    for i in xrange(len(ori)):
-        c1 = ord(ori[i])
-        c2 = ord(new[i])
-        bf = c1 ^ c2
-        if bf:
-            s += '\t\t\tBF,'
-            s += '%d,%x,%x,%x,%d\n' % (i, c1, c2, bf, bin(bf).count('1'))
-    return s[:-1]
+    s = '\t\t\tPRIME,' + str(pyprimes.isprime(int(hexlify(new), 16)))
+    engine = bitflip.MODULUS_ENGINE
+    flips = bitflip.render_bitflips(engine.analyze(*engine.to_batch([new])))
+    return s + '\n' + flips if flips else s
+
+
+def analyze_failmod(task, failmod):
+    """ Analysis lines of a faulty modulus, as appended to its log record.
+    """
+    if task == config.TASK_TYPES['rsaauth'] and not '00000000' in failmod:
+        return '\n' + get_bitflip_stats(failmod)
+    return ''
+
+
+def analyze_expttest(task, expttest):
+    """ Analysis lines of a faulty workload output, as appended to its log
+        record.
+    """
+    s = ''
+    if task == config.TASK_TYPES['rsaauth'] or task == config.TASK_TYPES['glitchexpt']:
+        s = s + '\n' + get_bitflip_stats(expttest)
+    if task == config.TASK_TYPES['glitchprof']:
+        s = s + '\n' + get_expt_stats_memcpy(expttest)
+    return s
+
+
+def analyze_payloads(task, failmod, expttest):
+    """ Host-side analysis of the payloads of one result (run by the analysis
+        workers, see analysis.py).
+    """
+    s = ''
+    if failmod:
+        s = s + analyze_failmod(task, failmod)
+    if expttest:
+        s = s + analyze_expttest(task, expttest)
+    return s[1:]
 
 
 def get_expt_stats_memcpy(new):
     """ memcpy workload
     """
-    BUFLEN = 0x1000
-    print new
-    new = hex2bin(new)
-    s = ''
-    for i in xrange(BUFLEN):
-        c1 = i % 256
-        c2 = ord(new[i])
-        bf = c1 ^ c2
-        if bf:
-            s += '\t\t\tBF,'
-            s += '%d,%x,%x,%x,%d\n' % (i, c1, c2, bf, bin(bf).count('1'))
-    return s[:-1]
-        
\ No newline at end of file
+    engine = bitflip.MEMCPY_ENGINE
+    return bitflip.render_bitflips(engine.analyze(*engine.to_batch([hex2bin(new)])))
@@ -0,0 +1,119 @@
+import os
+import zlib
+import threading
+
+# local
+import utils
+
+
+# =============================================================================
+# Durable progress journal of parameter sweeps
+#
+# One line per completed (point, iteration), appended and fsync'ed as soon as
+# the iteration is done:
+#
+#   <axis 0>,<axis 1>,...,<iteration> <crc32>
+#
+# The pdelay search journals its bracket the same way, as the point
+# (lo, hi, rounds so far) of each iteration.
+#
+# A line that fails its checksum (torn write on crash/power loss) ends the
+# journal and is cut off when it is reopened.
+
+class SweepJournal(object):
+    """ Set of completed (point, iteration) pairs of a sweep, persisted to
+        <path>. With <path> None the journal is kept in memory only.
+    """
+    def __init__(self, path=None, fresh=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+        self.fh = None
+        if path is None:
+            return
+
+        utils.ensure_dir(os.path.dirname(path) or '.')
+        if fresh and os.path.exists(path):
+            os.rename(path, path + '.old')
+        self._load()
+        self.fh = open(path, 'a')
+
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        off = 0
+        with open(self.path, 'r+') as fh:
+            for line in fh:
+                entry = self._decode(line)
+                if entry is None:
+                    print '[-]   Journal %s: dropping torn entry at offset %d' % (self.path, off)
+                    fh.truncate(off)
+                    break
+                point, it = entry
+                self.done.setdefault(point, set()).add(it)
+                off += len(line)
+        print '[+] Journal %s: %d points, %d iterations done' % \
+            (self.path, len(self.done), sum([len(v) for v in self.done.itervalues()]))
+
+
+    def _encode(self, point, it):
+        payload = ','.join([str(v) for v in point] + [str(it)])
+        return '%s %08x\n' % (payload, zlib.crc32(payload) & 0xffffffff)
+
+
+    def _decode(self, line):
+        """ @returns: (point, iteration) or None if the line is corrupted.
+        """
+        if not line.endswith('\n'):
+            return None
+        try:
+            payload, crc = line.split()
+            if int(crc, 16) != zlib.crc32(payload) & 0xffffffff:
+                return None
+            vals = [int(v) for v in payload.split(',')]
+        except ValueError:
+            return None
+        return tuple(vals[:-1]), vals[-1]
+
+
+    def is_done(self, point, it):
+        with self.lock:
+            return it in self.done.get(tuple(point), ())
+
+
+    def last(self, point):
+        """ Highest iteration recorded for <point>, or None.
+        """
+        with self.lock:
+            its = self.done.get(tuple(point))
+            return max(its) if its else None
+
+
+    def latest(self):
+        """ (point, iteration) of the highest iteration recorded, or None.
+        """
+        with self.lock:
+            entries = [(max(its), point) for point, its in self.done.iteritems() if its]
+            if not entries:
+                return None
+            it, point = max(entries)
+            return point, it
+
+
+    def mark_done(self, point, it):
+        point = tuple(point)
+        with self.lock:
+            self.done.setdefault(point, set()).add(it)
+            if self.fh is None:
+                return
+            self.fh.write(self._encode(point, it))
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+
+
+    def close(self):
+        with self.lock:
+            if self.fh is not None:
+                self.fh.close()
+                self.fh = None
@@ -0,0 +1,195 @@
+import sys
+import time
+
+
+# =============================================================================
+# Parser for the records printed by the glitching modules into /proc/kmsg
+#
+# A record is a comma-separated line whose second field is its type, e.g.:
+#   <6>[ 857.97] clkpeer: |---- ,ITER,01,0xd0,5,8000,39000
+#   <6>[ 857.97] clkpeer: | ,glitch,<ccnt>,<insn>,<scratch>
+#   <6>[ 857.97] clkpeer: | ,slave,PASS,<ccnt>,<insn>,<ret>,<scratch>
+#   <6>[ 857.97] clkpeer: | ,slave,EXPT_TEST,<chunk>,<hex>
+#
+# glitchmin prints its iteration header as "ITER-<n>,<gval>,..." instead; both
+# layouts are accepted. A module prints END_MARKER when it is done, which
+# closes the last iteration of the run:
+#   <6>[ 859.12] glitchmin: ------[ END ]------
+
+# slave record type => TzIterationResult method taking the remaining fields
+SLAVE_PAYLOAD_HANDLERS = {
+    'FAIL_RND':     'add_failrnd_stats',
+    'FAIL_MOD':     'add_failmod',
+    'FAIL_CT':      'add_failct',
+    'FAIL_RRND':    'add_failrrnd',
+    'FAIL_MODR':    'add_failmodr',
+    'PROFILE':      'add_pdelay_profile',
+    'EXPT_TEST':    'add_expttest',
+    }
+
+# slave record types that complete the slave stats of an iteration
+SLAVE_DONE = ('PASS', 'FAIL', 'DONE')
+
+# Printed by the modules on cleanup
+END_MARKER = '[ END ]'
+
+
+class KmsgParser(object):
+    """ Incremental, table-driven parser of glitch module records.
+
+    Each line is split once and dispatched on its record type. The current
+    iteration result is updated in place and handed to <on_result> once the
+    next ITER record (or finish()) closes it.
+    """
+    def __init__(self, new_result, on_result=None, on_end=None, verbose=False):
+        # Factory: new_result(gval, gdur, pdelay) -> TzIterationResult
+        self.new_result = new_result
+        self.on_result = on_result
+        self.on_end = on_end
+        self.verbose = verbose
+        self.curr = None
+        self.results = []
+
+        # Stats
+        self.n_lines = 0
+        self.n_records = 0
+        self.n_results = 0
+        self.n_ends = 0
+
+        self.dispatch = {
+            'ITER':     self._on_iter,
+            'glitch':   self._on_glitch,
+            'slave':    self._on_slave,
+            }
+        self.dispatch_slave = dict([(k, self._on_slave_done) for k in SLAVE_DONE])
+        self.dispatch_slave['TZFAIL'] = self._on_slave_tzfail
+        for k in SLAVE_PAYLOAD_HANDLERS:
+            self.dispatch_slave[k] = self._on_slave_payload
+
+
+    def _on_iter(self, vals, base=3):
+        self.finish()
+        self.curr = self.new_result(int(vals[base], 16), int(vals[base+1]), int(vals[base+2]))
+        if len(vals) > base+3 and vals[base+3].isdigit():
+            self.curr.add_temperature(int(vals[base+3]))
+
+    def _on_glitch(self, vals):
+        if self.curr is None or len(vals) < 3:
+            return
+        try:
+            self.curr.add_glitch_stats(int(vals[2]), int(vals[3]))
+            self.curr.add_stats_scratch_g(vals[4])
+        except IndexError:
+            print '  GLITCH--', ','.join(vals)
+
+    def _on_slave(self, vals):
+        if self.curr is None or len(vals) < 3:
+            return
+        handler = self.dispatch_slave.get(vals[2])
+        if handler is None:
+            raise Exception('Unexpected slave string:\n' + ','.join(vals))
+        handler(vals)
+
+    def _on_slave_done(self, vals):
+        is_pass = vals[2] == 'PASS'
+
+        # Bare "slave,PASS"/"slave,FAIL" records carry no stats (glitchmin)
+        if len(vals) < 7:
+            self.curr.add_slave_stats(0, 0, is_pass, 0)
+            return
+        self.curr.add_slave_stats(int(vals[3]), int(vals[4]), is_pass, int(vals[5], 16))
+        self.curr.add_stats_scratch_s(vals[6])
+
+    def _on_slave_tzfail(self, vals):
+        self.curr.set_failure()
+
+    def _on_slave_payload(self, vals):
+        getattr(self.curr, SLAVE_PAYLOAD_HANDLERS[vals[2]])(vals[3:])
+
+    def _on_end(self):
+        self.finish()
+        self.n_ends += 1
+        if self.on_end is not None:
+            self.on_end()
+
+
+    def feed(self, line):
+        """ Parse one kmsg line.
+        """
+        self.n_lines += 1
+        vals = line.rstrip().split(',')
+        if len(vals) < 2:
+            if END_MARKER in line:
+                self._on_end()
+            return
+
+        handler = self.dispatch.get(vals[1])
+        if handler is None:
+            if vals[1][:5] != 'ITER-':
+                return
+            handler = lambda v: self._on_iter(v, base=2)
+
+        self.n_records += 1
+        if self.verbose and (len(vals) < 3 or vals[2] != 'EXPT_TEST'):
+            print '  KMSG', vals[1:]
+        handler(vals)
+
+
+    def feed_lines(self, lines):
+        for line in lines:
+            self.feed(line)
+
+
+    def finish(self):
+        """ Close the current iteration result, if any.
+        """
+        if self.curr is None:
+            return
+        self.n_results += 1
+        if self.on_result is not None:
+            self.on_result(self.curr)
+        else:
+            self.results.append(self.curr)
+        self.curr = None
+
+
+    def reset(self):
+        """ Drop the pending iteration result and collected results.
+        """
+        self.curr = None
+        self.results = []
+
+
+    def replay(self, fn):
+        """ Parse a recorded kmsg file.
+
+        @returns:
+            (n_lines, elapsed secs) for this replay.
+        """
+        n_lines = self.n_lines
+        t_start = time.time()
+        with open(fn) as fh:
+            self.feed_lines(fh)
+        self.finish()
+        return self.n_lines - n_lines, time.time() - t_start
+
+
+
+# =============================================================================
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print "usage: python %s kmsg_file [task]" % sys.argv[0]
+        exit()
+
+    import config
+    from enginelib import TzIterationResult
+
+    task = config.TASK_TYPES[sys.argv[2]] if len(sys.argv) > 2 else None
+    parser = KmsgParser(lambda g, d, p: TzIterationResult(task, g, d, p))
+    n_lines, elapsed = parser.replay(sys.argv[1])
+
+    print '[+] Replayed %s' % sys.argv[1]
+    print '[-]   lines: %d  records: %d  results: %d  runs: %d' % \
+        (n_lines, parser.n_records, parser.n_results, parser.n_ends)
+    print '[-]   elapsed: %.3fs  (%.0f lines/s)' % \
+        (elapsed, n_lines / elapsed if elapsed else 0)
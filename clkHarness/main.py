@@ -4,9 +4,12 @@ import numpy as np
 # local
 import utils
 import config
+import tracing
+import analysis
 from enginelib import Engine
 from enginelib import TaskPdelayProfiling, TaskGlitchProfiling, TaskGlitchRsa, \
     TaskGlitchExpt
+from campaign import Campaign
 
 TASKS = [TaskPdelayProfiling, TaskGlitchProfiling, TaskGlitchRsa, TaskGlitchExpt]
 
@@ -14,8 +17,14 @@ TASKS = [TaskPdelayProfiling, TaskGlitchProfiling, TaskGlitchRsa, TaskGlitchExpt
 
 @click.command()
 @click.option('--task', default='', help="task (pdelayprof, glitchprof, rsaauth, glitchexpt)")
+@click.option('--devices', default='', help="comma-separated device ids to shard the sweep over")
+@click.option('--fresh', is_flag=True, help="discard the progress journal and restart the sweep, ignoring the samples of earlier sessions")
+@click.option('--adaptive', is_flag=True, help="adaptive search instead of the full grid (glitchprof, rsaauth)")
+@click.option('--trace', default='', help="write a Chrome trace (chrome://tracing) of the run to this file")
+@click.option('--resident', is_flag=True, help="load glitch modules once and trigger rounds through sysfs")
+@click.option('--batch', default=1, help="number of grid points glitched per module load (glitchprof, rsaauth, glitchexpt)")
 @click.argument('device', required=True)
-def main(device, task):
+def main(device, task, devices, fresh, adaptive, trace, resident, batch):
     
     # Parse DEVICE
     if not device in config.DEV_TYPES:
@@ -38,14 +47,43 @@ def main(device, task):
                 click.echo('TASK: %s\n' % config.TASK_TYPES[t.TASK])
                 task_ = t
     
+    if adaptive:
+        config.SEARCH_ADAPTIVE = True
+    if trace:
+        tracing.enable(trace)
+    if resident:
+        config.GLITCH_RESIDENT = True
+    config.GLITCH_BATCH = batch
+    if task:
+        analysis.start(config.ANALYSIS_WORKERS)
+    
+    # Shard the sweep over several devices of this type
+    if devices:
+        if not task or not hasattr(task_, 'AXES'):
+            click.echo('ERROR: --devices requires a sweep task (glitchprof, rsaauth, glitchexpt)')
+            return
+        Campaign(cfg_, task_, devices.split(','), fresh=fresh).run()
+        analysis.close()
+        tracing.close()
+        return
+    
     # main engine to perform the heavy lifting
     engine = Engine(cfg_)
+    engine.journal_fresh = fresh
     engine.reboot()
     if not task:
+        tracing.close()
         return
     
     # Perform task
-    task_(engine).run()
+    try:
+        with tracing.span(task, 'task', device=cfg_.DEVICE_ID):
+            task_(engine).run()
+    finally:
+        engine.report_timing()
+        engine.recovery.report()
+        analysis.close()
+        tracing.close()
 
 
 
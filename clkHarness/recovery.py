@@ -0,0 +1,197 @@
+import os
+import json
+import time
+
+# local
+import config
+import utils
+import tracing
+import adbsession
+from timing import ROUND
+
+
+# =============================================================================
+# Recovery of failed glitch rounds
+#
+# A failed round is classified by what went wrong (Engine.last_failure), and
+# the device is brought back with the cheapest action expected to fix it:
+#
+#   retry     drop the persistent adb session and run the round again
+#   rmmod     unload the glitch module (stuck or half-loaded)
+#   prologue  set up the glitching environment again
+#   rejoin    wait for a device that restarted on its own, then prologue
+#   reboot    reboot the device, the last resort of every failure
+#
+# If the round that follows fails again, the next action up is tried. Each
+# action keeps per-device counts of how often the round after it succeeded,
+# and how long it took, in DIR_SESSION/recovery_<device>.json. Actions are
+# ranked by expected secs to a good round, (secs + round secs) / P(success),
+# so that an action that rarely works on a device falls behind the reboot
+# and is no longer tried there.
+
+FAIL_KMSG = 'kmsg'              # kmsg monitor died
+FAIL_ENV = 'env'                # glitching environment lost
+FAIL_TEMP = 'temp'              # temperature unreadable
+FAIL_TIMEOUT = 'timeout'        # insmod (or trigger) timed out
+FAIL_INSMOD = 'insmod'          # module could not be loaded
+FAIL_NORESULT = 'noresult'      # round ran without valid results
+FAIL_CRASH = 'crash'            # device restarted, or is unreachable
+
+REBOOT = 'reboot'
+
+# failure => actions that may fix it, short of a reboot
+LADDERS = {
+    FAIL_KMSG:      ['retry', 'prologue'],
+    FAIL_ENV:       ['prologue'],
+    FAIL_TEMP:      ['retry', 'prologue'],
+    FAIL_TIMEOUT:   ['rmmod', 'prologue'],
+    FAIL_INSMOD:    ['rmmod', 'prologue'],
+    FAIL_NORESULT:  ['retry', 'rmmod'],
+    FAIL_CRASH:     ['rejoin'],
+    }
+
+
+class RecoveryScheduler(object):
+    """ Pick and run recovery actions after the failed rounds of <engine>, and
+        learn which ones work on its device.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.fn = '%s/recovery_%s.json' % (config.DIR_SESSION, engine.cfg.DEVICE_ID)
+
+        # {failure: {action: {'n': tries, 'ok': good rounds after, 'secs': total secs}}}
+        self.stats = {}
+        if os.path.exists(self.fn):
+            with open(self.fn) as fh:
+                self.stats = json.load(fh)
+
+        # Actions tried since the last good round or reboot, and the last
+        # one, (failure, action, secs), waiting for the outcome of a round
+        self.tried = set()
+        self.pending = None
+
+
+    def _stat(self, failure, action):
+        return self.stats.setdefault(failure, {}).setdefault(action, {'n': 0, 'ok': 0, 'secs': 0.})
+
+
+    def p_success(self, failure, action):
+        """ Chance that the round after <action> succeeds. Untried actions
+            start at 1, so that each gets a chance on the device. A reboot is
+            taken to always work.
+        """
+        if action == REBOOT:
+            return 1.
+        s = self.stats.get(failure, {}).get(action, {'n': 0, 'ok': 0})
+        return (s['ok'] + 1.) / (s['n'] + 1.)
+
+
+    def cost(self, action):
+        """ Mean secs of <action> over all failures, or its RECOVERY_COSTS
+            guess until it has run.
+        """
+        n = sum([s[action]['n'] for s in self.stats.itervalues() if action in s])
+        if n == 0:
+            return config.RECOVERY_COSTS[action]
+        return sum([s[action]['secs'] for s in self.stats.itervalues() if action in s]) / n
+
+
+    def round_secs(self):
+        rounds = self.engine.timer.durations.get(ROUND)
+        if not rounds:
+            return config.RECOVERY_ROUND_SECS
+        return sum(rounds) / len(rounds)
+
+
+    def expected_secs(self, failure, action):
+        return (self.cost(action) + self.round_secs()) / self.p_success(failure, action)
+
+
+    def ladder(self, failure):
+        """ Actions to try for <failure>, from the cheapest expected one up to
+            the reboot.
+        """
+        if not config.RECOVERY_LADDER:
+            return [REBOOT]
+        actions = [a for a in LADDERS.get(failure, []) if a not in self.tried] + [REBOOT]
+        actions.sort(key=lambda a: self.expected_secs(failure, a))
+        return actions[:actions.index(REBOOT) + 1]
+
+
+    def _record(self, failure, action, secs, is_ok):
+        s = self._stat(failure, action)
+        s['n'] += 1
+        s['ok'] += int(is_ok)
+        s['secs'] += secs
+        utils.ensure_dir(config.DIR_SESSION)
+        with open(self.fn + '.tmp', 'w') as fh:
+            json.dump(self.stats, fh, indent=2, sort_keys=True)
+        os.rename(self.fn + '.tmp', self.fn)
+
+
+    def _run(self, action, modname):
+        engine = self.engine
+        if action == 'retry':
+            adbsession.adb_session_close(engine.cfg.DEVICE_ID)
+            return True
+        if action == 'rmmod':
+            return modname is None or engine.unload_module(modname)
+        if action == 'prologue':
+            engine.setup_prologue_stage(delay=0.5)
+            return True
+        if action == 'rejoin':
+            return engine.rejoin()
+        while not engine.reboot():
+            print '[-]   Reboot failed. Try again!'
+        self.tried.clear()
+        return True
+
+
+    def recover(self, failure, modname=None):
+        """ Bring the device back after a round that failed with <failure>,
+            running glitch module <modname>.
+
+        @returns:
+            The action taken.
+        """
+        if failure != FAIL_CRASH and self.engine.has_restarted():
+            failure = FAIL_CRASH
+        for action in self.ladder(failure):
+            print '[+] Recovery: %s failure, trying %s' % (failure, action)
+            self.tried.add(action)
+            t_start = time.time()
+            with tracing.span('recover', 'recovery', failure=failure, action=action) as args:
+                is_done = self._run(action, modname)
+                args['done'] = is_done
+            secs = time.time() - t_start
+            if is_done:
+                self.pending = (failure, action, secs)
+                return action
+            print '[-]   Recovery: %s did not work' % action
+            self._record(failure, action, secs, False)
+
+
+    def on_round(self, success):
+        """ Credit the last recovery action with the outcome of the round that
+            followed it.
+        """
+        if self.pending is not None:
+            failure, action, secs = self.pending
+            self._record(failure, action, secs, success)
+            self.pending = None
+        if success:
+            self.tried.clear()
+
+
+    def report(self):
+        """ Print how the recovery actions fared on this device.
+        """
+        if not self.stats:
+            return
+        print '\n[+] Recovery (%s):' % self.engine.cfg.DEVICE_ID
+        print '[-]   %-10s %-10s %6s %6s %8s' % ('failure', 'action', 'n', 'ok', 'mean')
+        for failure in sorted(self.stats):
+            for action, s in sorted(self.stats[failure].iteritems()):
+                print '[-]   %-10s %-10s %6d %5.0f%% %7.1fs' % \
+                    (failure, action, s['n'], 100. * s['ok'] / max(s['n'], 1),
+                     s['secs'] / max(s['n'], 1))
@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import struct
+import threading
+from binascii import unhexlify
+
+# local
+import utils
+
+
+# =============================================================================
+# Columnar, append-only store of iteration results
+#
+# A store is a directory holding one raw little-endian file per column, plus a
+# side blob area for the variable-length payloads (moduli, scratch strings).
+# Column files can be memory-mapped directly as NumPy arrays:
+#
+#   <path>/meta.json
+#   <path>/<column>.col
+#   <path>/blobs.bin
+
+STORE_VERSION = 1
+
+# (name, numpy dtype, struct format)
+COLUMNS = [
+    ('gval',        '<u4', 'I'),
+    ('gdur',        '<u4', 'I'),
+    ('pdelay',      '<u4', 'I'),
+    ('temperature', '<i4', 'i'),
+    ('ccnt_g',      '<i8', 'q'),
+    ('insn_g',      '<i8', 'q'),
+    ('ccnt_s',      '<i8', 'q'),
+    ('insn_s',      '<i8', 'q'),
+    ('pass',        '<i1', 'b'),    # 1: PASS, 0: FAIL, -1: no slave stats
+    ('ret_val',     '<u8', 'Q'),
+    ('failtz',      '<u1', 'B'),
+    ('time',        '<f8', 'd'),
+    ('blob_off',    '<u8', 'Q'),
+    ('blob_len',    '<u4', 'I'),
+    ('dev',         '<u2', 'H'),    # index into meta.json "devices"
+    ]
+
+# Blob entry kinds: (name, is_hex). Hex payloads are stored as raw bytes.
+BLOB_KINDS = [
+    ('scratch_g',   False),
+    ('scratch_s',   False),
+    ('failrnd',     False),
+    ('failmod',     True),
+    ('failct',      True),
+    ('failrrnd',    False),
+    ('failmodr',    True),
+    ('expttest',    True),
+    ('pdelay',      False),
+    ('thermal',     False),
+    ]
+BLOB_KIND_IDS = dict([(k[0], i) for i, k in enumerate(BLOB_KINDS)])
+
+# Set on an entry kind when a hex payload could not be decoded
+BLOB_RAW_TEXT = 0x80
+
+BLOB_ENTRY_HDR = struct.Struct('<BI')
+
+
+def _encode_blob(entries):
+    """ [(kind name, str, is_raw)] -> blob bytes. Hex payloads are given as
+        hex text, or as raw bytes if <is_raw>.
+    """
+    out = []
+    for name, s, is_raw in entries:
+        if not s:
+            continue
+        kind = BLOB_KIND_IDS[name]
+        if BLOB_KINDS[kind][1] and not is_raw:
+            try:
+                s = unhexlify(s)
+            except TypeError:
+                kind |= BLOB_RAW_TEXT
+        out.append(BLOB_ENTRY_HDR.pack(kind, len(s)))
+        out.append(s)
+    return ''.join(out)
+
+
+def _decode_blob(blob):
+    """ blob bytes -> {kind name: str}. Hex payloads are returned as raw bytes.
+    """
+    entries = {}
+    off = 0
+    while off + BLOB_ENTRY_HDR.size <= len(blob):
+        kind, n = BLOB_ENTRY_HDR.unpack_from(blob, off)
+        off += BLOB_ENTRY_HDR.size
+        entries[BLOB_KINDS[kind & ~BLOB_RAW_TEXT][0]] = blob[off:off+n]
+        off += n
+    return entries
+
+
+def _payload_entry(res, name):
+    raw = res.get_payload_bytes(name)
+    if raw is None:
+        return (name, res.get_payload(name), False)
+    return (name, raw, True)
+
+
+def _result_blob_entries(res):
+    return [('scratch_g',   res.scratch_g, False),
+            ('scratch_s',   res.scratch_s, False),
+            ('failrnd',     res.failrnd_s, False),
+            _payload_entry(res, 'failmod'),
+            _payload_entry(res, 'failct'),
+            _payload_entry(res, 'failrrnd'),
+            _payload_entry(res, 'failmodr'),
+            _payload_entry(res, 'expttest'),
+            ('pdelay',      ','.join(res.pdelay_stats or []), False),
+            ('thermal',     res.thermal, False)]
+
+
+class ResultStore(object):
+    """ Append-only writer of iteration results into a columnar store.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        utils.ensure_dir(path)
+
+        # Stores created before a column was introduced keep their own schema
+        self.meta_fn = os.path.join(path, 'meta.json')
+        if os.path.exists(self.meta_fn):
+            with open(self.meta_fn) as fh:
+                self.meta = json.load(fh)
+        else:
+            self.meta = {'version': STORE_VERSION,
+                         'columns': [c[:2] for c in COLUMNS],
+                         'blob_kinds': [k[0] for k in BLOB_KINDS],
+                         'devices': []}
+            self._write_meta()
+        names = [c[0] for c in self.meta['columns']]
+        self.columns = [c for c in COLUMNS if c[0] in names]
+
+        self.n_rows = self._repair()
+        self.fhs = [open(self._col_fn(c[0]), 'ab') for c in self.columns]
+        self.fh_blob = open(os.path.join(path, 'blobs.bin'), 'ab')
+        self.blob_off = self.fh_blob.tell()
+        self.packers = [struct.Struct('<' + c[2]) for c in self.columns]
+
+
+    def _write_meta(self):
+        tmp_fn = self.meta_fn + '.tmp'
+        with open(tmp_fn, 'w') as fh:
+            json.dump(self.meta, fh, indent=2)
+        os.rename(tmp_fn, self.meta_fn)
+
+
+    def _col_fn(self, name):
+        return os.path.join(self.path, name + '.col')
+
+
+    def _repair(self):
+        """ Drop a partially written trailing row (e.g. after a crash).
+
+        @returns:
+            Number of complete rows.
+        """
+        sizes = []
+        for name, dtype, fmt in self.columns:
+            fn = self._col_fn(name)
+            size = os.path.getsize(fn) if os.path.exists(fn) else 0
+            sizes.append(size // struct.calcsize('<' + fmt))
+        n_rows = min(sizes)
+
+        blob_end = 0
+        for name, dtype, fmt in self.columns:
+            fn = self._col_fn(name)
+            if not os.path.exists(fn):
+                continue
+            itemsize = struct.calcsize('<' + fmt)
+            with open(fn, 'r+b') as fh:
+                fh.truncate(n_rows * itemsize)
+                if n_rows and name in ('blob_off', 'blob_len'):
+                    fh.seek((n_rows - 1) * itemsize)
+                    blob_end += struct.unpack('<' + fmt, fh.read(itemsize))[0]
+
+        blob_fn = os.path.join(self.path, 'blobs.bin')
+        if os.path.exists(blob_fn):
+            with open(blob_fn, 'r+b') as fh:
+                fh.truncate(blob_end)
+        return n_rows
+
+
+    def device_index(self, device_id):
+        """ Index of <device_id> in the "dev" column. Must hold the lock.
+        """
+        devices = self.meta.setdefault('devices', [])
+        if device_id not in devices:
+            devices.append(device_id)
+            self._write_meta()
+        return devices.index(device_id)
+
+
+    def append(self, res, gval, gdur, pdelay, device_id=None):
+        """ Append one TzIterationResult, tagged with the glitch params it was
+            collected under and the device it came from.
+        """
+        blob = _encode_blob(_result_blob_entries(res))
+        row = {'gval':          gval,
+               'gdur':          gdur,
+               'pdelay':        pdelay,
+               'temperature':   res.temperature,
+               'ccnt_g':        res.ccnt_g,
+               'insn_g':        res.insn_g,
+               'ccnt_s':        res.ccnt_s,
+               'insn_s':        res.insn_s,
+               'pass':          -1 if res.is_pass is None else int(res.is_pass),
+               'ret_val':       res.ret_val,
+               'failtz':        int(res.is_fail_tz),
+               'time':          time.time(),
+               'blob_len':      len(blob)}
+        with self.lock:
+            row['blob_off'] = self.blob_off
+            row['dev'] = self.device_index(device_id) if device_id is not None else 0
+            self.fh_blob.write(blob)
+            self.blob_off += len(blob)
+            for fh, packer, c in zip(self.fhs, self.packers, self.columns):
+                fh.write(packer.pack(row[c[0]]))
+            self.n_rows += 1
+
+
+    def flush(self):
+        with self.lock:
+            self.fh_blob.flush()
+            for fh in self.fhs:
+                fh.flush()
+
+
+    def close(self):
+        with self.lock:
+            self.fh_blob.close()
+            for fh in self.fhs:
+                fh.close()
+
+
+    def __len__(self):
+        return self.n_rows
+
+
+
+def load_columns(path):
+    """ Memory-map all columns of a store.
+
+    @returns:
+        {column name: numpy array}, all trimmed to the number of complete rows.
+    """
+    import numpy as np
+
+    with open(os.path.join(path, 'meta.json')) as fh:
+        meta = json.load(fh)
+
+    cols = {}
+    for name, dtype in meta['columns']:
+        fn = os.path.join(path, name + '.col')
+        n = os.path.getsize(fn) // np.dtype(dtype).itemsize if os.path.exists(fn) else 0
+        cols[name] = np.memmap(fn, dtype=dtype, mode='r', shape=(n,)) if n else \
+                     np.zeros(0, dtype=dtype)
+    n_rows = min([len(c) for c in cols.itervalues()])
+    return dict([(k, v[:n_rows]) for k, v in cols.iteritems()])
+
+
+def read_blob(path, off, length):
+    """ Read the payloads of one row, given its blob_off and blob_len.
+
+    @returns:
+        {kind name: str}. Hex payloads (moduli etc.) are returned as raw bytes.
+    """
+    with open(os.path.join(path, 'blobs.bin'), 'rb') as fh:
+        fh.seek(off)
+        return _decode_blob(fh.read(length))
@@ -0,0 +1,108 @@
+import os
+import threading
+
+# local
+import utils
+
+
+# =============================================================================
+# Cross-session index of the samples taken on a device
+#
+# Unlike the sweep journal, which tracks the progress of one sweep, the cache
+# keeps adding up what every session logged, per module and per (gval, gdur,
+# pdelay, temperature band). Sweeps look it up to skip the rounds that earlier
+# sessions already ran, so that a rerun after a config change only costs the
+# points that are new. One line is appended per point, round and band:
+#
+#   <modname> <gval>,<gdur>,<pdelay>,<band> <rounds>,<samples>,<faults>
+#
+# where <rounds> is 1 only on the line of a good round that has the most
+# samples, so that failed rounds, which get run again, are not counted.
+#
+# Temperature bands are <band_width> wide, in the unit of the temperature
+# node (millidegrees C).
+
+class SampleCache(object):
+    """ Sample counts and outcomes of a device, persisted to <path>.
+    """
+    def __init__(self, path, band_width):
+        self.path = path
+        self.band_width = band_width
+        self.lock = threading.Lock()
+
+        # {(modname, gval, gdur, pdelay, band): [rounds, samples, faults]}
+        self.counts = {}
+        utils.ensure_dir(os.path.dirname(path) or '.')
+        self._load()
+        self.fh = open(path, 'a')
+
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as fh:
+            for line in fh:
+                try:
+                    modname, key, vals = line.split()
+                    key = (modname,) + tuple([int(v) for v in key.split(',')])
+                    vals = [int(v) for v in vals.split(',')]
+                except ValueError:
+                    print '[-]   Sample cache %s: dropping torn entry' % self.path
+                    continue
+                self._add(key, vals)
+        print '[+] Sample cache %s: %d points, %d samples' % \
+            (self.path, len(self.counts), sum([c[1] for c in self.counts.itervalues()]))
+
+
+    def _add(self, key, vals):
+        c = self.counts.setdefault(key, [0, 0, 0])
+        for k in xrange(3):
+            c[k] += vals[k]
+
+
+    def band(self, temperature):
+        return int(temperature) // self.band_width
+
+
+    def add(self, modname, point, results, is_round=True):
+        """ Count the valid <results> of one round at <point>, up to the first
+            TZ failure, by temperature band. The round itself only counts if
+            <is_round> (it succeeded), once, in the band of most results.
+        """
+        bands = {}
+        for r in results:
+            if r.is_failtz():
+                break
+            if r.is_invalid():
+                continue
+            c = bands.setdefault(self.band(r.temperature), [0, 0, 0])
+            c[1] += 1
+            c[2] += int(r.is_pass is False)
+        if is_round and bands:
+            max(bands.itervalues(), key=lambda c: c[1])[0] = 1
+        with self.lock:
+            for band, vals in bands.iteritems():
+                key = (modname,) + tuple(point) + (band,)
+                self._add(key, vals)
+                self.fh.write('%s %s %s\n' % (modname, ','.join([str(v) for v in key[1:]]),
+                                              ','.join([str(v) for v in vals])))
+            self.fh.flush()
+
+
+    def get(self, modname, point, min_temp, max_temp):
+        """ @returns: [rounds, samples, faults] at <point> over the bands
+                      overlapping [min_temp, max_temp).
+        """
+        out = [0, 0, 0]
+        with self.lock:
+            for band in xrange(self.band(min_temp), self.band(max_temp - 1) + 1):
+                for k, v in enumerate(self.counts.get((modname,) + tuple(point) + (band,), ())):
+                    out[k] += v
+        return out
+
+
+    def close(self):
+        with self.lock:
+            if self.fh is not None:
+                self.fh.close()
+                self.fh = None
@@ -0,0 +1,689 @@
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import math
+import random
+import shutil
+import subprocess
+
+
+# =============================================================================
+# Simulated device backend
+#
+# Stands in for a phone so that the harness can be run (and its per-iteration
+# overhead measured) on a plain Linux box. Every tool the harness or the
+# device shell invokes is a small wrapper calling back into this file:
+#
+#   <root>/bin/<id>adb, <id>kproc      fake adb (put <root>/bin first in PATH)
+#   <root>/devbin/{su,insmod,...}      device-side tools (PATH of device shells)
+#   <root>/<id>/fs/...                 device file system (sysfs, /data, ...)
+#   <root>/<id>/kmsg.log               synthetic /proc/kmsg
+#   <root>/<id>/state.json             boot/crash state
+#   <root>/<id>/sim.json               latency, fault and crash model
+#
+# Absolute device paths (/sys, /proc, /d, /data) in shell commands and pushed
+# scripts are rewritten into the device's fs/ directory. "insmod" of a glitch
+# module emits the records the kernel module would print into kmsg.log, and
+# may crash the device, which then reboots on its own. Modules loaded with
+# PARAM_resident=1 get their parameters under /sys/module/<name>/parameters,
+# and writes to PARAM_trigger are rewritten into a "modtrigger" run. Batch
+# runs (PARAM_gvals/PARAM_gdelays/PARAM_delaypres lists) print the records of
+# each tuple in turn.
+#
+# Usage:
+#   python simdevice.py setup [device_id ...]
+#   python simdevice.py bench [--task glitchprof] [--points N] [--batch N] [device_id]
+
+SIM_ROOT = os.environ.get('CLK_SIM_ROOT', '/tmp/clksim')
+
+DEVICE_TOOLS = ['su', 'insmod', 'rmmod', 'lsmod', 'getprop', 'taskset', 'pgrep',
+                'stop', 'start', 'kmsg', 'modtrigger']
+
+DEFAULT_SIM = {
+    # Secs per adb round trip, per glitch module run (loaded by insmod, or
+    # triggered while resident), per extra tuple of a batch run and per boot
+    'latency':      {'adb': 0.01, 'insmod': 0.5, 'trigger': 0.3, 'batch': 0.3,
+                     'boot': 8.0},
+    'temperature':  37000,
+    'nb_iter':      10,
+    'p_tzfail':     0.01,
+
+    # P(fault) per iteration = p_max * sigmoid((gval - gval0) / width)
+    #                                * exp(-((pdelay - pdelay0) / pdelay_width)^2)
+    'fault':        {'p_max': 0.8, 'gval': 0xd0, 'width': 6.0,
+                     'pdelay': 86400, 'pdelay_width': 1500.0},
+
+    # P(crash) per module run = p_max * sigmoid((gval - gval0) / width)
+    'crash':        {'p_max': 0.5, 'gval': 0xe8, 'width': 6.0},
+
+    # pdelay profiling: timeouts grow by <slope> per pdelay unit away from
+    # the optimum, plus gaussian noise
+    'profile':      {'pdelay': 86400, 'slope': 20.0, 'noise': 40.0},
+    }
+
+DEFAULT_FS = {
+    '/sys/devices/virtual/thermal/thermal_zone0/temp':          None,
+    '/sys/module/msm_thermal/core_control/enabled':             '1',
+    '/proc/sys/kernel/randomize_va_space':                      '2',
+    '/proc/sys/kernel/random/boot_id':                          None,
+    }
+for _cpu in xrange(8):
+    DEFAULT_FS['/sys/devices/system/cpu/cpu%d/online' % _cpu] = '1'
+    DEFAULT_FS['/sys/devices/system/cpu/cpu%d/cpufreq/scaling_governor' % _cpu] = 'interactive'
+    DEFAULT_FS['/sys/devices/system/cpu/cpu%d/cpufreq/scaling_setspeed' % _cpu] = '0'
+    DEFAULT_FS['/sys/devices/system/cpu/cpu%d/cpufreq/scaling_cur_freq' % _cpu] = '960000'
+
+# Device paths living in the simulated file system
+PATH_RE = re.compile(r'(?<![\w./~$-])/(sys|proc|data|d)(?=/|\s|$|[\'";|&<>)])')
+
+# kmsg records are printed with the module name, so that they can be grepped
+KMSG_FMT = '<6>[%12.6f] %s: %s\n'
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+class SimDevice(object):
+    """ State of one simulated device, shared by all the processes of the
+        simulation through files under <root>/<device_id>.
+    """
+    def __init__(self, device_id, root=SIM_ROOT):
+        self.device_id = device_id
+        self.root = root
+        self.dir = os.path.join(root, device_id)
+        self.fs = os.path.join(self.dir, 'fs')
+        self.kmsg_fn = os.path.join(self.dir, 'kmsg.log')
+        self.state_fn = os.path.join(self.dir, 'state.json')
+        self.lock_fn = os.path.join(self.dir, 'lock')
+        self.sim = dict(DEFAULT_SIM)
+        sim_fn = os.path.join(self.dir, 'sim.json')
+        if os.path.exists(sim_fn):
+            with open(sim_fn) as fh:
+                self.sim.update(json.load(fh))
+
+
+    def exists(self):
+        return os.path.exists(self.state_fn)
+
+
+    def _locked(self, fn):
+        with open(self.lock_fn, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            return fn()
+
+
+    def state(self):
+        with open(self.state_fn) as fh:
+            return json.load(fh)
+
+
+    def _save_state(self, state):
+        with open(self.state_fn + '.tmp', 'w') as fh:
+            json.dump(state, fh)
+        os.rename(self.state_fn + '.tmp', self.state_fn)
+
+
+    def fs_path(self, path):
+        return self.fs + path
+
+
+    def rewrite(self, cmd_str):
+        """ Map a device command line onto the simulated device.
+        """
+        cmd_str = re.sub(r'(?:/system/bin/)?cat\s+/proc/kmsg', 'kmsg', cmd_str)
+        cmd_str = re.sub(r'/system/bin/(?=\w)', '', cmd_str)
+        cmd_str = re.sub(r'\|\s*grep\s', '| grep --line-buffered ', cmd_str)
+        cmd_str = re.sub(r'echo\s+\S+\s*>\s*(\S*PARAM_trigger)', r'modtrigger \1', cmd_str)
+        return PATH_RE.sub(lambda m: self.fs + '/' + m.group(1), cmd_str)
+
+
+    def env(self):
+        env = dict(os.environ)
+        env['PATH'] = os.path.join(self.root, 'devbin') + ':' + env.get('PATH', '')
+        env['CLK_SIM_ROOT'] = self.root
+        env['CLK_SIM_DEVICE'] = self.device_id
+        env['CLK_SIM_ADB_PID'] = str(os.getpid())
+        return env
+
+
+    # -------------------------------------------------------------------------
+    # Boot state
+
+    def create(self):
+        """ Lay out a freshly booted device.
+        """
+        if os.path.exists(self.dir):
+            shutil.rmtree(self.dir)
+        os.makedirs(os.path.join(self.fs, 'data/local/tmp'))
+        with open(os.path.join(self.dir, 'sim.json'), 'w') as fh:
+            json.dump(self.sim, fh, indent=2, sort_keys=True)
+        open(self.kmsg_fn, 'w').close()
+        _write_tool(self.fs_path('/data/local/tmp/dofever-sim'), 'dofever', with_path=True)
+        self._locked(lambda: self._boot(time.time() - self.sim['latency']['boot']))
+
+
+    def _boot(self, t_boot):
+        state = {'boot_id': '%032x' % random.getrandbits(128),
+                 't_boot': t_boot,
+                 'modules': []}
+        if os.path.isdir(self.fs_path('/sys/module')):
+            shutil.rmtree(self.fs_path('/sys/module'))
+        for path, val in DEFAULT_FS.iteritems():
+            if val is None:
+                val = state['boot_id'] if path.endswith('boot_id') else self.sim['temperature']
+            fn = self.fs_path(path)
+            if not os.path.isdir(os.path.dirname(fn)):
+                os.makedirs(os.path.dirname(fn))
+            with open(fn, 'w') as fh:
+                fh.write('%s\n' % val)
+        self._save_state(state)
+
+
+    def reboot(self):
+        self._locked(lambda: self._boot(time.time()))
+
+
+    def crash(self):
+        """ Kernel panic: the device goes away and reboots on its own.
+        """
+        self.reboot()
+
+
+    def is_reachable(self, state=None):
+        """ adbd comes up halfway through the boot.
+        """
+        state = state or self.state()
+        return time.time() >= state['t_boot'] + self.sim['latency']['boot'] / 2
+
+
+    def is_booted(self, state=None):
+        state = state or self.state()
+        return time.time() >= state['t_boot'] + self.sim['latency']['boot']
+
+
+    def uptime(self):
+        return time.time() - self.state()['t_boot']
+
+
+    # -------------------------------------------------------------------------
+    # Synthetic glitch module
+
+    def p_fault(self, gval, pdelay):
+        f = self.sim['fault']
+        return f['p_max'] * _sigmoid((gval - f['gval']) / f['width']) * \
+            math.exp(-((pdelay - f['pdelay']) / f['pdelay_width']) ** 2)
+
+
+    def p_crash(self, gval):
+        c = self.sim['crash']
+        return c['p_max'] * _sigmoid((gval - c['gval']) / c['width'])
+
+
+    def _slave_records(self, rng, workload, is_fault, pdelay):
+        ccnt, insn = rng.randint(90000, 110000), rng.randint(40000, 50000)
+        status = 'FAIL' if is_fault else 'PASS'
+        stats = '| ,slave,%s,%d,%d,%x,s%08x' % (status, ccnt, insn, 0 if is_fault else 1,
+                                                 rng.getrandbits(32))
+        if workload == 'profile':
+            p = self.sim['profile']
+            timeout_s = max(0, pdelay - p['pdelay']) * p['slope'] + abs(rng.gauss(0, p['noise']))
+            timeout_g = max(0, p['pdelay'] - pdelay) * p['slope'] + abs(rng.gauss(0, p['noise']))
+            return ['| ,slave,PROFILE,%d,%d,%d,%d' % (timeout_s * 3, timeout_s, timeout_g * 3, timeout_g),
+                    '| ,slave,DONE']
+
+        # Like the modules, only dump the output of a failed run: the
+        # modulus for the RSA workloads, the memcpy buffer otherwise
+        records = [stats]
+        if not is_fault:
+            return records
+        from bitflip import MOD_ORIG_HEX, MEMCPY_BUFLEN
+        if workload == 'rsa':
+            records += self._hex_records(rng, 'FAIL_MOD', MOD_ORIG_HEX.decode('hex'), 64)
+        elif workload == 'expt':
+            records += self._hex_records(rng, 'EXPT_TEST', MOD_ORIG_HEX.decode('hex'), 64)
+        else:
+            buf = bytearray([i % 256 for i in xrange(MEMCPY_BUFLEN)])
+            records += self._hex_records(rng, 'EXPT_TEST', buf, 256)
+        return records
+
+
+    def _hex_records(self, rng, tag, buf, chunk):
+        """ Hex dump of <buf> with one bit flipped, as <tag> records of
+            <chunk> hex digits.
+        """
+        buf = bytearray(buf)
+        buf[rng.randrange(len(buf))] ^= 1 << rng.randrange(8)
+        buf = str(buf).encode('hex')
+        return ['| ,slave,%s,%d,%s' % (tag, k / chunk, buf[k:k+chunk])
+                for k in xrange(0, len(buf), chunk)]
+
+
+    def run_module(self, modname, params, latency='insmod'):
+        """ One run of a glitch module: print its records into kmsg.
+
+        @returns:
+            False if the run crashed the device.
+        """
+        temp = int(params.get('PARAM_temp', '0'))
+        workload = 'glitch'
+        for w in ('prof', 'rsa', 'expt'):
+            if w in modname:
+                workload = 'profile' if w == 'prof' else w
+
+        # Batch lists left empty take the scalar param
+        cols = []
+        for name in ('PARAM_gval', 'PARAM_gdelay', 'PARAM_delaypre'):
+            vals = [int(v, 0) for v in params.get(name + 's', '').split(',') if v]
+            cols.append(vals or [int(params.get(name, '0'), 0)])
+        n_tuples = max([len(c) for c in cols])
+        tuples = zip(*[c * n_tuples if len(c) == 1 else c for c in cols])
+
+        rng = random.Random()
+        n_iter = self.sim['nb_iter']
+        t0 = self.uptime()
+        lines = []
+        crash_at = None
+        for k, (gval, gdur, pdelay) in enumerate(tuples):
+            if rng.random() < self.p_crash(gval):
+                crash_at = rng.randint(1, n_iter)
+            p_fault = self.p_fault(gval, pdelay)
+            for i in xrange(1, n_iter + 1):
+                t = t0 + (k * n_iter + i) * 1e-3
+                records = ['|---- ,ITER,%02d,0x%x,%d,%d,%d' % (i, gval, gdur, pdelay, temp),
+                           '| ,glitch,%d,%d,g%08x' % (rng.randint(90000, 110000),
+                                                      rng.randint(40000, 50000),
+                                                      rng.getrandbits(32))]
+                if i == crash_at:
+                    lines.extend([KMSG_FMT % (t, modname, r) for r in records])
+                    break
+                if rng.random() < self.sim['p_tzfail']:
+                    records.append('| ,slave,TZFAIL')
+                else:
+                    records.extend(self._slave_records(rng, workload, rng.random() < p_fault, pdelay))
+                lines.extend([KMSG_FMT % (t, modname, r) for r in records])
+            if crash_at is not None:
+                break
+        else:
+            lines.append(KMSG_FMT % (t0 + (len(tuples) * n_iter + 1) * 1e-3, modname,
+                                     '------[ END ]------'))
+
+        # Records are printed while the module runs, before insmod returns
+        with open(self.kmsg_fn, 'a') as fh:
+            fh.writelines(lines)
+        time.sleep(self.sim['latency'][latency] + (len(tuples) - 1) * self.sim['latency']['batch'])
+        if crash_at is not None:
+            self.crash()
+            return False
+        return True
+
+
+
+# =============================================================================
+# Tools
+
+def _write_tool(fn, tool, with_path=False):
+    """ Wrapper running <tool>. With <with_path>, the wrapper path is kept
+        in the command line (as args[0]), so that pkill -f finds it.
+    """
+    with open(fn, 'w') as fh:
+        fh.write('#!/bin/sh\nexec %s %s %s %s"$@"\n' % \
+            (sys.executable, os.path.abspath(__file__), tool, '"$0" ' if with_path else ''))
+    os.chmod(fn, 0755)
+
+
+def _device():
+    return SimDevice(os.environ['CLK_SIM_DEVICE'], os.environ.get('CLK_SIM_ROOT', SIM_ROOT))
+
+
+def _die_with_parent():
+    """ Have the device shell killed along with its adb process.
+    """
+    import ctypes
+    PR_SET_PDEATHSIG = 1
+    ctypes.CDLL(None).prctl(PR_SET_PDEATHSIG, 9)
+
+
+def _is_adb_alive():
+    """ Whether the adb process this device command runs under is still
+        there. Killing adb on the host ends its remote commands.
+    """
+    pid = int(os.environ.get('CLK_SIM_ADB_PID', os.getppid()))
+    try:
+        with open('/proc/%d/stat' % pid) as fh:
+            return fh.read().split(')')[-1].split()[0] != 'Z'
+    except IOError:
+        return False
+
+
+def _interactive_shell(dev):
+    """ Persistent shell: forward stdin to a device shell, rewriting paths,
+        until the device reboots.
+    """
+    import threading
+    boot_id = dev.state()['boot_id']
+    child = subprocess.Popen(['/bin/sh'], stdin=subprocess.PIPE, env=dev.env())
+
+    def watchdog():
+        while child.poll() is None:
+            if dev.state()['boot_id'] != boot_id:
+                child.kill()
+                os._exit(1)
+            time.sleep(0.2)
+    thrd = threading.Thread(target=watchdog)
+    thrd.daemon = True
+    thrd.start()
+
+    fd = sys.stdin.fileno()
+    while True:
+        data = os.read(fd, 65536)
+        if not data:
+            break
+        time.sleep(dev.sim['latency']['adb'])
+        try:
+            child.stdin.write(dev.rewrite(data))
+            child.stdin.flush()
+        except IOError:
+            break
+    child.stdin.close()
+    return child.wait()
+
+
+def tool_adb(args):
+    device_id = None
+    if args[:1] == ['-s']:
+        device_id, args = args[1], args[2:]
+    cmd = args[0] if args else ''
+
+    if cmd == 'devices':
+        print 'List of devices attached'
+        for d in sorted(os.listdir(SIM_ROOT)):
+            dev = SimDevice(d)
+            if dev.exists() and dev.is_reachable():
+                print '%s\tdevice' % d
+        return 0
+
+    dev = SimDevice(device_id)
+    if not dev.exists():
+        print 'error: device not found'
+        return 1
+    time.sleep(dev.sim['latency']['adb'])
+
+    if cmd == 'reboot':
+        dev.reboot()
+        return 0
+    if cmd == 'wait-for-device':
+        while not dev.is_reachable():
+            time.sleep(0.1)
+        return 0
+    if not dev.is_reachable():
+        print 'error: device not found'
+        return 1
+    if cmd == 'get-state':
+        print 'device'
+        return 0
+
+    if cmd == 'push':
+        with open(args[1], 'rb') as fh:
+            data = fh.read()
+        if '\0' not in data:
+            data = dev.rewrite(data)
+        with open(dev.fs_path(args[2]), 'wb') as fh:
+            fh.write(data)
+        print '%d KB/s (%d bytes in 0.001s)' % (len(data) / 1024, len(data))
+        return 0
+
+    if cmd == 'shell':
+        if args[1:] in ([], ['su']):
+            return _interactive_shell(dev)
+        return subprocess.call(['/bin/sh', '-c', dev.rewrite(' '.join(args[1:]))], env=dev.env(),
+                               preexec_fn=_die_with_parent)
+
+    print 'error: unknown command %s' % cmd
+    return 1
+
+
+def tool_su(args):
+    _die_with_parent()
+    if args[:1] == ['-c']:
+        os.execv('/bin/sh', ['sh', '-c', ' '.join(args[1:])])
+    os.execv('/bin/sh', ['sh'])
+
+
+def tool_insmod(args):
+    dev = _device()
+    modname = os.path.basename(args[0]).rsplit('.ko', 1)[0]
+    params = dict([a.split('=', 1) for a in args[1:] if '=' in a])
+    is_resident = params.pop('PARAM_resident', '0') != '0'
+    if not params or is_resident:
+        state = dev.state()
+        if modname in state['modules']:
+            print 'insmod: init_module \'%s\' failed (File exists)' % args[0]
+            return 1
+        state['modules'].append(modname)
+        dev._save_state(state)
+        if is_resident:
+            param_dir = dev.fs_path('/sys/module/%s/parameters' % modname)
+            os.makedirs(param_dir)
+            for p in ('PARAM_gval', 'PARAM_gdelay', 'PARAM_delaypre', 'PARAM_temp',
+                      'PARAM_trigger'):
+                with open(os.path.join(param_dir, p), 'w') as fh:
+                    fh.write('0\n')
+            for p in ('PARAM_gvals', 'PARAM_gdelays', 'PARAM_delaypres'):
+                with open(os.path.join(param_dir, p), 'w') as fh:
+                    fh.write('\n')
+        return 0
+    # A crash takes the shell down with the device (see _interactive_shell)
+    return 0 if dev.run_module(modname, params) else 1
+
+
+def tool_rmmod(args):
+    dev = _device()
+    state = dev.state()
+    if args[0] not in state['modules']:
+        print 'rmmod: delete_module \'%s\' failed (No such file or directory)' % args[0]
+        return 1
+    state['modules'].remove(args[0])
+    dev._save_state(state)
+    if os.path.isdir(dev.fs_path('/sys/module/' + args[0])):
+        shutil.rmtree(dev.fs_path('/sys/module/' + args[0]))
+    return 0
+
+
+def tool_modtrigger(args):
+    """ Write to PARAM_trigger of a resident module: one run with the
+        parameters found next to it.
+    """
+    dev = _device()
+    param_dir = os.path.dirname(os.path.abspath(args[0]))
+    if not os.path.isdir(param_dir):
+        print 'sh: can\'t create %s: No such file or directory' % args[0]
+        return 1
+    modname = os.path.basename(os.path.dirname(param_dir))
+    params = {}
+    for p in os.listdir(param_dir):
+        with open(os.path.join(param_dir, p)) as fh:
+            params[p] = fh.read().strip()
+    return 0 if dev.run_module(modname, params, latency='trigger') else 1
+
+
+def tool_lsmod(args):
+    for m in _device().state()['modules']:
+        print '%s 16384 0 - Live 0x0000000000000000' % m
+    return 0
+
+
+def tool_getprop(args):
+    dev = _device()
+    if args == ['sys.boot_completed']:
+        print '1' if dev.is_booted() else ''
+    elif args == ['init.svc.bootanim']:
+        print 'stopped' if dev.is_booted() else 'running'
+    else:
+        print ''
+    return 0
+
+
+def tool_taskset(args):
+    if args[:1] == ['-ap']:
+        pid = args[-1]
+        if len(args) == 3:
+            print "pid %s's current affinity mask: ff" % pid
+            print "pid %s's new affinity mask: %s" % (pid, args[1])
+        else:
+            print "pid %s's current affinity mask: 1" % pid
+        return 0
+    os.execvp(args[1], args[1:])
+
+
+def tool_pgrep(args):
+    print 1234
+    return 0
+
+
+def tool_kmsg(args):
+    """ Follow kmsg from its current end until the device reboots.
+    """
+    dev = _device()
+    boot_id = dev.state()['boot_id']
+    t_check = 0
+    with open(dev.kmsg_fn) as fh:
+        fh.seek(0, 2)
+        while True:
+            line = fh.readline()
+            if line:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+                continue
+            if time.time() - t_check > 0.2:
+                if dev.state()['boot_id'] != boot_id or not _is_adb_alive():
+                    return 1
+                t_check = time.time()
+            time.sleep(0.02)
+
+
+def tool_dofever(args):
+    dev = _device()
+    boot_id = dev.state()['boot_id']
+    while dev.state()['boot_id'] == boot_id:
+        time.sleep(1)
+    return 0
+
+
+TOOLS = {
+    'adb':      tool_adb,
+    'su':       tool_su,
+    'insmod':   tool_insmod,
+    'rmmod':    tool_rmmod,
+    'modtrigger': tool_modtrigger,
+    'lsmod':    tool_lsmod,
+    'getprop':  tool_getprop,
+    'taskset':  tool_taskset,
+    'pgrep':    tool_pgrep,
+    'stop':     lambda args: 0,
+    'start':    lambda args: 0,
+    'kmsg':     tool_kmsg,
+    'dofever':  tool_dofever,
+    }
+
+
+
+# =============================================================================
+# Setup and benchmark
+
+def setup(device_ids, root=SIM_ROOT):
+    """ Create the simulated devices and tools.
+
+    @returns:
+        Directory to put first in PATH.
+    """
+    bin_dir = os.path.join(root, 'bin')
+    devbin_dir = os.path.join(root, 'devbin')
+    for d in (bin_dir, devbin_dir):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+    for tool in DEVICE_TOOLS:
+        _write_tool(os.path.join(devbin_dir, tool), tool)
+    for device_id in device_ids:
+        _write_tool(os.path.join(bin_dir, device_id + 'adb'), 'adb')
+        _write_tool(os.path.join(bin_dir, device_id + 'kproc'), 'adb')
+        SimDevice(device_id, root).create()
+    return bin_dir
+
+
+def bench(task_name, device_id, nb_points):
+    """ Run a task end to end against a simulated device.
+    """
+    import config
+    import utils
+    from enginelib import Engine, TaskPdelayProfiling, TaskGlitchProfiling, \
+        TaskGlitchRsa, TaskGlitchExpt, grid_points, unserialize
+    import copy
+
+    import analysis
+    analysis.start(config.ANALYSIS_WORKERS)
+    bin_dir = setup([device_id])
+    os.environ['PATH'] = bin_dir + ':' + os.environ.get('PATH', '')
+    utils.ensure_dir(config.DIR_LOG)
+    utils.ensure_dir(config.DIR_SESSION)
+
+    task_cls = [t for t in (TaskPdelayProfiling, TaskGlitchProfiling, TaskGlitchRsa, TaskGlitchExpt)
+                if config.TASK_TYPES[t.TASK] == task_name][0]
+    cfg = config.device_config(config.ConfigSimulated, device_id)
+    engine = Engine(cfg)
+    engine.journal_fresh = True
+
+    t_start = time.time()
+    engine.reboot()
+    t_boot = time.time() - t_start
+    if hasattr(task_cls, 'AXES'):
+        points = grid_points(unserialize(copy.deepcopy(getattr(cfg, task_cls.PARAMS))), task_cls.AXES)
+        task = task_cls(engine, points=points[:nb_points])
+    else:
+        task = task_cls(engine)
+    task.run()
+
+    print '\n[+] Simulated %s on %s (first reboot: %.1fs)' % (task_name, device_id, t_boot)
+    engine.report_timing()
+    engine.recovery.report()
+    analysis.close()
+    if engine.fever is not None:
+        engine.fever.stop()
+    if engine.sampler is not None:
+        engine.sampler.stop()
+        engine.sampler.join(5)
+    import tracing
+    tracing.close()
+
+
+
+if __name__ == '__main__':
+    tool = sys.argv[1] if len(sys.argv) > 1 else ''
+    if tool in TOOLS:
+        sys.exit(TOOLS[tool](sys.argv[2:]) or 0)
+
+    if tool == 'setup':
+        bin_dir = setup(sys.argv[2:] or ['sim0'])
+        print 'export PATH=%s:$PATH' % bin_dir
+    elif tool == 'bench':
+        import optparse
+        op = optparse.OptionParser(usage='%prog bench [options] [device_id]')
+        op.add_option('--task', default='glitchprof')
+        op.add_option('--points', type='int', default=2)
+        op.add_option('--trace', default='')
+        op.add_option('--resident', action='store_true')
+        op.add_option('--batch', type='int', default=1)
+        opts, args = op.parse_args(sys.argv[2:])
+        import config
+        if opts.resident:
+            config.GLITCH_RESIDENT = True
+        config.GLITCH_BATCH = opts.batch
+        if opts.trace:
+            import tracing
+            tracing.enable(opts.trace)
+        bench(opts.task, args[0] if args else 'sim0', opts.points)
+    else:
+        print 'usage: python %s setup|bench|<tool> ...' % sys.argv[0]
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Fake adb processes find their device under CLK_SIM_ROOT
+SIM_ROOT = tempfile.mkdtemp(prefix='clksim_')
+os.environ['CLK_SIM_ROOT'] = SIM_ROOT
+
+# local
+import simdevice
+from adbsession import AdbShellSession, AdbSessionPool
+
+
+# =============================================================================
+# Persistent adb shell sessions, run against the fake adb of simdevice.py
+#
+#   python -m unittest test_adbsession
+
+DEVICE_ID = 'simtest'
+ADB_PROC = DEVICE_ID + 'adb'
+
+
+class AdbSessionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        bin_dir = simdevice.setup([DEVICE_ID], SIM_ROOT)
+        os.environ['PATH'] = bin_dir + ':' + os.environ.get('PATH', '')
+        cls.dev = simdevice.SimDevice(DEVICE_ID, SIM_ROOT)
+
+        # Quick reboots
+        cls.dev.sim['latency']['boot'] = 0.4
+        with open(os.path.join(cls.dev.dir, 'sim.json'), 'w') as fh:
+            json.dump(cls.dev.sim, fh)
+
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(SIM_ROOT, ignore_errors=True)
+
+
+    def setUp(self):
+        self.session = AdbShellSession(ADB_PROC, DEVICE_ID)
+
+
+    def tearDown(self):
+        self.session.close()
+
+
+    def test_framing(self):
+        # Output between the markers only, even if it looks like one
+        status, output, is_timeout = \
+            self.session.execute('echo a; echo __CLK_B_99__; (echo b >&2; exit 3)')
+        self.assertEqual((status, output, is_timeout), (3, 'a\n__CLK_B_99__\nb\n', False))
+
+        # The shell survives the exit of the command
+        self.assertEqual(self.session.execute('echo c'), (0, 'c\n', False))
+        self.assertEqual(self.session.n_reconnects, 1)
+
+
+    def test_timeout(self):
+        t_start = time.time()
+        status, _, is_timeout = self.session.execute('sleep 5', timeout=0.5)
+        self.assertTrue(time.time() - t_start < 2)
+        self.assertEqual((status, is_timeout), (None, True))
+
+        # The session went down with the command, the next one gets a new one
+        self.assertFalse(self.session.is_alive())
+        self.assertEqual(self.session.execute('echo ok'), (0, 'ok\n', False))
+        self.assertEqual(self.session.n_reconnects, 2)
+
+
+    def test_reconnect(self):
+        self.assertEqual(self.session.execute('echo 1'), (0, '1\n', False))
+
+        # adb process killed
+        self.session.proc.kill()
+        self.session.proc.wait()
+        self.assertEqual(self.session.execute('echo 2'), (0, '2\n', False))
+        self.assertEqual(self.session.n_reconnects, 2)
+
+        # Device rebooted under the session
+        self.dev.reboot()
+        time.sleep(self.dev.sim['latency']['boot'] + 0.2)
+        self.assertEqual(self.session.execute('echo 3'), (0, '3\n', False))
+        self.assertEqual(self.session.n_reconnects, 3)
+
+
+    def test_pool_max_sessions(self):
+        pool = AdbSessionPool(max_sessions=2)
+        results = []
+        n_sessions = []
+
+        def target(k):
+            results.append(pool.execute(ADB_PROC, DEVICE_ID, 'sleep 0.5; echo %d' % k))
+            n_sessions.append(len(pool.sessions[(ADB_PROC, DEVICE_ID)]))
+
+        thrds = [threading.Thread(target=target, args=(k,)) for k in xrange(4)]
+        for thrd in thrds:
+            thrd.start()
+        for thrd in thrds:
+            thrd.join()
+        pool.close()
+
+        self.assertEqual(sorted(results), [(0, '%d\n' % k, False) for k in xrange(4)])
+        self.assertEqual(max(n_sessions), 2)
+        self.assertEqual(len(pool.idle[(ADB_PROC, DEVICE_ID)]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import glob
+import shutil
+import tempfile
+import threading
+import subprocess
+import unittest
+
+
+# =============================================================================
+# End-to-end runs of the tasks against the simulated device (simdevice.py),
+# down to the analysis of the faulty outputs
+#
+#   python -m unittest test_simdevice
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Quick boots, faults at any grid point, and 2 rounds of glitchexpt per point
+BENCH = """\
+import sys
+sys.path.insert(0, %r)
+import simdevice, enginelib
+simdevice.DEFAULT_SIM['latency']['boot'] = 1.0
+simdevice.DEFAULT_SIM['fault'].update(p_max=0.5, gval=0, pdelay_width=1e9)
+enginelib.TaskGlitchExpt.NUM_ITER = 10
+simdevice.bench(%r, 'simtest', 1)
+"""
+
+
+class SimBenchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='clkbench_')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+    def bench(self, task, timeout=240):
+        """ Run the bench of <task> in a scratch directory.
+
+        @returns:
+            (exit status, output, analysis stream)
+        """
+        env = dict(os.environ)
+        env['CLK_SIM_ROOT'] = os.path.join(self.dir, 'sim')
+        proc = subprocess.Popen([sys.executable, '-c', BENCH % (HERE, task)], cwd=self.dir, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        timer = threading.Timer(timeout, proc.kill)
+        timer.start()
+        try:
+            output = proc.communicate()[0]
+        finally:
+            timer.cancel()
+
+        stream = ''
+        for fn in glob.glob(os.path.join(self.dir, 'log', '*.analysis.txt')):
+            with open(fn) as fh:
+                stream += fh.read()
+        return proc.returncode, output, stream
+
+
+    def test_glitchexpt(self):
+        # Faulty moduli: primality and bit flips against the modulus
+        status, output, stream = self.bench('glitchexpt')
+        self.assertEqual(status, 0, output[-2000:])
+        self.assertIn('PRIME,', stream)
+        self.assertIn('\t\t\tBF,', stream)
+        self.assertNotIn('ANALYSIS_ERROR', stream)
+
+
+    def test_glitchprof(self):
+        # Faulty memcpy buffers: bit flips only
+        status, output, stream = self.bench('glitchprof')
+        self.assertEqual(status, 0, output[-2000:])
+        self.assertIn('\t\t\tBF,', stream)
+        self.assertNotIn('PRIME,', stream)
+        self.assertNotIn('ANALYSIS_ERROR', stream)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,364 @@
+import time
+import threading
+import subprocess
+import collections
+
+# local
+import config
+
+
+# =============================================================================
+# Closed-loop temperature control
+#
+# While the temperature is regulated, dofever runs on the device and loads the
+# cores at the duty cycle (0-100%) found in FEVER_DUTY_FN; it is killed while
+# glitching. A PID loop on the host reads the CPU
+# temperature every TEMP_PID_PERIOD secs and rewrites the duty cycle, so that
+# the temperature is held around the middle of [min_temp, max_temp] instead of
+# being ramped up and cooled down before every glitch iteration.
+
+class PidController(object):
+    """ PID controller with output clamping and anti-windup.
+    """
+    def __init__(self, kp, ki, kd, out_min=0.0, out_max=100.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.out_min = out_min
+        self.out_max = out_max
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.err_prev = None
+
+    def update(self, err, dt):
+        """ @returns: controller output for error <err> after <dt> secs.
+        """
+        deriv = 0.0 if self.err_prev is None or dt <= 0 else (err - self.err_prev) / dt
+        self.err_prev = err
+        integral = self.integral + err * dt
+        out = self.kp * err + self.ki * integral + self.kd * deriv
+
+        # Only integrate while the output is not saturated (anti-windup)
+        if self.out_min < out < self.out_max:
+            self.integral = integral
+        return min(max(out, self.out_min), self.out_max)
+
+
+class FeverController(threading.Thread):
+    """ Background PID loop driving dofever through its duty cycle file. The
+        loop is paused (dofever killed) while glitching.
+    """
+    def __init__(self, engine):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.engine = engine
+        self.cfg = engine.cfg
+        self.pid = PidController(*config.TEMP_PID_GAINS)
+        self.cv = threading.Condition()
+        self.step_lock = threading.Lock()
+        self.setpoint = None
+        self.temp_range = None
+        self.is_paused = True
+        self.is_stopped = False
+        self.is_heater_up = False
+        self.is_rampup_cmds = False
+        self.is_boost = False
+        self.duty = None
+        self.temp = None
+        self.n_in_range = 0
+
+
+    def _adb(self, cmd_str):
+        return self.engine.run_adb_and_get_output(cmd_str, is_output_string=True)
+
+
+    def _set_duty(self, duty):
+        duty = int(round(duty))
+        if duty != self.duty:
+            self._adb('echo %d > %s' % (duty, config.FEVER_DUTY_FN))
+            self.duty = duty
+
+
+    def _set_rampup_cmds(self, is_on):
+        """ Extra cores that help heating up (CMD_PRE_POST_TEMPERATURE_RAMPUP)
+            are only brought online while hold() waits for the temperature:
+            they would fail the environment checks of the next iteration.
+        """
+        cmds = self.cfg.CMD_PRE_POST_TEMPERATURE_RAMPUP
+        if not cmds or self.is_rampup_cmds == is_on:
+            return
+        for c in cmds['PRE' if is_on else 'POST']:
+            self._adb(c)
+        self.is_rampup_cmds = is_on
+
+
+    def _heater_up(self):
+        """ Start dofever with a zero duty cycle.
+        """
+        if self.is_heater_up:
+            return
+        self._adb('pkill -9 -f %s' % self.cfg.FEVER_TOOL)
+        self.duty = None
+        self._set_duty(0)
+        self._adb('nohup %s %s >/dev/null 2>&1 &' % (self.cfg.FEVER_TOOL, config.FEVER_DUTY_FN))
+        self.is_heater_up = True
+
+
+    def _step(self, setpoint, dt):
+        self._heater_up()
+        self._set_rampup_cmds(self.is_boost)
+        temp = self.engine.get_temperature()
+        if temp:
+            self._set_duty(self.pid.update(setpoint - temp, dt))
+        return temp
+
+
+    def run(self):
+        t_prev = time.time()
+        while True:
+            with self.cv:
+                while self.is_paused and not self.is_stopped:
+                    self.cv.wait()
+                    t_prev = time.time()
+                if self.is_stopped:
+                    return
+                setpoint = self.setpoint
+                temp_min, temp_max = self.temp_range
+
+            with self.step_lock:
+                if self.is_paused:
+                    continue
+                t_now = time.time()
+                temp = self._step(setpoint, t_now - t_prev)
+                t_prev = t_now
+
+            with self.cv:
+                self.temp = temp
+                self.n_in_range = self.n_in_range + 1 if temp_min <= temp <= temp_max else 0
+                self.cv.notify_all()
+            time.sleep(config.TEMP_PID_PERIOD)
+
+
+    def resume(self, min_temp, max_temp, is_boost=False):
+        """ (Re-)enable the loop, holding the temperature in [min_temp, max_temp].
+        """
+        with self.cv:
+            self.is_boost = is_boost
+            if self.temp_range != (min_temp, max_temp):
+                self.pid.reset()
+                self.n_in_range = 0
+            self.temp_range = (min_temp, max_temp)
+            self.setpoint = (min_temp + max_temp) / 2.0
+            self.is_paused = False
+            self.cv.notify_all()
+
+        if not self.is_alive():
+            self.start()
+
+
+    def hold(self, min_temp, max_temp, timeout=config.TEMP_PID_TIMEOUT):
+        """ Resume the loop and wait until the temperature has settled in
+            [min_temp, max_temp].
+
+        @returns:
+            False if the temperature cannot be read or does not settle.
+        """
+        self.resume(min_temp, max_temp, is_boost=True)
+
+        deadline = time.time() + timeout
+        t_print = 0
+        with self.cv:
+            while self.n_in_range < config.TEMP_PID_SETTLE:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    print '[-]       Temperature did not settle: curr_temp=%s' % self.temp
+                    return False
+                self.cv.wait(min(remaining, config.TEMP_PID_PERIOD * 2))
+                if self.temp == 0:
+                    return False
+                if self.temp is not None and time.time() - t_print > 5:
+                    print '[-]       Regulating temperature: curr_temp=%d duty=%s%%' % \
+                        (self.temp, self.duty)
+                    t_print = time.time()
+        return True
+
+
+    def pause(self):
+        """ Stop heating while glitching. dofever is killed rather than left
+            idle, so that none of its threads run on the glitch cores. The PID
+            state is kept, so that the loop picks up where it was on the next
+            hold().
+        """
+        with self.cv:
+            if self.is_paused:
+                return
+            self.is_paused = True
+            self.n_in_range = 0
+
+        # Wait for a step in progress, so that it cannot turn the heater back on
+        with self.step_lock:
+            if self.is_heater_up:
+                self._adb('pkill -9 -f %s' % self.cfg.FEVER_TOOL)
+                self.is_heater_up = False
+            self._set_rampup_cmds(False)
+
+
+    def reset(self):
+        """ The device rebooted: the heater and the ramp-up commands are gone.
+        """
+        with self.cv:
+            self.is_paused = True
+            self.is_heater_up = False
+            self.is_rampup_cmds = False
+            self.duty = None
+            self.n_in_range = 0
+            self.pid.reset()
+
+
+    def stop(self):
+        with self.cv:
+            self.is_stopped = True
+            self.cv.notify_all()
+        if self.is_heater_up:
+            self._adb('pkill -9 -f %s' % self.cfg.FEVER_TOOL)
+            self.is_heater_up = False
+
+
+
+# =============================================================================
+# Background thermal telemetry
+#
+# A single long-lived "adb shell" runs a loop on the device that prints the
+# CPU temperature and SAMPLER_NODES every THERMAL_SAMPLE_PERIOD secs:
+#
+#   @@T,<temp>,<node 0>,<node 1>,...
+#
+# Samples are timestamped on arrival and kept in a ring buffer. The stream is
+# paused (its adb shell killed) during glitch rounds, so that it adds no load
+# to the device while the round is measured.
+
+class ThermalSampler(threading.Thread):
+    """ Stream temperature (and other sysfs nodes) samples of one device.
+    """
+    TAG = '@@T,'
+
+    def __init__(self, cfg, period=config.THERMAL_SAMPLE_PERIOD,
+                 size=config.THERMAL_RING_SIZE):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.cfg = cfg
+        self.nodes = [cfg.CPU_TEMP_LOG] + list(getattr(cfg, 'SAMPLER_NODES', []))
+        self.period = period
+        self.samples = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.proc = None
+        self.cv = threading.Condition()
+        self.is_stopped = False
+        self.is_paused = False
+        self.n_restarts = 0
+
+
+    def _script(self):
+        reads = ','.join(['$(cat %s 2>/dev/null)' % n for n in self.nodes])
+        return 'while true; do echo "%s%s"; sleep %s; done' % (self.TAG, reads, self.period)
+
+
+    def _parse(self, line):
+        """ @returns: (host time, [values]) or None. Unreadable nodes are None.
+        """
+        line = line.strip()
+        if not line.startswith(self.TAG):
+            return None
+        vals = line[len(self.TAG):].split(',')
+        if len(vals) != len(self.nodes):
+            return None
+        vals = [int(v) if v.lstrip('-').isdigit() else None for v in vals]
+        return time.time(), vals
+
+
+    def run(self):
+        while True:
+            cmd_lst = [self.cfg.ADB_PROC, '-s', self.cfg.DEVICE_ID, 'shell', 'su',
+                       '-c', "'%s'" % self._script()]
+            with self.cv:
+                while self.is_paused and not self.is_stopped:
+                    self.cv.wait()
+                if self.is_stopped:
+                    return
+                try:
+                    self.proc = subprocess.Popen(cmd_lst, stdout=subprocess.PIPE,
+                                                 stderr=subprocess.STDOUT, close_fds=True)
+                except OSError:
+                    self.proc = None
+            proc = self.proc
+            if proc is not None:
+                for line in iter(proc.stdout.readline, ''):
+                    sample = self._parse(line)
+                    if sample is not None:
+                        with self.lock:
+                            self.samples.append(sample)
+                proc.wait()
+
+            # Stream is gone (e.g. device rebooting): retry
+            with self.cv:
+                if self.is_stopped or self.is_paused:
+                    continue
+            self.n_restarts += 1
+            time.sleep(2)
+
+
+    def _kill(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.kill()
+
+
+    def pause(self):
+        """ Stop streaming until resume(), e.g. during a glitch round.
+        """
+        with self.cv:
+            self.is_paused = True
+            self._kill()
+
+
+    def resume(self):
+        with self.cv:
+            self.is_paused = False
+            self.cv.notify_all()
+
+
+    def stop(self):
+        with self.cv:
+            self.is_stopped = True
+            self._kill()
+            self.cv.notify_all()
+
+
+    def latest(self, max_age=config.THERMAL_MAX_AGE):
+        """ @returns: the latest temperature, or None if it is older than
+                      <max_age> secs.
+        """
+        with self.lock:
+            if not self.samples:
+                return None
+            t, vals = self.samples[-1]
+        if time.time() - t > max_age or not vals[0]:
+            return None
+        return vals[0]
+
+
+    def window(self, t_start, t_end=None):
+        """ @returns: [(host time, [values])] sampled in [t_start, t_end].
+        """
+        t_end = time.time() if t_end is None else t_end
+        with self.lock:
+            return [s for s in self.samples if t_start <= s[0] <= t_end]
+
+
+    def encode_window(self, t_start, t_end=None):
+        """ Text form of a window, as stored alongside the iteration results:
+                <time>,<temp>,<node 0>,...;<time>,...
+        """
+        return ';'.join(['%.3f,%s' % (t, ','.join(['' if v is None else str(v) for v in vals]))
+                         for t, vals in self.window(t_start, t_end)])
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import functools
+import threading
+import numpy as np
+from contextlib import contextmanager
+
+# local
+import tracing
+
+
+# =============================================================================
+# Per-phase timing of the harness
+#
+# Phases nest: a phase entered while another one is running is recorded under
+# its path, e.g. "round/temperature" or "reboot/prologue/env_check". Every
+# ROUND phase (one do_glitch_batch) also keeps its own record of sub-phase
+# durations and number of results, so that slow rounds can be told apart from
+# slow phases. Phases are also traced as spans (see tracing.py).
+
+ROUND = 'round'
+
+PERCENTILES = [50, 90, 99]
+
+
+class PhaseTimer(object):
+    """ Wall-clock durations of the phases of one device.
+    """
+    def __init__(self, name=''):
+        self.name = name
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.durations = {}
+        self.rounds = []
+        self.n_results = 0
+        self.t_start = time.time()
+        self.t_end = self.t_start
+
+
+    def _stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+            self.local.round = None
+        return self.local.stack
+
+
+    @contextmanager
+    def phase(self, name):
+        """ Time the enclosed block as phase <name>.
+        """
+        stack = self._stack()
+        stack.append(name)
+        path = '/'.join(stack)
+        if path == ROUND:
+            self.local.round = {'t': time.time(), 'n': 0, 'phases': {}}
+        t_start = time.time()
+        try:
+            with tracing.span(name, 'phase'):
+                yield
+        finally:
+            secs = time.time() - t_start
+            stack.pop()
+            with self.lock:
+                self.durations.setdefault(path, []).append(secs)
+                self.t_end = time.time()
+                rnd = self.local.round
+                if path == ROUND:
+                    rnd['secs'] = secs
+                    self.rounds.append(rnd)
+                    self.local.round = None
+                elif rnd is not None and stack and stack[0] == ROUND:
+                    sub = path[len(ROUND) + 1:]
+                    rnd['phases'][sub] = rnd['phases'].get(sub, 0) + secs
+
+
+    def add_results(self, n):
+        """ Count <n> results towards the current round.
+        """
+        self._stack()
+        with self.lock:
+            self.n_results += n
+            if self.local.round is not None:
+                self.local.round['n'] += n
+
+
+    def wall(self):
+        return max(self.t_end - self.t_start, 1e-6)
+
+
+    def summary(self):
+        """ @returns: [(phase, n, total, mean, [percentiles], max)] sorted by
+                      phase path.
+        """
+        out = []
+        with self.lock:
+            for path in sorted(self.durations):
+                d = np.array(self.durations[path])
+                out.append((path, len(d), d.sum(), d.mean(),
+                            list(np.percentile(d, PERCENTILES)), d.max()))
+        return out
+
+
+    def iterations_per_hour(self):
+        return self.n_results * 3600. / self.wall()
+
+
+    def report(self):
+        """ Print the per-phase breakdown and the throughput.
+        """
+        wall = self.wall()
+        print '\n[+] Timing%s: %.0fs wall, %d rounds, %d results => %.0f iterations/hour' % \
+            (' (%s)' % self.name if self.name else '', wall, len(self.rounds),
+             self.n_results, self.iterations_per_hour())
+        print '[-]   %-34s %6s %9s %6s %8s %s %8s' % \
+            ('phase', 'n', 'total', 'share', 'mean',
+             ' '.join(['%8s' % ('p%d' % p) for p in PERCENTILES]), 'max')
+        for path, n, total, mean, pcts, mx in self.summary():
+            print '[-]   %-34s %6d %8.1fs %5.1f%% %7.2fs %s %7.2fs' % \
+                ('  ' * path.count('/') + path.split('/')[-1], n, total,
+                 100. * total / wall, mean, ' '.join(['%7.2fs' % p for p in pcts]), mx)
+
+
+    def save(self, fn):
+        """ Dump the phase durations and round records as JSON.
+        """
+        with self.lock:
+            data = {'name': self.name,
+                    't_start': self.t_start,
+                    't_end': self.t_end,
+                    'n_results': self.n_results,
+                    'durations': self.durations,
+                    'rounds': self.rounds}
+        with open(fn + '.tmp', 'w') as fh:
+            json.dump(data, fh)
+        os.rename(fn + '.tmp', fn)
+
+
+    @classmethod
+    def merge(cls, timers, name=''):
+        """ Campaign-level timer combining the timers of several devices.
+        """
+        out = cls(name)
+        out.t_start = min([t.t_start for t in timers])
+        out.t_end = max([t.t_end for t in timers])
+        for t in timers:
+            with t.lock:
+                for path, d in t.durations.iteritems():
+                    out.durations.setdefault(path, []).extend(d)
+                out.rounds.extend(t.rounds)
+                out.n_results += t.n_results
+        return out
+
+
+
+def timed(name):
+    """ Decorator timing a method of an object holding a PhaseTimer in
+        <self.timer> as phase <name>.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with self.timer.phase(name):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
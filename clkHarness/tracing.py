@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+
+# =============================================================================
+# Chrome trace-event export
+#
+# When enabled, every span (harness phases, adb round trips, process launches,
+# retry sleeps) is written as a complete ("X") event of the Chrome trace-event
+# JSON array format, one event per line, as soon as it ends:
+#
+#   [
+#   {"name": "adb", "cat": "adb", "ph": "X", "ts": <us>, "dur": <us>,
+#    "pid": ..., "tid": ..., "args": {"cmd": ..., "is_timeout": false}},
+#   ...
+#
+# Spans of a thread nest by time, so adb calls show up under the round and
+# task spans they were made from. The file can be loaded as is in
+# chrome://tracing or Perfetto, even if the harness died before closing it.
+# Tracing is off by default, and spans then cost a function call.
+
+class Tracer(object):
+    """ Stream trace events of this process to <fn>.
+    """
+    def __init__(self, fn):
+        self.fn = fn
+        self.fh = open(fn, 'w')
+        self.fh.write('[\n')
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.tids = set()
+        self.n_events = 0
+
+
+    def _write(self, event):
+        self.fh.write(json.dumps(event) + ',\n')
+        self.n_events += 1
+
+
+    def complete(self, name, cat, t_start, t_end, args):
+        tid = threading.current_thread().ident
+        with self.lock:
+            if self.fh is None:
+                return
+            if tid not in self.tids:
+                self.tids.add(tid)
+                self._write({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                             'args': {'name': threading.current_thread().name}})
+            self._write({'name': name, 'cat': cat, 'ph': 'X', 'pid': self.pid, 'tid': tid,
+                         'ts': int(t_start * 1e6), 'dur': int((t_end - t_start) * 1e6),
+                         'args': args})
+            self.fh.flush()
+
+
+    def close(self):
+        with self.lock:
+            if self.fh is None:
+                return
+            self.fh.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': self.pid,
+                                      'args': {'name': 'clkHarness'}}) + '\n]\n')
+            self.fh.close()
+            self.fh = None
+
+
+
+_tracer = None
+
+
+def enable(fn):
+    """ Start writing trace events to <fn>.
+    """
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = Tracer(fn)
+    atexit.register(_tracer.close)
+    print '[+] Tracing to %s' % fn
+
+
+def close():
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        print '[+] Trace: %d events in %s' % (_tracer.n_events, _tracer.fn)
+        _tracer = None
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+@contextmanager
+def span(name, cat='harness', **args):
+    """ Trace the enclosed block. The <args> dict is yielded so that results
+        (status, timeout, retries, ...) can be added to the event.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield args
+        return
+    t_start = time.time()
+    try:
+        yield args
+    finally:
+        tracer.complete(name, cat, t_start, time.time(), args)
+
+
+def sleep(secs, reason='retry'):
+    """ time.sleep() that shows up in the trace.
+    """
+    with span('sleep', 'sleep', reason=reason, secs=secs):
+        time.sleep(secs)
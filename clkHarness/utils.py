@@ -21,6 +21,17 @@ def iqr_mean(n, percentile_lo=25, percentile_hi=75):
     return np.mean(nn)
 
 
+def iqr_ci(n, z=1.96):
+    """ IQR mean of the elements in the list, with the half-width of its
+        confidence interval (robust sigma estimated as IQR / 1.349).
+    """
+    n = np.array(n)
+    if len(n) < 2:
+        return iqr_mean(n), np.inf
+    hi, lo = np.percentile(n, [75, 25])
+    return iqr_mean(n), z * (hi - lo) / 1.349 / np.sqrt(len(n))
+
+
 def verbalize_reset(ip='10.211.55.2', port=10001):
     # Create a TCP/IP socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
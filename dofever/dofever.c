@@ -6,6 +6,7 @@
 #include <unistd.h>     // _SC_NPROCESSORS_ONLN
 #include <fcntl.h>      // O_RDONLY
 #include <sys/mman.h>   // PROT_READ
+#include <time.h>       // clock_gettime
 #include "dofever.h"
 
 
@@ -13,6 +14,12 @@
 #define CPU_GLITCH  1
 #define CPU_SLAVE   4
 
+// Resident mode: duty cycle (0-100%) is re-read from a file every period
+#define DUTY_PERIOD_US  100000
+
+static volatile int g_duty = 100;
+static int g_is_resident = 0;
+
 static inline double workload_complex_math_local(void)
 {
   int i, j;
@@ -59,6 +66,8 @@ static inline int benchmark_recursive_branches_6(double seed)
   return workload_recursive_br_6(seed, 3, 00, 11, 22, 33);
 }
 
+void stress_duty_cycle(void);
+
 void stress_test_multi(void *data)
 {
   volatile double ret;
@@ -68,6 +77,11 @@ void stress_test_multi(void *data)
     return;
   sched_yield();
   
+  if (g_is_resident) {
+    stress_duty_cycle();
+    return;
+  }
+  
   while (1) {
     ret = benchmark_complex_math_sled(rand() % 20);
     ret = benchmark_recursive_branches_6(0x600);
@@ -76,9 +90,55 @@ void stress_test_multi(void *data)
 }
 
 
+static inline uint64_t now_us(void)
+{
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return (uint64_t)ts.tv_sec * 1000000 + ts.tv_nsec / 1000;
+}
+
+// Spin for <g_duty>% of each period and sleep for the rest of it
+void stress_duty_cycle(void)
+{
+  volatile int ret;
+  uint64_t t_start, t_busy, t_elapsed;
+  
+  while (1) {
+    t_start = now_us();
+    t_busy = (uint64_t)DUTY_PERIOD_US * g_duty / 100;
+    while (now_us() - t_start < t_busy)
+      ret = benchmark_recursive_branches_6(0x10);
+    t_elapsed = now_us() - t_start;
+    if (t_elapsed < DUTY_PERIOD_US)
+      usleep(DUTY_PERIOD_US - t_elapsed);
+  }
+}
+
+// Keep <g_duty> in sync with the duty cycle file
+void poll_duty_file(const char *fn)
+{
+  FILE *fp;
+  int duty;
+  
+  while (1) {
+    fp = fopen(fn, "r");
+    if (fp) {
+      if (fscanf(fp, "%d", &duty) == 1)
+        g_duty = duty < 0 ? 0 : (duty > 100 ? 100 : duty);
+      fclose(fp);
+    }
+    usleep(DUTY_PERIOD_US);
+  }
+}
+
+
 ///////////////////////////////////////////////////////////////////////////////
 // MAIN
 //
+// Usage: dofever [duty_file]
+//   Without arguments, load all cores flat out until killed. With a duty
+//   cycle file, stay resident and load the cores at the duty cycle (0-100)
+//   last written to it, so that a controller can regulate the temperature.
 
 int main(int argc, char** argv)
 {
@@ -88,6 +148,11 @@ int main(int argc, char** argv)
   int s2=2, s3=3, s5=5, s6=6, s7=7;
   void *func;
   
+  if (argc > 1) {
+    g_is_resident = 1;
+    g_duty = 0;
+  }
+  
   // Pin main thread to CPU 0
   setCurrentThreadAffinityMask(CPU_MAIN);
   sched_yield();
@@ -104,6 +169,10 @@ int main(int argc, char** argv)
   pthread_create(&t8, NULL, func, &s6);
   pthread_create(&t9, NULL, func, &s7);
   pthread_create(&t10, NULL, func, &c6);
+  
+  if (g_is_resident)
+    poll_duty_file(argv[1]);
+  
   pthread_join(t1, NULL);
   pthread_join(t2, NULL);
   pthread_join(t3, NULL);
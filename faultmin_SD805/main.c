@@ -2,6 +2,7 @@
 #include <linux/module.h>
 #include <linux/kthread.h>
 #include <linux/semaphore.h>
+#include <linux/mutex.h>
 #include <linux/delay.h>
 #include <asm/cacheflush.h>
 
@@ -52,13 +53,33 @@ static int PARAM_temp = 0;
 // Base clamping voltage
 static int PARAM_volt = PARAM_GLITCH_VOLT;
 
-// User-supplied parameters from insmod
-module_param(PARAM_gval, int, 0);
-module_param(PARAM_gdelay, int, 0);
-module_param(PARAM_delaypre, int, 0);
-module_param(PARAM_iter, int, 0);
-module_param(PARAM_temp, int, 0);
-module_param(PARAM_volt, int, 0);
+// Batch mode: lists of up to MAX_BATCH (gval, gdelay, delaypre) tuples to run
+// one after the other in a single load. Lists left empty take the scalar
+// param. Only the first tuple is preceded by dummy rounds.
+#define MAX_BATCH             32
+static int PARAM_gvals[MAX_BATCH];
+static int PARAM_gdelays[MAX_BATCH];
+static int PARAM_delaypres[MAX_BATCH];
+static int n_gvals = 0;
+static int n_gdelays = 0;
+static int n_delaypres = 0;
+
+// Stay loaded after init and run one glitching exercise per write to
+// /sys/module/<name>/parameters/PARAM_trigger (resident mode)
+static int PARAM_resident = 0;
+
+// User-supplied parameters from insmod. In resident mode they can be updated
+// through /sys/module/<name>/parameters/ between two triggered runs.
+module_param(PARAM_gval, int, 0644);
+module_param(PARAM_gdelay, int, 0644);
+module_param(PARAM_delaypre, int, 0644);
+module_param(PARAM_iter, int, 0644);
+module_param(PARAM_temp, int, 0644);
+module_param(PARAM_volt, int, 0644);
+module_param(PARAM_resident, int, 0444);
+module_param_array(PARAM_gvals, int, &n_gvals, 0644);
+module_param_array(PARAM_gdelays, int, &n_gdelays, 0644);
+module_param_array(PARAM_delaypres, int, &n_delaypres, 0644);
 
 
 ///////////////////////////////////////////////////////////////////////////////
@@ -497,9 +518,11 @@ static int thread_main_init_glitch(void *data)
 //
 // Schedule the main coordination thread to run on CPU0 so that we can have the
 // glitching and slave thread on the other two cores. This reduces the chance of
-// our coordination thread being glitched.
+// our coordination thread being glitched. Iterations below <i_start> are
+// skipped, so that only the first tuple of a batch runs the dummy rounds.
 //
-static int do_cross_glitch(void *workload_func)
+static int do_cross_glitch(void *workload_func, int gval, int gdelay,
+                           int delaypre, u32 i_start)
 {
   u32 i;
   glitch_params_t *glitch_params = NULL;
@@ -522,15 +545,15 @@ static int do_cross_glitch(void *workload_func)
   
   glitch_params->v = PARAM_volt;
   glitch_params->fl = GLITCH_FREQ_SAFE;
-  glitch_params->fh = PARAM_gval;
-  glitch_params->d1 = PARAM_gdelay;
-  glitch_params->d0 = PARAM_delaypre;
+  glitch_params->fh = gval;
+  glitch_params->d1 = gdelay;
+  glitch_params->d0 = delaypre;
   glitch_params->workload = workload_func;
   
   memcpy(dummy_glitch_params, glitch_params, sizeof(glitch_params_t));
   dummy_glitch_params->fh = DUMMY_GLITCH_FREQ;
   
-  for (i = 0; i < PARAM_iter; i++) {
+  for (i = i_start; i < PARAM_iter; i++) {
     
     active_glitch_params = (i < MIN_GLITCH_ITER) ?
       dummy_glitch_params : glitch_params;
@@ -554,9 +577,6 @@ static int do_cross_glitch(void *workload_func)
       msleep(1000);
   }
   
-  // Sleep a while to let system catch up on all pending tasks
-  msleep(2000);
-  
   if (glitch_params)
     kzfree(glitch_params);
   if (dummy_glitch_params)
@@ -564,6 +584,83 @@ static int do_cross_glitch(void *workload_func)
   return 0;
 }
 
+//
+// Run the glitching exercise for every tuple of the batch lists, or for the
+// scalar params if the lists are empty. The ITER records echo the params of
+// their tuple, so that the harness can tell the results apart.
+//
+static int do_glitch_batch(void *workload_func)
+{
+  int k;
+  int n = max(n_gvals, max(n_gdelays, n_delaypres));
+  
+  if ((n_gvals && n_gvals != n) || (n_gdelays && n_gdelays != n) ||
+      (n_delaypres && n_delaypres != n)) {
+    DBG("[do_glitch_batch]: Batch lists differ in length.\n");
+    return -1;
+  }
+  
+  if (n == 0) {
+    if (do_cross_glitch(workload_func, PARAM_gval, PARAM_gdelay,
+                        PARAM_delaypre, 0))
+      return -1;
+  }
+  
+  for (k = 0; k < n; k++) {
+    if (do_cross_glitch(workload_func,
+                        n_gvals ? PARAM_gvals[k] : PARAM_gval,
+                        n_gdelays ? PARAM_gdelays[k] : PARAM_gdelay,
+                        n_delaypres ? PARAM_delaypres[k] : PARAM_delaypre,
+                        k ? MIN_GLITCH_ITER : 0))
+      return -1;
+    if (k < n - 1)
+      msleep(1000);
+  }
+  
+  // Sleep a while to let system catch up on all pending tasks
+  msleep(2000);
+  return 0;
+}
+
+
+///////////////////////////////////////////////////////////////////////////////
+// Resident mode control
+
+// Number of triggered runs so far (read back through PARAM_trigger)
+static int g_n_runs = 0;
+
+static DEFINE_MUTEX(run_lock);
+
+//
+// Writing anything to PARAM_trigger runs one glitching exercise with the
+// current parameters. The write returns once the run is over, like insmod
+// would, and the run ends with the same END marker as an unload. sysfs holds
+// the module parameter lock during the write, so the other PARAM_* cannot
+// change under a run.
+//
+static int param_set_trigger(const char *val, const struct kernel_param *kp)
+{
+  int ret;
+  
+  if (!PARAM_resident)
+    return -EPERM;
+  
+  mutex_lock(&run_lock);
+  ret = do_glitch_batch(thread_slave_workload);
+  g_n_runs++;
+  DBG("------[ END ]------\n");
+  mutex_unlock(&run_lock);
+  
+  return ret ? -EIO : 0;
+}
+
+static const struct kernel_param_ops trigger_ops = {
+  .set = param_set_trigger,
+  .get = param_get_int,
+};
+
+module_param_cb(PARAM_trigger, &trigger_ops, &g_n_runs, 0644);
+
 
 ///////////////////////////////////////////////////////////////////////////////
 // Module initialization
@@ -583,9 +680,14 @@ int init_module(void)
     goto _EXIT;
   memcpy(g_workload.va, code__flip_endianness, sizeof(code__flip_endianness));
 
+  // Keep the buffers and wait for PARAM_trigger
+  if (PARAM_resident) {
+    DBG("[init_module]: Resident. Trigger runs through PARAM_trigger.\n");
+    return 0;
+  }
   
   // Perform glitching exercise
-  if (do_cross_glitch(thread_slave_workload))
+  if (do_glitch_batch(thread_slave_workload))
     goto _EXIT;
 
 _EXIT:
@@ -1,5 +1,7 @@
+import time
 import hashlib
 import signal
+import multiprocessing
 from binascii import hexlify, unhexlify
 
 from sage.all import ecm
@@ -135,6 +137,91 @@ def factorize_modprime(n, t_timeout=60):
     return factors
 
 
+def _factorize_job(n, conn):
+    """ Worker process for factorize_modprime_batch().
+    """
+    factors = None
+    try:
+        factors = map(long, ecm.factor(n))
+    except Exception:
+        pass
+    conn.send(factors)
+    conn.close()
+
+
+def factorize_modprime_batch(moduli, t_timeout=60, nb_procs=None):
+    """ Factorize many candidate moduli n in parallel.
+    
+    Each candidate is factorized in its own process, with its own wall-clock
+    budget of <t_timeout> secs, after which the process is killed. Unlike
+    factorize_modprime(), this does not rely on SIGALRM and can be used from
+    any thread. Each process reports back over its own pipe, so that killing
+    one cannot take the results of the others down with it.
+    
+    @param moduli:      list of moduli to be factorized
+    @param t_timeout:   timeout in secs, per modulus
+    @param nb_procs:    number of worker processes (default: number of cores)
+    
+    @returns generator of (n, factors) in order of completion. <factors> is
+             None if no success.
+    """
+    nb_procs = nb_procs or multiprocessing.cpu_count()
+    pending = list(moduli)[::-1]
+    running = []
+    
+    while pending or running:
+        while pending and len(running) < nb_procs:
+            n = pending.pop()
+            conn, child_conn = multiprocessing.Pipe(False)
+            p = multiprocessing.Process(target=_factorize_job, args=(n, child_conn))
+            p.daemon = True
+            p.start()
+            child_conn.close()
+            running.append((p, conn, n, time.time() + t_timeout))
+        
+        # Collect finished jobs (a job that died reads as EOF), kill jobs
+        # that ran out of time
+        now = time.time()
+        finished = []
+        for job in running:
+            p, conn, n, deadline = job
+            if conn.poll():
+                try:
+                    factors = conn.recv()
+                except EOFError:
+                    factors = None
+            elif now > deadline:
+                p.terminate()
+                factors = None
+            else:
+                continue
+            p.join()
+            conn.close()
+            finished.append((job, n, factors))
+        
+        if not finished:
+            time.sleep(0.1)
+        for job, n, factors in finished:
+            running.remove(job)
+            yield n, factors
+
+
+def find_usable_modprimes(moduli, exp_pub=0x10001, t_timeout=60, nb_procs=None):
+    """ Triage candidate moduli collected from experiments: keep those that
+        can be factorized and for which a private exponent can be derived.
+    
+    @returns generator of (n, factors, dprime) in order of completion.
+    """
+    for n, factors in factorize_modprime_batch(moduli, t_timeout, nb_procs):
+        if factors is None:
+            continue
+        try:
+            dprime = derive_private_exp(factors, exp_pub)
+        except Exception:
+            continue
+        yield n, factors, dprime
+
+
 def ext_euclid(A, B, C):
     """ Extended Euclidean Algorithm.
     Useful in situations where:   B = C mod A.